@@ -0,0 +1,65 @@
+"""雙螺桿擠壓模擬器共用運算核心（不依賴 Streamlit）。
+
+子模組在第一次取用其中的名稱時才匯入，`import extrusion_core` 本身不會載入
+pandas 或 multiprocessing，命令列（python -m extrusion_core）可以快速啟動。
+"""
+
+import importlib
+
+# 公開名稱 → 所在子模組
+_EXPORTS = {
+    "MODELS": "models",
+    "MODEL_VERSIONS": "models",
+    "ResultCache": "cache",
+    "get_cache": "cache",
+    "make_key": "cache",
+    "MATERIALS": "materials",
+    "MATERIAL_IDS": "materials",
+    "MATERIAL_TABLES": "materials",
+    "FLAVOR_LABELS": "materials",
+    "blend_vector": "materials",
+    "get_flavor_profiles": "materials",
+    "simulate_v2": "models",
+    "simulate_v3": "models",
+    "simulate_v35": "models",
+    "simulate_v35s": "models",
+    "estimate_energy": "models",
+    "simulate_blended_batch": "batch",
+    "simulate_blended_frame": "batch",
+    "simulate_columnar": "columnar",
+    "ColumnarResult": "columnar",
+    "estimate_energy_batch": "models",
+    "simulate_with_energy_batch": "models",
+    "simulate_v35_batch": "models",
+    "simulate_v35s_batch": "models",
+    "default_workers": "parallel",
+    "run_batch": "parallel",
+    "iter_simulated_chunks": "streaming",
+    "stream_simulation_csv": "streaming",
+    "full_factorial": "sweep",
+    "latin_hypercube": "sweep",
+    "optimize_recipe": "optimize",
+    "monte_carlo": "uncertainty",
+    "simulate_barrel": "barrel",
+    "simulate_barrel_batch": "barrel",
+    "local_sensitivity": "sensitivity",
+    "sobol_indices": "sensitivity",
+    "NeighborIndex": "neighbors",
+    "get_history_index": "neighbors",
+    "SurrogateTable": "surrogate",
+    "get_surrogate": "surrogate",
+}
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{module}", __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
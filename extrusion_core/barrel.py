@@ -0,0 +1,197 @@
+"""軸向分區擠壓模型（選用）：把螺桿長度切成 N 個區段，熔體狀態（溫度、水分、黏度、
+滯留時間、比機械能）從進料口逐段推進到模口，得到沿筒身的分布與模口出口結果。
+
+v3.5 的 simulate() 中螺桿幾何、喂料與模口只以單一公式出現（例如
+壓力 = 0.1 × 轉速 × 水含量 ÷ 螺桿直徑）；本模型另外描述：
+
+- 輸送段（前 1 − METERING_FRACTION）部分填充，只有筒壁加熱；熔體高於 100 °C 時
+  水氣經進料口散失
+- 計量 / 捏合段完全填充，另有黏滯發熱（冪律流體，稠度隨溫度、水分、油脂下降）
+- 模口壓力由冪律流體通過圓孔的壓降決定，計量段內依各段黏度累積分配
+- 出模閃蒸：過熱的水分瞬間汽化，決定出口水分與膨發
+
+各區段沿軸向只能依序推進，每一步對所有設定整批向量化；與區段位置有關、不依賴
+熔體狀態的量（填充度、滯留時間、換熱比例）一次算成 設定數 × 區段數 的陣列。
+1,000 組設定 × 200 區段約數十毫秒。係數為示意用的代表值，版本見 BARREL_VERSION。
+"""
+
+import numpy as np
+
+from .batch import blend_sums, blend_weights, py_round
+from .materials import V35_EXPANSION
+from .metrics import timed
+
+BARREL_VERSION = "barrel:1"
+DEFAULT_ZONES = 100
+FEED_TEMP = 25.0  # 進料溫度（°C）
+METERING_FRACTION = 0.3  # 螺桿末段完全填充的計量 / 捏合段比例
+FREE_AREA = 0.4  # 螺槽自由截面積 ÷ 螺桿截面積
+CHANNEL_DEPTH = 0.15  # 螺槽深度 ÷ 螺桿直徑
+DENSITY = 1200.0  # 熔體密度（kg/m³）
+HEAT_CAPACITY = 2000.0  # 比熱（J/kg·K）
+LATENT_HEAT = 2.26e6  # 水的汽化熱（J/kg）
+HEAT_TIME = 5.0  # 螺桿直徑 30 mm 時熔體趨近筒溫的時間常數（秒），與直徑成正比
+CONSISTENCY = 10_000.0  # 140 °C、水 15%、油 5% 時的稠度係數（Pa·sⁿ）
+FLOW_INDEX = 0.35  # 冪律指數
+VENT_RATE = 0.002  # 輸送段熔體每高於 100 °C 一度，每秒散失的水分（百分點）
+DIE_LENGTH_RATIO = 2.0  # 模口長度 ÷ 孔徑
+FLASH_EXPANSION = 10.0  # 出模閃蒸比例對膨發的影響（預設條件下約等於原料表的膨發值）
+CHUNK_CELLS = 2_000_000  # keep_profiles=False 時每塊的 設定數 × 區段數 上限
+
+PROFILE_COLUMNS = ("熔體溫度 (°C)", "壓力 (bar)", "水分 (%)", "黏度 (Pa·s)", "填充度", "滯留時間 (s)", "比機械能 (kJ/kg)")
+EXIT_COLUMNS = ("模口熔體溫度 (°C)", "模口壓力 (bar)", "出口水分 (%)", "比機械能 (kJ/kg)", "滯留時間 (s)", "膨發指數", "體積密度")
+
+
+class BarrelResult:
+    """分區模型結果。fractions 為各區段出口的相對位置（0–1，長度 N）；
+    exit 為 {EXIT_COLUMNS: 長度 B 的陣列}；profiles 為 {PROFILE_COLUMNS: B×N 陣列}，
+    keep_profiles=False 時為 None。"""
+
+    def __init__(self, fractions, screw_length, profiles, exit):
+        self.fractions = fractions
+        self.screw_length = screw_length
+        self.profiles = profiles
+        self.exit = exit
+
+    @property
+    def size(self):
+        return len(next(iter(self.exit.values())))
+
+    @property
+    def zones(self):
+        return len(self.fractions)
+
+    def profile_frame(self, i=0):
+        """第 i 組設定的軸向分布（DataFrame，索引為離進料口的距離 mm）。"""
+        import pandas as pd
+
+        position = pd.Index(self.fractions * self.screw_length[i], name="位置 (mm)")
+        return pd.DataFrame({k: v[i] for k, v in self.profiles.items()}, index=position)
+
+    def exit_frame(self):
+        import pandas as pd
+
+        return pd.DataFrame(self.exit)
+
+
+def _consistency(temp, moisture, fat):
+    # 溫度、水分、油脂越高越稀；指數截斷避免進料端低溫時溢位
+    exponent = -0.02 * (temp - 140) - 0.1 * (moisture - 15) - 0.04 * (fat - 5)
+    return CONSISTENCY * np.exp(np.clip(exponent, -10.0, 5.0))
+
+
+def simulate_barrel_batch(temp, rpm, moisture, fat, screw_diameter, screw_length, feed_rate, die_diameter, ratios,
+                          zones=DEFAULT_ZONES, keep_profiles=True):
+    """分區模型的整批版本，參數同 simulate_v35_batch（單位同 App 滑桿）。
+
+    各製程參數為純量或長度 B 的陣列，ratios 為 B×6 或 1×6。keep_profiles=False 時
+    只保留模口出口結果，並以每塊 CHUNK_CELLS 個格點分塊計算，記憶體用量與設定數
+    無關（大量設定的掃描用）。
+    """
+    _, weights = blend_weights(ratios)
+    values = [np.asarray(v, dtype=float) for v in (temp, rpm, moisture, fat, screw_diameter, screw_length,
+                                                    feed_rate, die_diameter)]
+    shape = np.broadcast_shapes(weights.shape[:1], *(v.shape for v in values))
+    if len(shape) != 1:
+        raise ValueError("分區模型的參數需為純量或一維陣列")
+    temp, rpm, moisture, fat, diameter, length, feed, die = (np.broadcast_to(v, shape) for v in values)
+    zones = int(zones)
+    if zones < 1:
+        raise ValueError("區段數需至少為 1")
+    args = (temp, rpm, moisture, fat, diameter / 1000, length / 1000, feed / 3600, die / 1000)
+    with timed("barrel.simulate", rows=shape[0]):
+        if keep_profiles:
+            return _simulate(*args, weights, zones, True)
+        step = max(CHUNK_CELLS // zones, 1)
+        parts = []
+        for lo in range(0, shape[0], step):
+            block = slice(lo, lo + step)
+            parts.append(_simulate(*(a[block] for a in args), weights[block] if len(weights) > 1 else weights,
+                                   zones, False))
+        exit = {k: np.concatenate([r.exit[k] for r in parts]) for k in EXIT_COLUMNS}
+        return BarrelResult(parts[0].fractions, length, None, exit)
+
+
+def _simulate(temp, rpm, moisture, fat, diameter, length, feed, die, weights, zones, keep_profiles):
+    # 以下長度為 m、喂料為 kg/s
+    fractions = np.arange(1, zones + 1) / zones
+    metering = fractions > 1 - METERING_FRACTION + 1e-12
+    area = FREE_AREA * np.pi * diameter ** 2 / 4
+    # 每轉推進一個導程（≈ 螺桿直徑）時的最大輸送量
+    capacity = DENSITY * area * diameter * rpm / 60
+    shear = np.pi * rpm / (60 * CHANNEL_DEPTH)
+    zone_volume = area * length / zones
+
+    # 只與位置有關的量：設定數 × 區段數
+    fill = np.where(metering, 1.0, np.clip(feed / capacity, 0.0, 1.0)[:, None])
+    residence = DENSITY * zone_volume[:, None] * fill / feed[:, None]
+    exchange = 1 - np.exp(-residence / (HEAT_TIME * diameter / 0.03)[:, None])
+    # 黏滯發熱（J/kg）= 稠度 × shear^(n+1) × 滯留時間 ÷ 密度，只發生在填充段
+    dissipation = np.where(metering, (shear ** (1 + FLOW_INDEX))[:, None] * residence / DENSITY, 0.0)
+
+    n = temp.shape[0]
+    melt = np.full(n, FEED_TEMP)
+    water = moisture.astype(float).copy()
+    sme = np.zeros(n)
+    profile = {k: np.empty((n, zones)) for k in ("temp", "water", "consistency", "sme")} if keep_profiles else None
+    pressure_weight = np.zeros(n)  # 計量段各區段稠度的累計，用來分配模口壓力
+    for i in range(zones):
+        k = _consistency(melt, water, fat)
+        if metering[i]:
+            heat = k * dissipation[:, i]
+            melt = melt + heat / HEAT_CAPACITY
+            sme = sme + heat
+            pressure_weight = pressure_weight + k
+        else:
+            # 部分填充段接觸大氣，高於 100 °C 時水氣經進料口散失
+            water = np.maximum(water - VENT_RATE * np.maximum(melt - 100, 0) * residence[:, i], 0.0)
+        melt = melt + (temp - melt) * exchange[:, i]
+        if keep_profiles:
+            profile["temp"][:, i] = melt
+            profile["water"][:, i] = water
+            profile["consistency"][:, i] = k
+            profile["sme"][:, i] = sme
+
+    # 模口：冪律流體通過圓孔，壁面剪切率 (3n+1)/(4n) × 32Q / (πd³)
+    k_die = _consistency(melt, water, fat)
+    wall_shear = (3 * FLOW_INDEX + 1) / (4 * FLOW_INDEX) * 32 * (feed / DENSITY) / (np.pi * die ** 3)
+    die_pressure = 4 * DIE_LENGTH_RATIO * k_die * wall_shear ** FLOW_INDEX
+    # 出模閃蒸：過熱量汽化的水分比例（不超過熔體含水量）
+    flash = np.clip(HEAT_CAPACITY * (melt - 100) / LATENT_HEAT, 0.0, water / 100)
+    exit_water = (water - 100 * flash) / (1 - flash)
+    expansion = blend_sums(weights, V35_EXPANSION)[0] * (0.6 + FLASH_EXPANSION * flash)
+    exit = {
+        "模口熔體溫度 (°C)": py_round(melt, 1),
+        "模口壓力 (bar)": py_round(die_pressure / 1e5, 2),
+        "出口水分 (%)": py_round(exit_water, 2),
+        "比機械能 (kJ/kg)": py_round(sme / 1000, 1),
+        "滯留時間 (s)": py_round(residence.sum(axis=1), 1),
+        "膨發指數": py_round(np.broadcast_to(expansion, melt.shape), 2),
+    }
+    exit["體積密度"] = py_round(0.2 + 0.005 * (100 - exit["膨發指數"] * 50), 2)
+
+    profiles = None
+    if keep_profiles:
+        # 壓力：輸送段為 0，計量段依各區段稠度（越黏建壓越快）累積到模口壓力
+        weight = np.where(metering, profile["consistency"], 0.0)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            share = np.cumsum(weight, axis=1) / pressure_weight[:, None]
+        profiles = {
+            "熔體溫度 (°C)": profile["temp"],
+            "壓力 (bar)": np.nan_to_num(share) * (die_pressure / 1e5)[:, None],
+            "水分 (%)": profile["water"],
+            "黏度 (Pa·s)": profile["consistency"] * shear[:, None] ** (FLOW_INDEX - 1),
+            "填充度": fill,
+            "滯留時間 (s)": np.cumsum(residence, axis=1),
+            "比機械能 (kJ/kg)": profile["sme"] / 1000,
+        }
+    return BarrelResult(fractions, length * 1000, profiles, exit)
+
+
+def simulate_barrel(temp, rpm, moisture, fat, screw_diameter, screw_length, feed_rate, die_diameter, blend_dict,
+                    zones=DEFAULT_ZONES):
+    """單一設定的分區模擬，參數順序同 simulate_v35；回傳 BarrelResult（1 組設定）。"""
+    from .materials import blend_vector
+
+    return simulate_barrel_batch(temp, rpm, moisture, fat, screw_diameter, screw_length, feed_rate, die_diameter,
+                                 blend_vector(blend_dict), zones=zones)
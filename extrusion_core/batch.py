@@ -0,0 +1,193 @@
+import numpy as np
+
+from .materials import CRISP, EXPANSION, FLAVORS, MATERIALS
+from .metrics import timed
+
+RESULT_COLUMNS = ("膨發指數", "酥脆度", "水活性", "黏性", "外觀", "色澤", "風味描述")
+
+
+def py_round(values, ndigits=2):
+    """與內建 round() 結果一致的向量化四捨五入。
+
+    np.round 先乘 10**ndigits 再取整，遇到 2.675 這類剛好落在進位邊界的值
+    會與 round() 不同。邊界值以 Veltkamp 分割把 x * 10**ndigits 拆成兩個可
+    精確表示的乘積，精確判斷它在 k + 0.5 的哪一側，再依 round() 的四捨六入
+    五成雙決定進位方向。
+    """
+    values = np.asarray(values, dtype=float)
+    shape = values.shape
+    # 純量也以 1 維陣列計算，才能原地運算與遮罩賦值
+    values = values.reshape(-1) if values.ndim == 0 else values
+    scale = float(10 ** ndigits)
+    # 與 np.round 相同：rint(x * 10**n) / 10**n；其餘運算原地進行以減少暫存陣列
+    scaled = values * scale
+    out = np.rint(scaled)
+    np.subtract(scaled, out, out=scaled)
+    np.abs(scaled, out=scaled)
+    scaled -= 0.5
+    np.abs(scaled, out=scaled)
+    edge = scaled < 1e-6
+    out /= scale
+    if not edge.any():
+        return out.reshape(shape)
+    x = values[edge]
+    mid = np.floor(x * scale) + 0.5
+    # x = hi + lo，hi、lo 各不超過 27 位有效位元，乘上 10**n（n ≤ 3）皆不捨入
+    t = 134217729.0 * x
+    hi = t - (t - x)
+    lo = x - hi
+    # hi * scale 與 mid 相差不到 1，相減也是精確的，最後一次相加的正負號即為真值的正負號
+    diff = (hi * scale - mid) + lo * scale
+    below = mid - 0.5
+    odd = np.fmod(below, 2) != 0
+    out[edge] = (below + ((diff > 0) | ((diff == 0) & odd))) / scale
+    return out.reshape(shape)
+
+
+def round_if(values, ndigits=2, rounding=True):
+    """rounding 為真時同 py_round，否則只轉成 float 陣列（蒙地卡羅、敏感度分析用）。"""
+    return py_round(values, ndigits) if rounding else np.asarray(values, dtype=float)
+
+
+def blend_weights(ratios):
+    """將 N×6 原料比例正規化為權重；負值與 NaN 視為 0%。
+
+    沒有任何原料的列權重全為 0（同原本逐筆函數對空配方的結果：只剩製程參數的項，
+    風味描述為空）。
+    """
+    ratios = np.atleast_2d(np.asarray(ratios, dtype=float))
+    ratios = np.where(ratios > 0, ratios, 0.0)
+    total = ratios.sum(axis=1)[:, None]
+    return ratios, np.divide(ratios, total, out=np.zeros_like(ratios), where=total > 0)
+
+
+def blend_sums(weights, *tables):
+    """每個原料性質表對權重的加權和（例如混合後的 expansion、crisp）。
+
+    逐欄累加，運算順序與逐筆版本的 for 迴圈相同，結果逐位元一致。
+    """
+    sums = [np.zeros(weights.shape[0]) for _ in tables]
+    for j in range(weights.shape[1]):
+        for i, table in enumerate(tables):
+            sums[i] = sums[i] + table[j] * weights[:, j]
+    return sums
+
+
+def flavor_categories(ratios, weights, flavors=FLAVORS, prefix="綜合風味："):
+    """風味描述的類別編碼：回傳 (每列的代碼, 各代碼的描述字串)。"""
+    # 以「有用到的原料 + 百分比」為鍵，相同組合只組一次字串；
+    # 每種原料的百分比（-1 表示未使用）佔 7 bits，六種原料壓成一個 int64 鍵
+    pct = np.where(ratios > 0, np.trunc(weights * 100), -1).astype(np.int64)
+    shifts = 7 * np.arange(pct.shape[1], dtype=np.int64)
+    _, first, inverse = np.unique(((pct + 1) << shifts).sum(axis=1), return_index=True, return_inverse=True)
+    labels = []
+    for row in pct[first].tolist():
+        parts = [f"{flavors[j]}（{p}%）" for j, p in enumerate(row) if p >= 0]
+        labels.append(prefix + "、".join(parts))
+    return inverse.reshape(-1), labels
+
+
+def flavor_descriptions(ratios, weights, flavors=FLAVORS, prefix="綜合風味："):
+    """每列的風味描述字串，例如「綜合風味：甜香（50%）、穀香（50%）」，原料依 MATERIALS 順序。"""
+    codes, labels = flavor_categories(ratios, weights, flavors, prefix)
+    return np.array(labels, dtype=object)[codes]
+
+
+def table_columns(table, *defaults):
+    """原料表的各性質欄；table 為 None 時用 defaults（模型預設的原料表）。
+
+    table 可為 6×K，或 6×K×S：S 個樣本各自的原料數值（蒙地卡羅用），此時每個
+    性質欄為 6×S，與 blend_sums 搭配得到長度 S 的加權和。
+    """
+    if table is None:
+        return defaults, ()
+    table = np.asarray(table, dtype=float)
+    return tuple(table[:, k] for k in range(len(defaults))), table.shape[2:]
+
+
+def broadcast_outputs(outputs, shape):
+    # 只與原料或部分參數有關的欄位以唯讀廣播檢視補成相同形狀，不複製資料
+    return {k: v if v.shape == shape else np.broadcast_to(v, shape) for k, v in outputs.items()}
+
+
+def simulate_blended_batch(temp, rpm, moisture, fat, ratios, describe=True, table=None, rounding=True):
+    """simulate_blended_formula 的整批版本。
+
+    temp / rpm / moisture / fat 為長度 N 的陣列（或純量），ratios 為 N×6 的原料
+    比例矩陣，欄位順序同 MATERIALS。回傳以 RESULT_COLUMNS 為鍵的欄位陣列，
+    每一列與逐筆呼叫 simulate_blended_formula 的結果相同。製程參數也可以是
+    可與原料列數廣播的多維陣列（例如 P×1 對 M 種配方）；describe=False 時
+    只回傳數值欄位，省略外觀、色澤與風味描述字串。table 見 table_columns；
+    rounding=False 時數值欄位不四捨五入（外觀仍依四捨五入後的膨發指數判斷）。
+    """
+    ratios, weights = blend_weights(ratios)
+    temp, rpm, moisture, fat = (np.asarray(v, dtype=float) for v in (temp, rpm, moisture, fat))
+    columns, samples = table_columns(table, EXPANSION, CRISP)
+    shape = np.broadcast_shapes(weights.shape[:1], temp.shape, rpm.shape, moisture.shape, fat.shape, samples)
+
+    expansion, crisp = blend_sums(weights, *columns)
+    expansion = expansion + (temp - 100) * 0.005 - moisture * 0.01 + fat * 0.01
+    outputs = {
+        "膨發指數": round_if(expansion, rounding=rounding),
+        "酥脆度": round_if(crisp + (rpm - 300) * 0.005 - fat * 0.1 + moisture * 0.05, rounding=rounding),
+        "水活性": round_if(0.6 + moisture * 0.01 - temp * 0.001, rounding=rounding),
+        "黏性": round_if(1 + fat * 0.1 + moisture * 0.1 - rpm * 0.002, rounding=rounding),
+    }
+    if describe:
+        rounded = outputs["膨發指數"] if rounding else py_round(expansion)
+        outputs["外觀"] = np.where(rounded > 2, "膨鬆偏亮", "偏密實").astype(object)
+        outputs["色澤"] = np.where(temp >= 140, "金黃色", "淺黃").astype(object)
+        outputs["風味描述"] = flavor_descriptions(ratios, weights)
+    return broadcast_outputs(outputs, shape)
+
+
+def blend_matrix(df):
+    import pandas as pd
+
+    # 缺少的原料欄位與空白值都視為 0%
+    cols = [df[mat] if mat in df else pd.Series(0.0, index=df.index) for mat in MATERIALS]
+    return np.column_stack([pd.to_numeric(c, errors="coerce").fillna(0).to_numpy(dtype=float) for c in cols])
+
+
+def used_materials(df, used):
+    """df 中有用到的原料欄位（used 為 N×6 的是否使用）。"""
+    # 原料欄位依第一次出現的順序排列，與逐列 dict 組成的 DataFrame 相同
+    present = [j for j, mat in enumerate(MATERIALS) if mat in df and used[:, j].any()]
+    return [MATERIALS[j] for j in sorted(present, key=lambda j: used[:, j].argmax())]
+
+
+def simulate_blended_frame(df, material_columns=None, workers=1):
+    """批次上傳用：輸入含 筒溫/轉速/水含量/油脂含量 與各原料欄位的 DataFrame。
+
+    輸出欄位與原本 iterrows() 迴圈產生的 df_out 相同：模擬結果加上有使用到的
+    原料比例（未使用者為 NaN）。分塊處理時以 material_columns 固定原料欄位，
+    讓每一塊的欄位一致。workers > 1 時以 run_batch 分給多個行程計算。
+    """
+    with timed("batch.simulate", rows=len(df)):
+        return _simulate_blended_frame(df, material_columns, workers)
+
+
+def _simulate_blended_frame(df, material_columns, workers):
+    import pandas as pd
+
+    from .parallel import run_batch
+
+    ratios = blend_matrix(df)
+    results = run_batch(
+        simulate_blended_batch,
+        len(df),
+        workers=workers,
+        temp=df["筒溫"].to_numpy(dtype=float),
+        rpm=df["轉速"].to_numpy(dtype=float),
+        moisture=df["水含量"].to_numpy(dtype=float),
+        fat=df["油脂含量"].to_numpy(dtype=float),
+        ratios=ratios,
+    )
+    out = pd.DataFrame(results, index=df.index)
+    used = ratios > 0
+    if material_columns is None:
+        material_columns = used_materials(df, used)
+    for mat in material_columns:
+        j = MATERIALS.index(mat)
+        out[mat] = df[mat].where(used[:, j]) if mat in df else np.nan
+    return out.reset_index(drop=True)
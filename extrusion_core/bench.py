@@ -0,0 +1,439 @@
+"""效能基準測試：量測各項目的延遲、吞吐量與峰值記憶體，並與先前的結果比較。
+
+run 依序執行各 bench_* 函數（每個函數的說明即該項目量測的內容），結果寫成 JSON；
+compare 與先前存下的基準比較，變慢超過門檻即列為退步（結束代碼 1）。
+
+    python -m extrusion_core.bench run -o bench.json
+    python -m extrusion_core.bench run --sizes 1000 100000 -o quick.json
+    python -m extrusion_core.bench compare baseline.json bench.json --threshold 0.2
+"""
+
+import argparse
+import ast
+import glob
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+from .materials import MATERIALS
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_SIZES = (1_000, 100_000, 1_000_000)
+# 各模型單筆模擬的參數（與 App 滑桿預設值相同）
+SINGLE_ARGS = {
+    "v2": dict(temp=140, rpm=300, moisture=15, fat=5),
+    "v3": dict(temp=140, rpm=300, moisture=15, fat=5, screw_diameter=30, screw_length=1000),
+    "v35": dict(temp=140, rpm=300, moisture=15, fat=5, screw_diameter=30, screw_length=1000,
+                feed_rate=30, die_diameter=5),
+    "v35s": dict(temp=140, rpm=300, moisture=15, fat=5, feed_rate=40),
+}
+SINGLE_BLEND = {"玉米粉": 50, "小麥粉": 30, "高蛋白粉": 20}
+# 批次輸入的亂數範圍（同 App 滑桿範圍）
+INPUT_RANGES = {
+    "temp": (60, 180),
+    "rpm": (100, 600),
+    "moisture": (10, 25),
+    "fat": (0, 15),
+    "screw_diameter": (20, 60),
+    "screw_length": (600, 1600),
+    "feed_rate": (10, 100),
+    "die_diameter": (2, 12),
+}
+# 比較時數值越小越好的欄位
+LOWER_IS_BETTER = ("median_us", "p99_us", "range_median_us", "range_p99_us", "seconds", "build_seconds", "peak_mb",
+                   "parquet_seconds", "arrow_seconds")
+
+
+def _inputs(rows, names, seed=0):
+    rng = np.random.default_rng(seed)
+    columns = {p: rng.integers(lo, hi + 1, rows).astype(float) for p, (lo, hi) in INPUT_RANGES.items() if p in names}
+    ratios = rng.integers(0, 11, (rows, len(MATERIALS))).astype(float) * 10
+    ratios[ratios.sum(axis=1) == 0, 0] = 100
+    return columns, ratios
+
+
+def _peak_mb(call):
+    # tracemalloc 會拖慢執行，記憶體與計時分開量
+    tracemalloc.start()
+    try:
+        call()
+        return tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+    finally:
+        tracemalloc.stop()
+
+
+def bench_single(name, min_seconds=0.3):
+    """單筆模擬延遲：重複呼叫至少 min_seconds 秒，回傳中位數與 p99（微秒）。
+
+    單筆走 models 的純 Python 快速路徑；若退回 1 列的整批計算會慢十倍以上。
+    """
+    from .models import MODELS
+
+    simulate, args = MODELS[name]["simulate"], SINGLE_ARGS[name]
+    simulate(blend_dict=SINGLE_BLEND, **args)
+    times = []
+    end = time.perf_counter() + min_seconds
+    while time.perf_counter() < end or len(times) < 20:
+        t = time.perf_counter()
+        simulate(blend_dict=SINGLE_BLEND, **args)
+        times.append(time.perf_counter() - t)
+    times = np.array(times) * 1e6
+    return {
+        "median_us": float(np.median(times)),
+        "p99_us": float(np.percentile(times, 99)),
+        "ops_per_s": float(1e6 / np.median(times)),
+        "calls": len(times),
+    }
+
+
+def _timed(call, repeat):
+    times = []
+    for _ in range(repeat):
+        t = time.perf_counter()
+        call()
+        times.append(time.perf_counter() - t)
+    return min(times), statistics.median(times)
+
+
+def bench_batch(name, rows, repeat=None):
+    """向量化批次：rows 列亂數輸入，回傳最佳與中位數秒數、每秒列數與峰值記憶體。"""
+    from .models import MODELS
+
+    columns, ratios = _inputs(rows, SINGLE_ARGS[name])
+
+    def call():
+        MODELS[name]["batch"](ratios=ratios, **columns)
+
+    repeat = repeat or (5 if rows <= 100_000 else 2)
+    call()
+    best, median = _timed(call, repeat)
+    return {"seconds": best, "median_seconds": median, "rows_per_s": rows / best, "peak_mb": _peak_mb(call)}
+
+
+def _frame(rows):
+    import pandas as pd
+
+    columns, ratios = _inputs(rows, ("temp", "rpm", "moisture", "fat"))
+    df = pd.DataFrame({"筒溫": columns["temp"], "轉速": columns["rpm"],
+                       "水含量": columns["moisture"], "油脂含量": columns["fat"]})
+    for i, mat in enumerate(MATERIALS):
+        df[mat] = ratios[:, i]
+    return df
+
+
+def bench_frame(rows, repeat=None):
+    """App 批次上傳的 DataFrame 路徑（simulate_blended_frame，單核心）。"""
+    from .batch import simulate_blended_frame
+
+    df = _frame(rows)
+
+    def call():
+        simulate_blended_frame(df)
+
+    repeat = repeat or (3 if rows <= 100_000 else 1)
+    call()
+    best, median = _timed(call, repeat)
+    return {"seconds": best, "median_seconds": median, "rows_per_s": rows / best, "peak_mb": _peak_mb(call)}
+
+
+def bench_columnar(rows, repeat=None):
+    """欄式批次結果（simulate_columnar）：模擬秒數、峰值記憶體與結果大小，以及匯出
+    Parquet / Arrow IPC / CSV 的秒數與檔案大小（MB），對照 simulate_blended_frame 的 DataFrame。"""
+    from .batch import simulate_blended_frame
+    from .columnar import simulate_columnar
+
+    df = _frame(rows)
+    repeat = repeat or (3 if rows <= 100_000 else 1)
+    result = simulate_columnar(df)
+    best, median = _timed(lambda: simulate_columnar(df), repeat)
+    stats = {
+        "seconds": best,
+        "median_seconds": median,
+        "rows_per_s": rows / best,
+        "peak_mb": _peak_mb(lambda: simulate_columnar(df)),
+        "result_mb": result.nbytes / 1e6,
+        "frame_mb": float(simulate_blended_frame(df).memory_usage(deep=True).sum()) / 1e6,
+    }
+    for fmt in ("parquet", "arrow", "csv"):
+        size = []
+        write, _ = _timed(lambda: size.append(len(result.to_bytes(fmt))), 1)
+        stats[f"{fmt}_seconds"] = write
+        stats[f"{fmt}_mb"] = size[-1] / 1e6
+    return stats
+
+
+def bench_csv(rows, chunksize=50_000):
+    """CSV 串流批次：讀檔 → 逐塊模擬 → 寫出（stream_simulation_csv）。"""
+    from .streaming import stream_simulation_csv
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "input.csv")
+        _frame(rows).to_csv(path, index=False)
+
+        def call():
+            with open(os.path.join(tmp, "output.csv"), "wb") as out:
+                stream_simulation_csv(path, out=out, chunksize=chunksize)
+
+        best, median = _timed(call, 2)
+        return {"seconds": best, "median_seconds": median, "rows_per_s": rows / best, "peak_mb": _peak_mb(call)}
+
+
+def bench_mc(name, samples=1_000_000):
+    """蒙地卡羅不確定性分析（單筆延遲相同的參數與配方，預設雜訊）。"""
+    from .uncertainty import monte_carlo
+
+    best, median = _timed(lambda: monte_carlo(name, SINGLE_ARGS[name], SINGLE_BLEND, n=samples, seed=0), 2)
+    return {"seconds": best, "median_seconds": median, "rows_per_s": samples / best}
+
+
+def bench_barrel(configs=1_000, zones=200):
+    """軸向分區模型：configs 組亂數設定 × zones 區段，含完整軸向分布。"""
+    from .barrel import simulate_barrel_batch
+
+    columns, ratios = _inputs(configs, SINGLE_ARGS["v35"])
+
+    def call():
+        simulate_barrel_batch(ratios=ratios, zones=zones, **columns)
+
+    call()
+    best, median = _timed(call, 5)
+    return {"seconds": best, "median_seconds": median, "rows_per_s": configs / best, "peak_mb": _peak_mb(call)}
+
+
+def bench_sobol(n=2 ** 14):
+    """v3.5 全域 Sobol 指數：8 個製程參數加 6 種原料比例，n × 16 次模型計算。"""
+    from .sensitivity import sobol_indices
+
+    def call():
+        return sobol_indices("v35", SINGLE_ARGS["v35"], n=n, seed=0)
+
+    evaluations = call().evaluations
+    best, median = _timed(call, 3)
+    return {"seconds": best, "median_seconds": median, "rows_per_s": evaluations / best}
+
+
+def bench_neighbors(rows=100_000, queries=200):
+    """過去紀錄的最近鄰索引：rows 筆 v3.5 亂數紀錄每次加入 100 筆建立索引，再量參數空間
+    k = 10 近鄰與輸出目標（膨發指數、酥脆度）半徑查詢的延遲（微秒）。"""
+    from .models import MODELS
+    from .neighbors import OUTPUT_SPANS, RunIndex
+
+    params = tuple(SINGLE_ARGS["v35"])
+    outputs = tuple(OUTPUT_SPANS)
+    columns, ratios = _inputs(rows, params)
+    result = MODELS["v35"]["batch"](ratios=ratios, **columns)
+    x = np.column_stack([columns[p] for p in params])
+    y = np.column_stack([np.broadcast_to(result[k], rows) for k in outputs])
+    index = RunIndex(params, outputs, keep_values=False)
+    start = time.perf_counter()
+    for lo in range(0, rows, 100):
+        index.add(np.arange(lo, min(lo + 100, rows)) + 1, x[lo:lo + 100], y[lo:lo + 100])
+    build = time.perf_counter() - start
+
+    rng = np.random.default_rng(1)
+    knn, radius = [], []
+    for i in rng.integers(0, rows, queries):
+        point = dict(zip(params, x[i] + rng.normal(0, 2, len(params))))
+        t = time.perf_counter()
+        index.param_index.knn(point, 10)
+        knn.append(time.perf_counter() - t)
+        t = time.perf_counter()
+        index.output_index.within({"膨發指數": y[i, 0], "酥脆度": y[i, 1]}, 0.02, limit=100)
+        radius.append(time.perf_counter() - t)
+    knn, radius = np.array(knn) * 1e6, np.array(radius) * 1e6
+    return {
+        "seconds": build,
+        "rows_per_s": rows / build,
+        "median_us": float(np.median(knn)),
+        "p99_us": float(np.percentile(knn, 99)),
+        "range_median_us": float(np.median(radius)),
+        "range_p99_us": float(np.percentile(radius, 99)),
+    }
+
+
+def bench_surrogate(rows=100_000, zones=100):
+    """分區模型的預先計算查表：在暫存目錄建表（每個參數 5 點），量開啟（映射）時間與
+    rows 組亂數設定以 simplex / 多線性內插查詢的秒數，並與直接計算比較。"""
+    from .barrel import simulate_barrel_batch
+    from .surrogate import SurrogateTable, build
+
+    columns, ratios = _inputs(rows, SINGLE_ARGS["v35"])
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "barrel")
+        start = time.perf_counter()
+        build("barrel", path, zones=zones)
+        build_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        table = SurrogateTable(path)
+        open_ms = (time.perf_counter() - start) * 1e3
+        best, median = _timed(lambda: table.lookup(ratios, **columns), 3)
+        multilinear, _ = _timed(lambda: table.lookup(ratios, method="multilinear", **columns), 2)
+        exact, _ = _timed(lambda: simulate_barrel_batch(ratios=ratios, zones=zones, keep_profiles=False, **columns), 2)
+        del table
+    return {
+        "seconds": best,
+        "median_seconds": median,
+        "rows_per_s": rows / best,
+        "multilinear_seconds": multilinear,
+        "exact_seconds": exact,
+        "build_seconds": build_seconds,
+        "open_ms": open_ms,
+    }
+
+
+def bench_rerun(path, upload_rows=0, repeat=5):
+    """Streamlit App 整頁重新執行的延遲（streamlit.testing 的 AppTest，不經瀏覽器）：
+    側邊欄第一個滑桿每次改一個值後重新執行。upload_rows > 0 時先上傳這麼多列的批次
+    CSV（v2 App），量的是已有上傳結果時改動無關元件的代價。"""
+    from streamlit.testing.v1 import AppTest
+
+    app = AppTest.from_file(path, default_timeout=600)
+    app.run()
+    if upload_rows:
+        data = _frame(upload_rows).to_csv(index=False).encode("utf-8")
+        app.file_uploader[0].set_value(("upload.csv", data, "text/csv"))
+        app.run()
+    base = app.sidebar.slider[0].value
+    times = []
+    for i in range(repeat):
+        app.sidebar.slider[0].set_value(base + (i + 1) % 2)
+        t = time.perf_counter()
+        app.run()
+        times.append(time.perf_counter() - t)
+    if app.exception:
+        raise RuntimeError(f"{os.path.basename(path)}：{app.exception[0].value}")
+    return {"seconds": min(times), "median_seconds": statistics.median(times)}
+
+
+def _import_code(path):
+    # 腳本最上層的 import 敘述，不執行 Streamlit 頁面本身
+    tree = ast.parse(open(path, encoding="utf-8").read())
+    return "\n".join(ast.unparse(node) for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom)))
+
+
+def bench_import(code, repeat=3):
+    """在全新的 Python 行程中執行 code 的匯入時間（秒，取最小值；不含直譯器啟動）。"""
+    probe = f"import time\n_t = time.perf_counter()\n{code}\nprint(time.perf_counter() - _t)"
+    times = []
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, "-c", probe], cwd=ROOT, capture_output=True, text=True, check=True)
+        times.append(float(out.stdout.strip().splitlines()[-1]))
+    return {"seconds": min(times), "median_seconds": statistics.median(times)}
+
+
+def run(sizes=DEFAULT_SIZES, models=None, progress=print):
+    """執行全部項目，回傳可寫成 JSON 的 dict。"""
+    import pandas as pd
+
+    from .models import MODELS
+
+    models = models or list(MODELS)
+    results = {}
+
+    def record(key, value):
+        results[key] = value
+        shown = {k: round(v, 4) if isinstance(v, float) else v for k, v in value.items()}
+        progress(f"{key:<55} {shown}")
+
+    for name in models:
+        record(f"single/{name}", bench_single(name))
+    for rows in sizes:
+        for name in models:
+            record(f"batch/{name}/{rows}", bench_batch(name, rows))
+        record(f"frame/v2/{rows}", bench_frame(rows))
+        record(f"columnar/v2/{rows}", bench_columnar(rows))
+    record(f"csv/v2/{max(sizes)}", bench_csv(max(sizes)))
+    for name in ("v2", "v3", "v35"):
+        if name in models:
+            record(f"mc/{name}/1000000", bench_mc(name))
+    if "v35" in models:
+        record("barrel/1000x200", bench_barrel())
+        record("sobol/v35/16384", bench_sobol())
+        record("neighbors/v35/100000", bench_neighbors())
+        record("surrogate/barrel/100000", bench_surrogate())
+    record("import/extrusion_core", bench_import("import extrusion_core"))
+    record("import/extrusion_core.models", bench_import("import extrusion_core.models"))
+    for path in sorted(glob.glob(os.path.join(ROOT, "extrusion_simulator_*.py"))):
+        record(f"import/{os.path.basename(path)}", bench_import(_import_code(path)))
+    for path in sorted(glob.glob(os.path.join(ROOT, "extrusion_simulator_*.py"))):
+        record(f"rerun/{os.path.basename(path)}", bench_rerun(path))
+    for path in glob.glob(os.path.join(ROOT, "extrusion_simulator_v2*.py")):
+        record(f"rerun/{os.path.basename(path)}/upload/100000", bench_rerun(path, 100_000))
+
+    return {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "pandas": pd.__version__,
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        "results": results,
+    }
+
+
+def compare(baseline, current, threshold=0.2):
+    """比較兩份結果，回傳 [(項目, 欄位, 基準, 目前, 變化比例, 是否退步)]。"""
+    rows = []
+    for key, base in baseline["results"].items():
+        now = current["results"].get(key)
+        if now is None:
+            continue
+        for field in LOWER_IS_BETTER:
+            if field in base and field in now and base[field] > 0:
+                change = now[field] / base[field] - 1
+                rows.append((key, field, base[field], now[field], change, change > threshold))
+    return rows
+
+
+def _load(path):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m extrusion_core.bench", description="效能基準測試")
+    sub = parser.add_subparsers(dest="command", required=True)
+    run_p = sub.add_parser("run", help="執行基準測試")
+    run_p.add_argument("-o", "--output", default="bench.json")
+    run_p.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES))
+    run_p.add_argument("--models", nargs="+", help="預設全部模型")
+    run_p.add_argument("--baseline", help="完成後直接與此基準比較")
+    run_p.add_argument("--threshold", type=float, default=0.2)
+    cmp_p = sub.add_parser("compare", help="與基準比較，變慢超過門檻時結束代碼為 1")
+    cmp_p.add_argument("baseline")
+    cmp_p.add_argument("current")
+    cmp_p.add_argument("--threshold", type=float, default=0.2, help="容許變慢的比例，預設 0.2（20%%）")
+    args = parser.parse_args(argv)
+
+    if args.command == "run":
+        current = run(args.sizes, args.models, progress=lambda line: print(line, file=sys.stderr))
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(current, f, ensure_ascii=False, indent=2)
+        print(f"已寫入 {args.output}", file=sys.stderr)
+        if not args.baseline:
+            return 0
+        baseline = _load(args.baseline)
+    else:
+        baseline, current = _load(args.baseline), _load(args.current)
+
+    regressions = 0
+    for key, field, base, now, change, worse in compare(baseline, current, args.threshold):
+        regressions += worse
+        flag = "⚠️ 退步" if worse else ""
+        print(f"{key:<55} {field:<10} {base:>14.4f} → {now:>14.4f}  {change:+7.1%} {flag}")
+    print(f"{regressions} 項變慢超過 {args.threshold:.0%}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
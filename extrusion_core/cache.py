@@ -0,0 +1,198 @@
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from .materials import MATERIALS
+
+
+def make_key(version, *params, blend=None):
+    """組出快取鍵：模型版本 + 正規化後的參數。
+
+    數值一律轉成小數點後 6 位的 float（140 與 140.0 視為相同），原料比例依
+    MATERIALS 順序排成 tuple，未使用的原料記為 0。
+    """
+    parts = [version]
+    for p in params:
+        parts.append(round(float(p), 6) if isinstance(p, (int, float)) else p)
+    if blend is not None:
+        parts.append(tuple(round(float(blend.get(mat, 0)), 6) for mat in MATERIALS))
+    return repr(tuple(parts))
+
+
+_DISK_COLUMNS = ("key", "expires", "accessed", "size", "value")
+
+
+class ResultCache:
+    """跨工作階段共用的結果快取：LRU + TTL，記憶體上限以 MB 計。
+
+    值以 pickle 保存，取出時還原成新物件，呼叫端修改結果不會影響快取。
+    指定 path 時另存一份到 SQLite（WAL 模式），重啟後仍可命中；磁碟上的部分
+    每次寫入時刪除過期的項目，超過 disk_mb（預設同 max_mb）時依最後存取時間
+    淘汰。記憶體命中不更新磁碟的存取時間，只有從磁碟讀回時才更新。
+    """
+
+    def __init__(self, max_mb=64, ttl=3600, path=None, disk_mb=None):
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.max_disk_bytes = int((max_mb if disk_mb is None else disk_mb) * 1024 * 1024)
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._db = None
+        self._disk_bytes = 0
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            columns = [row[1] for row in self._db.execute("PRAGMA table_info(results)")]
+            if columns and tuple(columns) != _DISK_COLUMNS:
+                # 舊版的表沒有存取時間與大小，內容只是快取，直接重建
+                self._db.execute("DROP TABLE results")
+            self._db.execute("CREATE TABLE IF NOT EXISTS results "
+                             "(key TEXT PRIMARY KEY, expires REAL, accessed REAL, size INTEGER, value BLOB)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS idx_results_expires ON results (expires)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS idx_results_accessed ON results (accessed)")
+            self._disk_bytes = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+            self._trim_disk(time.time())
+            self._db.commit()
+
+    def _store(self, key, blob, expires):
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._bytes -= len(old[1])
+        if len(blob) > self.max_bytes:
+            return
+        self._entries[key] = (expires, blob)
+        self._bytes += len(blob)
+        while self._bytes > self.max_bytes:
+            _, (_, evicted) = self._entries.popitem(last=False)
+            self._bytes -= len(evicted)
+            self.evictions += 1
+
+    def _trim_disk(self, now):
+        # 刪除過期項目；超過上限時保留最近存取、累計大小不超過上限的項目
+        self._db.execute("DELETE FROM results WHERE expires < ?", (now,))
+        if self._disk_bytes > self.max_disk_bytes:
+            # 計數只累加本行程寫入的大小（其他行程也可能寫入或淘汰），超過時才重新加總
+            self._disk_bytes = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+        if self._disk_bytes > self.max_disk_bytes:
+            self._db.execute(
+                "DELETE FROM results WHERE key IN (SELECT key FROM (SELECT key, SUM(size) OVER "
+                "(ORDER BY accessed DESC, key) AS kept FROM results) WHERE kept > ?)",
+                (self.max_disk_bytes,),
+            )
+            self._disk_bytes = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+
+    def _lookup(self, key):
+        now = time.time()
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry[0] >= now:
+                self._entries.move_to_end(key)
+                return entry[1]
+            del self._entries[key]
+            self._bytes -= len(entry[1])
+        if self._db is not None:
+            row = self._db.execute("SELECT expires, value FROM results WHERE key = ?", (key,)).fetchone()
+            if row is not None and row[0] >= now:
+                self._db.execute("UPDATE results SET accessed = ? WHERE key = ?", (now, key))
+                self._db.commit()
+                self._store(key, row[1], row[0])
+                return row[1]
+        return None
+
+    def get(self, key, default=None):
+        with self._lock:
+            blob = self._lookup(key)
+            if blob is None:
+                self.misses += 1
+                return default
+            self.hits += 1
+        return pickle.loads(blob)
+
+    def put(self, key, value):
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        now = time.time()
+        expires = now + self.ttl
+        with self._lock:
+            self._store(key, blob, expires)
+            if self._db is not None:
+                if len(blob) <= self.max_disk_bytes:
+                    self._db.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)",
+                                     (key, expires, now, len(blob), blob))
+                    self._disk_bytes += len(blob)
+                self._trim_disk(now)
+                self._db.commit()
+
+    def get_or_compute(self, key, compute):
+        """命中則回傳快取結果，否則呼叫 compute() 並存入快取。"""
+        sentinel = object()
+        value = self.get(key, sentinel)
+        if value is sentinel:
+            value = compute()
+            self.put(key, value)
+        return value
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "entries": len(self._entries),
+                "mb": self._bytes / (1024 * 1024),
+                "evictions": self.evictions,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            if self._db is not None:
+                self._db.execute("DELETE FROM results")
+                self._db.commit()
+                self._disk_bytes = 0
+
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def get_cache():
+    """整個行程共用一個快取（Streamlit 的所有工作階段都在同一行程）。
+
+    由環境變數設定：EXTRUSION_CACHE_MB（預設 64）、EXTRUSION_CACHE_TTL 秒數
+    （預設 3600）、EXTRUSION_CACHE_PATH（SQLite 檔路徑，未設定則只放記憶體）、
+    EXTRUSION_CACHE_DISK_MB（SQLite 檔的上限，預設同 EXTRUSION_CACHE_MB）。
+    """
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = ResultCache(
+                max_mb=float(os.environ.get("EXTRUSION_CACHE_MB", 64)),
+                ttl=float(os.environ.get("EXTRUSION_CACHE_TTL", 3600)),
+                path=os.environ.get("EXTRUSION_CACHE_PATH") or None,
+                disk_mb=float(os.environ["EXTRUSION_CACHE_DISK_MB"]) if os.environ.get("EXTRUSION_CACHE_DISK_MB")
+                else None,
+            )
+        return _shared
+
+
+@contextmanager
+def shared_cache(cache):
+    """暫時把整個行程共用的快取換成 cache（記憶體檢查等工具用），結束後還原。"""
+    global _shared
+    with _shared_lock:
+        previous, _shared = _shared, cache
+    try:
+        yield cache
+    finally:
+        with _shared_lock:
+            _shared = previous
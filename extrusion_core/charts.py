@@ -0,0 +1,176 @@
+import threading
+from collections import OrderedDict
+from io import BytesIO
+
+from .cache import get_cache, make_key
+from .metrics import timed
+
+# 長條圖的 Figure 依（欄位、格式、尺寸、dpi）重複使用，最多保留這麼多個
+FIGURE_POOL_SIZE = 8
+
+
+def _figure(size=None):
+    # 直接建立 Figure 而不經過 pyplot：不進入 pyplot 的全域 figure 清單（不需 close），
+    # 背景執行緒產生報告時也不會與前景共用狀態
+    from matplotlib.figure import Figure
+
+    return Figure(figsize=size)
+
+
+class BarChartSeries:
+    """同一組欄位連續畫很多張長條圖（例如批次報告每個配方一張）時重複使用同一個
+    Figure，只更新長條高度與座標範圍，省去每張重建圖表的時間。"""
+
+    def __init__(self, keys, fmt="png", size=None, dpi=None):
+        self.keys = tuple(keys)
+        self.fmt = fmt
+        self.size = size
+        self.dpi = dpi
+        self._fig = None
+        self._lock = threading.Lock()
+
+    def render(self, vals):
+        def draw():
+            with self._lock, timed("chart.render"):
+                return self._draw(vals)
+
+        key = make_key(f"chart:bar:{self.fmt}:{self.size}:{self.dpi}", self.keys, *vals)
+        return get_cache().get_or_compute(key, draw)
+
+    def _draw(self, vals):
+        if self._fig is None:
+            self._fig = _figure(self.size)
+            self._ax = self._fig.subplots()
+            self._bars = self._ax.bar(self.keys, vals)
+        else:
+            for bar, v in zip(self._bars, vals):
+                bar.set_height(v)
+            self._ax.relim()
+            self._ax.autoscale_view()
+        buffer = BytesIO()
+        self._fig.savefig(buffer, format=self.fmt, dpi=self.dpi)
+        return buffer.getvalue()
+
+
+_pool = OrderedDict()
+_pool_lock = threading.Lock()
+
+
+def _series(keys, fmt, size, dpi):
+    spec = (tuple(keys), fmt, size, dpi)
+    with _pool_lock:
+        series = _pool.pop(spec, None) or BarChartSeries(*spec)
+        _pool[spec] = series
+        while len(_pool) > FIGURE_POOL_SIZE:
+            _pool.popitem(last=False)
+    return series
+
+
+def bar_chart(keys, vals, fmt="png", size=None, dpi=None):
+    """長條圖轉成圖片 bytes（fmt 為 png 或 jpeg），依圖上的數值快取。
+
+    同一組欄位共用池中的同一個 Figure，不論畫幾次，記憶體中的 Figure 數量不超過
+    FIGURE_POOL_SIZE；產生的圖片由共用快取的容量上限控管。
+    """
+    return _series(keys, fmt, size, dpi).render(vals)
+
+
+def bar_chart_png(keys, vals):
+    """長條圖轉成 PNG bytes，依圖上的數值快取。"""
+    return bar_chart(keys, vals)
+
+
+def heatmap_png(xs, ys, plane, xlabel, ylabel, label):
+    """參數掃描熱圖（plane[y, x]）轉成 PNG bytes。"""
+    with timed("chart.render"):
+        return _heatmap_png(xs, ys, plane, xlabel, ylabel, label)
+
+
+def _heatmap_png(xs, ys, plane, xlabel, ylabel, label):
+    fig = _figure()
+    ax = fig.subplots()
+    mesh = ax.pcolormesh(xs, ys, plane, shading="nearest")
+    fig.colorbar(mesh, ax=ax, label=label)
+    ax.set_xlabel(xlabel)
+    ax.set_ylabel(ylabel)
+    buffer = BytesIO()
+    fig.savefig(buffer, format="png")
+    return buffer.getvalue()
+
+
+def histogram_png(counts, edges, label, spec=None):
+    """直方圖（np.histogram 的 counts、edges）轉成 PNG bytes；spec 為 (下限, 上限)，畫成紅色虛線。
+    依圖上的數值快取。"""
+    import numpy as np
+
+    def draw():
+        with timed("chart.render"):
+            fig = _figure()
+            ax = fig.subplots()
+            ax.stairs(counts, edges, fill=True)
+            for bound in spec or ():
+                if bound is not None:
+                    ax.axvline(bound, color="red", linestyle="--")
+            ax.set_xlabel(label)
+            ax.set_ylabel("count")
+            buffer = BytesIO()
+            fig.savefig(buffer, format="png")
+            return buffer.getvalue()
+
+    key = make_key("chart:histogram", label, repr(spec), *np.asarray(counts).tolist(), *np.asarray(edges).tolist())
+    return get_cache().get_or_compute(key, draw)
+
+
+def tornado_png(labels, low, high, base, xlabel):
+    """龍捲風圖：每個輸入一條橫條，從輸入往下移動時的輸出（low）畫到往上移動時的輸出
+    （high），以 base 為中線；依傳入順序由上而下排列（先排好擺幅）。依圖上的數值快取。"""
+    import numpy as np
+
+    low, high = np.asarray(low, dtype=float), np.asarray(high, dtype=float)
+
+    def draw():
+        with timed("chart.render"):
+            fig = _figure((6, 0.4 * len(labels) + 1.2))
+            ax = fig.subplots()
+            y = np.arange(len(labels))
+            ax.barh(y, low - base, left=base, color="tab:blue", label="low")
+            ax.barh(y, high - base, left=base, color="tab:orange", label="high")
+            ax.axvline(base, color="black", linewidth=0.8)
+            ax.set_yticks(y, labels)
+            ax.invert_yaxis()
+            ax.set_xlabel(xlabel)
+            ax.legend(loc="lower right")
+            fig.tight_layout()
+            buffer = BytesIO()
+            fig.savefig(buffer, format="png")
+            return buffer.getvalue()
+
+    key = make_key("chart:tornado", tuple(labels), xlabel, base, *low.tolist(), *high.tolist())
+    return get_cache().get_or_compute(key, draw)
+
+
+def sobol_png(labels, first, total, label):
+    """Sobol 指數橫條圖：每個輸入並排畫一階與總效應，依傳入順序由上而下排列。依圖上的數值快取。"""
+    import numpy as np
+
+    first, total = np.asarray(first, dtype=float), np.asarray(total, dtype=float)
+
+    def draw():
+        with timed("chart.render"):
+            fig = _figure((6, 0.4 * len(labels) + 1.2))
+            ax = fig.subplots()
+            y = np.arange(len(labels))
+            ax.barh(y - 0.2, total, height=0.4, label="total")
+            ax.barh(y + 0.2, first, height=0.4, label="first order")
+            ax.set_yticks(y, labels)
+            ax.invert_yaxis()
+            ax.set_xlim(0, max(1.0, float(np.max(total, initial=0))))
+            ax.set_xlabel(label)
+            ax.legend(loc="lower right")
+            fig.tight_layout()
+            buffer = BytesIO()
+            fig.savefig(buffer, format="png")
+            return buffer.getvalue()
+
+    key = make_key("chart:sobol", tuple(labels), label, *first.tolist(), *total.tolist())
+    return get_cache().get_or_compute(key, draw)
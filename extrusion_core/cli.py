@@ -0,0 +1,407 @@
+"""命令列介面：不需 Streamlit 即可執行單筆模擬、批次檔案與參數掃描。
+
+    python -m extrusion_core run --model v35 --blend 玉米粉=50 小麥粉=50 --temp 150
+    python -m extrusion_core batch recipes.csv -o results.csv
+    python -m extrusion_core sweep --vary temp=60:180:5 --vary rpm=100:600:25 --blend 玉米粉=100 -o sweep.csv
+    python -m extrusion_core barrel --blend 玉米粉=100 --zones 200 --profile profile.csv
+    python -m extrusion_core mc --model v3 --blend 玉米粉=60 裸麥粉=40 --samples 1000000 --spec 膨發指數=1.8:2.2
+    python -m extrusion_core sensitivity --model v35 --blend 玉米粉=60 裸麥粉=40 --sobol 16384 --metric 膨發指數
+    python -m extrusion_core similar --model v2 --target 膨發指數=2.1 酥脆度=5.8 -k 10
+
+單筆模擬只需要 numpy；pandas 只在批次與掃描時匯入，matplotlib 與 fpdf 只在
+指定 --chart / --report 時匯入。
+"""
+
+import argparse
+import json
+import os
+import sys
+
+from .materials import MATERIALS
+from .sweep import SWEEP_PARAMETERS
+
+# 各模型的製程參數（名稱同 simulate_* 的參數）
+MODEL_ARGUMENTS = {
+    "v2": ("temp", "rpm", "moisture", "fat"),
+    "v3": ("temp", "rpm", "moisture", "fat", "screw_diameter", "screw_length"),
+    "v35": ("temp", "rpm", "moisture", "fat", "screw_diameter", "screw_length", "feed_rate", "die_diameter"),
+    "v35s": ("temp", "rpm", "moisture", "fat", "feed_rate"),
+}
+# 長條圖不畫的欄位（螺桿尺寸是輸入值，不是預測結果）
+_CHART_SKIP = ("螺桿直徑（mm）", "螺桿長度（mm）")
+
+
+def _number(text):
+    # 整數值維持 int，輸出與 App 中滑桿傳入的值相同
+    value = float(text)
+    return int(value) if value.is_integer() else value
+
+
+def _blend(items):
+    blend = {}
+    for item in items:
+        mat, sep, ratio = item.partition("=")
+        if not sep or mat not in MATERIALS:
+            raise argparse.ArgumentTypeError(f"原料格式應為 名稱=比例，名稱為 {'、'.join(MATERIALS)} 之一：{item}")
+        blend[mat] = _number(ratio)
+    if sum(blend.values()) <= 0:
+        raise argparse.ArgumentTypeError("原料比例總和需大於 0")
+    return blend
+
+
+def _pairs(items, parse):
+    values = {}
+    for item in items:
+        name, sep, value = item.partition("=")
+        if not sep or name not in SWEEP_PARAMETERS:
+            raise argparse.ArgumentTypeError(f"參數格式應為 名稱=值，名稱為 {', '.join(SWEEP_PARAMETERS)} 之一：{item}")
+        values[name] = parse(value)
+    return values
+
+
+def _range(text):
+    # 起點:終點[:間距]，拉丁超立方可省略間距（0 表示不對齊刻度）
+    parts = [float(v) for v in text.split(":")]
+    if len(parts) == 2:
+        parts.append(0.0)
+    if len(parts) != 3:
+        raise argparse.ArgumentTypeError(f"範圍格式應為 起點:終點[:間距]：{text}")
+    return tuple(parts)
+
+
+def _write(data, path):
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def cmd_run(args):
+    from . import models
+
+    blend = _blend(args.blend)
+    params = {p: getattr(args, p) for p in MODEL_ARGUMENTS[args.model]}
+    params = {p: SWEEP_PARAMETERS[p][3] if v is None else v for p, v in params.items()}
+    simulate = models.MODELS[args.model]["simulate"]
+    results = simulate(blend_dict=blend, **params)
+    flavors = None
+    if args.model == "v35":
+        results, flavors = results
+
+    if args.json:
+        print(json.dumps({"model": args.model, "params": params, "blend": blend, "results": results,
+                          "flavors": flavors}, ensure_ascii=False))
+    else:
+        for k, v in results.items():
+            print(f"{k}：{v}")
+        if flavors is not None:
+            print("綜合風味組成：" + "、".join(f"{k}（{v}%）" for k, v in flavors.items()))
+
+    if args.chart:
+        from .charts import bar_chart_png
+
+        keys = [k for k, v in results.items() if isinstance(v, (int, float)) and k not in _CHART_SKIP]
+        _write(bar_chart_png(keys, [results[k] for k in keys]), args.chart)
+    if args.report:
+        from .report import simulation_report_pdf
+
+        lines = ["，".join(f"{SWEEP_PARAMETERS[p][0]}：{v}" for p, v in params.items())]
+        if flavors is not None:
+            lines.append("綜合風味組成：" + "、".join(f"{k}（{v}%）" for k, v in flavors.items()))
+        _write(simulation_report_pdf(f"雙螺桿擠壓模擬報告 {args.model}", blend, lines, results), args.report)
+    return 0
+
+
+def _read_table(path):
+    import pandas as pd
+
+    if path.endswith(".parquet"):
+        return pd.read_parquet(path)
+    return pd.read_feather(path) if path.endswith(".arrow") else pd.read_csv(path)
+
+
+def cmd_batch(args):
+    from .columnar import FORMATS, simulate_columnar
+
+    if args.input.endswith(".csv") and not (args.output or "").endswith((".parquet", ".arrow")):
+        # CSV → CSV 逐塊處理，記憶體用量與檔案大小無關
+        from .streaming import stream_simulation_csv
+
+        out = open(args.output, "wb") if args.output else sys.stdout.buffer
+        try:
+            _, rows = stream_simulation_csv(args.input, out=out, chunksize=args.chunksize, workers=args.workers)
+        finally:
+            if args.output:
+                out.close()
+    else:
+        # Parquet / Arrow 輸出保留 float32 數值欄、類別欄與風味組成權重
+        result = simulate_columnar(_read_table(args.input), workers=args.workers)
+        rows = len(result)
+        suffix = os.path.splitext(args.output or "")[1][1:]
+        result.write(args.output or sys.stdout, suffix if suffix in FORMATS else "csv")
+    print(f"已模擬 {rows:,} 列", file=sys.stderr)
+    return 0
+
+
+def cmd_sweep(args):
+    import numpy as np
+    import pandas as pd
+
+    from .sweep import full_factorial, latin_hypercube
+
+    blend = _blend(args.blend)
+    ranges = _pairs(args.vary, _range)
+    fixed = _pairs(args.fixed, _number)
+    if args.lhs:
+        result = latin_hypercube(ranges, blend, args.lhs, fixed=fixed, seed=args.seed)
+        columns = {SWEEP_PARAMETERS[p][0]: result.points[p] for p in result.params}
+    else:
+        result = full_factorial(ranges, blend, fixed=fixed)
+        grids = np.meshgrid(*(result.axes[p] for p in result.params), indexing="ij")
+        columns = {SWEEP_PARAMETERS[p][0]: g.ravel() for p, g in zip(result.params, grids)}
+    for k, v in result.outputs.items():
+        columns[k] = np.asarray(v).ravel()
+    table = pd.DataFrame(columns)
+    if args.output and args.output.endswith(".parquet"):
+        table.to_parquet(args.output, index=False)
+    else:
+        table.to_csv(args.output or sys.stdout, index=False)
+    print(f"已計算 {result.size:,} 個掃描點", file=sys.stderr)
+    return 0
+
+
+def cmd_barrel(args):
+    from .barrel import simulate_barrel
+
+    blend = _blend(args.blend)
+    params = {p: SWEEP_PARAMETERS[p][3] if getattr(args, p) is None else getattr(args, p) for p in MODEL_ARGUMENTS["v35"]}
+    result = simulate_barrel(blend_dict=blend, zones=args.zones, **params)
+    exit = {k: v.tolist()[0] for k, v in result.exit.items()}
+    if args.json:
+        print(json.dumps({"params": params, "blend": blend, "zones": args.zones, "exit": exit}, ensure_ascii=False))
+    else:
+        for k, v in exit.items():
+            print(f"{k}：{v}")
+    if args.profile:
+        profile = result.profile_frame()
+        if args.profile.endswith(".parquet"):
+            profile.to_parquet(args.profile)
+        else:
+            profile.to_csv(args.profile)
+    return 0
+
+
+def _spec(items):
+    # 指標=下限:上限，任一邊可留白表示不限
+    specs = {}
+    for item in items:
+        name, sep, bounds = item.rpartition("=")
+        lo, colon, hi = bounds.partition(":")
+        if not sep or not colon:
+            raise argparse.ArgumentTypeError(f"規格格式應為 指標=下限:上限：{item}")
+        specs[name] = (float(lo) if lo else None, float(hi) if hi else None)
+    return specs
+
+
+def cmd_mc(args):
+    from .uncertainty import SENSOR_NOISE, monte_carlo
+
+    blend = _blend(args.blend)
+    params = {p: getattr(args, p) for p in MODEL_ARGUMENTS[args.model]}
+    params = {p: SWEEP_PARAMETERS[p][3] if v is None else v for p, v in params.items()}
+    sensor_sd = dict(SENSOR_NOISE, **_pairs(args.noise, float))
+    result = monte_carlo(args.model, params, blend, n=args.samples, material_cv=args.material_cv,
+                         sensor_sd=sensor_sd, distribution=args.distribution, specs=_spec(args.spec), seed=args.seed)
+    summary = result.summary()
+    if args.json:
+        print(json.dumps({"model": args.model, "params": params, "blend": blend, "samples": result.n,
+                          "seconds": result.seconds,
+                          "summary": {k: {c: v for c, v in row.items() if v == v}  # 未設規格的 NaN 不輸出
+                                      for k, row in summary.to_dict(orient="index").items()},
+                          "out_of_spec": result.out_of_spec()}, ensure_ascii=False))
+    else:
+        print(summary.to_string(float_format=lambda v: f"{v:.4g}"))
+        for k, v in result.out_of_spec().items():
+            print(f"超出規格（{k}）：{v['probability']:.3%} ± {v['stderr']:.3%}")
+    if args.hist:
+        from .charts import histogram_png
+
+        metric = args.hist_metric or next(iter(result.values))
+        _write(histogram_png(*result.histogram(metric, args.bins), metric, result.specs.get(metric)), args.hist)
+    print(f"{result.n:,} 個樣本，{result.seconds:.2f} 秒", file=sys.stderr)
+    return 0
+
+
+def cmd_sensitivity(args):
+    from .sensitivity import SENSITIVITY_MODELS, local_sensitivity, sobol_indices
+
+    spec = SENSITIVITY_MODELS[args.model]
+    blend = _blend(args.blend) if args.blend else None
+    if spec["blend"] and blend is None:
+        raise ValueError(f"模型 {args.model} 需指定 --blend")
+    point = {p: v[3] if getattr(args, p) is None else getattr(args, p) for p, v in spec["parameters"].items()}
+    metrics = [args.metric] if args.metric else list(spec["outputs"])
+    unknown = set(metrics) - set(spec["outputs"])
+    if unknown:
+        raise ValueError(f"模型 {args.model} 沒有這些指標：{'、'.join(sorted(unknown))}")
+    local = local_sensitivity(args.model, point, blend, swing=args.swing)
+    result = None
+    if args.sobol:
+        result = sobol_indices(args.model, point, blend, params=args.vary or None,
+                               blend_inputs=not args.fixed_blend, n=args.sobol, seed=args.seed)
+    if args.json:
+        out = {"model": args.model, "params": point, "blend": blend, "base": local.base,
+               "local": {k: local.tornado(k).assign(導數=local.derivative[k].rename(index=local.labels))
+                         .to_dict(orient="index") for k in metrics}}
+        if result is not None:
+            out["sobol"] = {k: result.ranking(k).to_dict(orient="index") for k in metrics}
+            out["evaluations"], out["seconds"] = result.evaluations, result.seconds
+        print(json.dumps(out, ensure_ascii=False))
+    else:
+        for k in metrics:
+            table = local.tornado(k).assign(導數=local.derivative[k].rename(index=local.labels))
+            print(f"== {k}（操作點 {local.base[k]:.4g}）")
+            print(table.to_string(float_format=lambda v: f"{v:.4g}"))
+            if result is not None:
+                print(result.ranking(k).to_string(float_format=lambda v: f"{v:.3f}"))
+    metric = metrics[0]
+    if args.tornado:
+        from .charts import tornado_png
+
+        table = local.tornado(metric)
+        _write(tornado_png(list(table.index), table["低"], table["高"], local.base[metric], metric), args.tornado)
+    if args.sobol_chart and result is not None:
+        from .charts import sobol_png
+
+        ranking = result.ranking(metric)
+        _write(sobol_png(list(ranking.index), ranking["一階"], ranking["總效應"], metric), args.sobol_chart)
+    if result is not None:
+        print(f"Sobol：{result.evaluations:,} 次模型計算，{result.seconds:.2f} 秒", file=sys.stderr)
+    return 0
+
+
+def _targets(items):
+    # 輸出=目標值（輸出名稱可含空白與括號，例如 "桶內壓力 (bar)=20"）
+    targets = {}
+    for item in items:
+        name, sep, value = item.rpartition("=")
+        if not sep:
+            raise argparse.ArgumentTypeError(f"目標格式應為 輸出=目標值：{item}")
+        targets[name] = float(value)
+    return targets
+
+
+def cmd_similar(args):
+    from .history import HistoryStore
+    from .neighbors import HistoryIndex
+
+    index = HistoryIndex(HistoryStore(args.db), args.model, MODEL_ARGUMENTS[args.model])
+    index.refresh()
+    if args.target:
+        found = index.near_outputs(_targets(args.target), k=args.k, radius=args.radius)
+    else:
+        point = {p: getattr(args, p) for p in MODEL_ARGUMENTS[args.model] if getattr(args, p) is not None}
+        if not point:
+            raise ValueError("請指定 --target 或至少一個製程參數")
+        found = index.similar(point, k=args.k, radius=args.radius)
+    if args.json:
+        print(found.reset_index().to_json(orient="records", force_ascii=False, date_format="iso"))
+    else:
+        print(found.to_string())
+    print(f"索引 {len(index):,} 筆（{os.path.abspath(args.db)}）", file=sys.stderr)
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="python -m extrusion_core", description="雙螺桿擠壓模擬器（命令列版）")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run = sub.add_parser("run", help="單筆模擬")
+    run.add_argument("--model", choices=list(MODEL_ARGUMENTS), default="v2")
+    run.add_argument("--blend", nargs="+", required=True, metavar="原料=比例")
+    for p, (label, lo, hi, default) in SWEEP_PARAMETERS.items():
+        run.add_argument(f"--{p.replace('_', '-')}", dest=p, type=_number, help=f"{label}，預設 {default}")
+    run.add_argument("--json", action="store_true", help="以 JSON 輸出")
+    run.add_argument("--chart", metavar="PNG", help="另存長條圖")
+    run.add_argument("--report", metavar="PDF", help="另存 PDF 報告")
+    run.set_defaults(func=cmd_run)
+
+    batch = sub.add_parser("batch", help="批次模擬 CSV / Parquet（v2 模型，欄位同 App 的批次上傳）")
+    batch.add_argument("input")
+    batch.add_argument("-o", "--output", help="輸出檔（.csv、.parquet 或 .arrow），預設輸出 CSV 到 stdout")
+    batch.add_argument("--workers", type=int, default=1)
+    batch.add_argument("--chunksize", type=int, default=50_000)
+    batch.set_defaults(func=cmd_batch)
+
+    sweep = sub.add_parser("sweep", help="v3.5 參數掃描（全因子或拉丁超立方）")
+    sweep.add_argument("--vary", nargs="+", action="extend", required=True, metavar="參數=起點:終點[:間距]")
+    sweep.add_argument("--blend", nargs="+", required=True, metavar="原料=比例")
+    sweep.add_argument("--fixed", nargs="+", action="extend", default=[], metavar="參數=值")
+    sweep.add_argument("--lhs", type=int, metavar="N", help="改用拉丁超立方抽 N 點")
+    sweep.add_argument("--seed", type=int)
+    sweep.add_argument("-o", "--output", help="輸出檔（.csv 或 .parquet），預設輸出 CSV 到 stdout")
+    sweep.set_defaults(func=cmd_sweep)
+
+    barrel = sub.add_parser("barrel", help="v3.5 軸向分區模型：沿筒身的溫度、壓力、水分分布與模口出口結果")
+    barrel.add_argument("--blend", nargs="+", required=True, metavar="原料=比例")
+    for p, (label, lo, hi, default) in SWEEP_PARAMETERS.items():
+        barrel.add_argument(f"--{p.replace('_', '-')}", dest=p, type=_number, help=f"{label}，預設 {default}")
+    barrel.add_argument("--zones", type=int, default=100, help="分區數，預設 100")
+    barrel.add_argument("--profile", metavar="CSV", help="另存軸向分布（.csv 或 .parquet）")
+    barrel.add_argument("--json", action="store_true", help="以 JSON 輸出")
+    barrel.set_defaults(func=cmd_barrel)
+
+    mc = sub.add_parser("mc", help="蒙地卡羅不確定性分析（原料批次差異與感測器雜訊）")
+    mc.add_argument("--model", choices=("v2", "v3", "v35"), default="v3")
+    mc.add_argument("--blend", nargs="+", required=True, metavar="原料=比例")
+    for p, (label, lo, hi, default) in SWEEP_PARAMETERS.items():
+        mc.add_argument(f"--{p.replace('_', '-')}", dest=p, type=_number, help=f"{label}，預設 {default}")
+    mc.add_argument("--samples", type=int, default=100_000)
+    mc.add_argument("--material-cv", type=float, default=0.05, help="原料膨發、酥脆數值的變異係數，預設 0.05")
+    mc.add_argument("--noise", nargs="+", action="extend", default=[], metavar="參數=標準差",
+                    help="感測器雜訊，預設 temp=2 rpm=5 moisture=0.5")
+    mc.add_argument("--distribution", choices=("normal", "uniform", "triangular"), default="normal")
+    mc.add_argument("--spec", nargs="+", action="extend", default=[], metavar="指標=下限:上限")
+    mc.add_argument("--seed", type=int)
+    mc.add_argument("--json", action="store_true", help="以 JSON 輸出")
+    mc.add_argument("--hist", metavar="PNG", help="另存直方圖")
+    mc.add_argument("--hist-metric", help="直方圖的指標，預設第一個")
+    mc.add_argument("--bins", type=int, default=50)
+    mc.set_defaults(func=cmd_mc)
+
+    sens = sub.add_parser("sensitivity", help="敏感度分析：目前操作點的導數與龍捲風圖、全域 Sobol 指數")
+    sens.add_argument("--model", choices=("v35", "v3_energy"), default="v35")
+    sens.add_argument("--blend", nargs="+", metavar="原料=比例", help="v35 必填")
+    for p, (label, lo, hi, default) in SWEEP_PARAMETERS.items():
+        sens.add_argument(f"--{p.replace('_', '-')}", dest=p, type=_number, help=f"{label}，預設 {default}")
+    sens.add_argument("--metric", help="只列出這個指標，預設全部")
+    sens.add_argument("--swing", type=float, default=0.1, help="龍捲風圖擺幅（滑桿範圍的比例），預設 0.1")
+    sens.add_argument("--sobol", type=int, default=0, metavar="N", help="另算 Sobol 指數，每組 N 個樣本")
+    sens.add_argument("--vary", nargs="+", choices=list(SWEEP_PARAMETERS), metavar="參數",
+                      help="Sobol 抽樣的製程參數，預設全部")
+    sens.add_argument("--fixed-blend", action="store_true", help="Sobol 不抽樣原料比例，固定為 --blend")
+    sens.add_argument("--seed", type=int)
+    sens.add_argument("--json", action="store_true", help="以 JSON 輸出")
+    sens.add_argument("--tornado", metavar="PNG", help="另存第一個指標的龍捲風圖")
+    sens.add_argument("--sobol-chart", metavar="PNG", help="另存第一個指標的 Sobol 指數圖")
+    sens.set_defaults(func=cmd_sensitivity)
+
+    similar = sub.add_parser("similar", help="模擬紀錄資料庫中參數最接近、或輸出最接近目標的過去紀錄")
+    similar.add_argument("--model", choices=list(MODEL_ARGUMENTS), default="v2", help="紀錄的模型，預設 v2")
+    for p, (label, lo, hi, default) in SWEEP_PARAMETERS.items():
+        similar.add_argument(f"--{p.replace('_', '-')}", dest=p, type=_number, help=f"{label}（只計入有指定的參數）")
+    similar.add_argument("--target", nargs="+", action="extend", default=[], metavar="輸出=目標值",
+                         help="改為找輸出最接近目標的紀錄，例如 膨發指數=2.1 酥脆度=5.8")
+    similar.add_argument("-k", type=int, default=10, help="筆數（有 --radius 時為上限），預設 10")
+    similar.add_argument("--radius", type=float, help="只列出正規化距離不超過此值的紀錄")
+    similar.add_argument("--db", default=os.environ.get("EXTRUSION_HISTORY_DB", "simulation_history.db"))
+    similar.add_argument("--json", action="store_true", help="以 JSON 輸出")
+    similar.set_defaults(func=cmd_similar)
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    try:
+        return args.func(args)
+    except (argparse.ArgumentTypeError, ValueError, KeyError, ImportError) as e:
+        parser.exit(2, f"錯誤：{e}\n")
@@ -0,0 +1,203 @@
+"""v2 批次結果的欄式格式。
+
+原本的批次結果是每列各帶一組 Python 字串（外觀、色澤、整句風味描述）的 DataFrame；
+百萬列時字串佔掉大部分記憶體與下載大小。這裡改成：
+
+- 膨發指數、酥脆度、水活性、黏性為 float32 陣列
+- 外觀、色澤、風味描述為類別代碼加一份類別字串（相同字串只存一次）
+- 風味組成為 6 × N 的 float32 權重矩陣（每種原料一列，依 MATERIALS 順序）
+
+匯出 Parquet / Arrow IPC 時各欄直接包成 Arrow 陣列、不複製，類別欄為 dictionary 欄位；
+需要給人看的 CSV 時才由 to_frame() 組回與 simulate_blended_frame 相同的欄位。
+"""
+
+import numpy as np
+
+from .batch import (
+    RESULT_COLUMNS,
+    blend_matrix,
+    blend_weights,
+    flavor_categories,
+    simulate_blended_batch,
+    used_materials,
+)
+from .materials import FLAVORS, MATERIALS
+from .metrics import timed
+
+METRIC_COLUMNS = RESULT_COLUMNS[:4]
+CATEGORY_COLUMNS = RESULT_COLUMNS[4:]
+APPEARANCE = ("偏密實", "膨鬆偏亮")
+COLOR = ("淺黃", "金黃色")
+COMPOSITION_PREFIX = "風味組成 "
+# 下載格式 → (副檔名, MIME)
+FORMATS = {
+    "parquet": (".parquet", "application/vnd.apache.parquet"),
+    "arrow": (".arrow", "application/vnd.apache.arrow.file"),
+    "csv": (".csv", "text/csv"),
+}
+# Arrow IPC 每個 record batch 的列數；CSV 每次展開字串的列數
+IPC_BATCH_ROWS = 65_536
+CSV_CHUNK_ROWS = 100_000
+
+
+class ColumnarResult:
+    """欄式批次結果；len() 為列數，nbytes 為所有陣列與類別字串的大小。
+
+    metrics：{欄位: float32 陣列}；codes / categories：外觀、色澤、風味描述的代碼與
+    類別字串；composition：6 × N 的風味組成權重；ratios：{原料: 輸入比例}，只含有用到的
+    原料，未使用的列為 NaN（同 simulate_blended_frame）。
+    """
+
+    def __init__(self, metrics, codes, categories, composition, ratios):
+        self.metrics = metrics
+        self.codes = codes
+        self.categories = categories
+        self.composition = composition
+        self.ratios = ratios
+
+    def __len__(self):
+        return self.composition.shape[1]
+
+    @property
+    def nbytes(self):
+        arrays = list(self.metrics.values()) + list(self.codes.values()) + list(self.ratios.values())
+        strings = sum(len(s.encode("utf-8")) for labels in self.categories.values() for s in labels)
+        return sum(a.nbytes for a in arrays) + self.composition.nbytes + strings
+
+    def slice(self, start, stop):
+        """第 start 到 stop 列（各陣列的檢視，不複製）。"""
+        return ColumnarResult(
+            {k: v[start:stop] for k, v in self.metrics.items()},
+            {k: v[start:stop] for k, v in self.codes.items()},
+            self.categories,
+            self.composition[:, start:stop],
+            {k: v[start:stop] for k, v in self.ratios.items()},
+        )
+
+    def head(self, n):
+        return self.slice(0, n)
+
+    def to_frame(self, labels=None):
+        """與 simulate_blended_frame 相同欄位的 DataFrame；文字欄為 pandas 類別欄，不展開字串。
+
+        labels 為 {欄位: 類別字串的 object 陣列} 時改為展開成字串欄。
+        """
+        import pandas as pd
+
+        columns = dict(self.metrics)
+        for k in CATEGORY_COLUMNS:
+            if labels is None:
+                columns[k] = pd.Categorical.from_codes(self.codes[k], self.categories[k])
+            else:
+                columns[k] = labels[k][self.codes[k]]
+        columns.update(self.ratios)
+        return pd.DataFrame(columns)
+
+    def iter_csv(self, chunk_rows=CSV_CHUNK_ROWS):
+        """逐塊產生 CSV 文字（第一塊含表頭），每次只展開一塊的字串。"""
+        # 類別很多時（例如連續的原料比例）pandas 寫類別欄很慢，每塊先展開成字串再寫
+        labels = {k: np.array(v, dtype=object) for k, v in self.categories.items()}
+        for start in range(0, max(len(self), 1), chunk_rows):
+            yield self.slice(start, start + chunk_rows).to_frame(labels).to_csv(index=False, header=start == 0)
+
+    def to_arrow(self):
+        """pyarrow.Table：數值欄直接包住 numpy 陣列，文字欄為 dictionary 欄位。"""
+        import json
+
+        import pyarrow as pa
+
+        arrays, names = [], []
+        for k, v in self.metrics.items():
+            arrays.append(pa.array(v))
+            names.append(k)
+        for k in CATEGORY_COLUMNS:
+            arrays.append(pa.DictionaryArray.from_arrays(pa.array(self.codes[k]), pa.array(self.categories[k], pa.string())))
+            names.append(k)
+        for j, mat in enumerate(MATERIALS):
+            arrays.append(pa.array(self.composition[j]))
+            names.append(COMPOSITION_PREFIX + mat)
+        for k, v in self.ratios.items():
+            # 未使用的原料（NaN）存成 null
+            arrays.append(pa.array(v, from_pandas=True))
+            names.append(k)
+        metadata = {"extrusion_core": json.dumps({"flavors": dict(zip(MATERIALS, FLAVORS))}, ensure_ascii=False)}
+        return pa.Table.from_arrays(arrays, names=names, metadata=metadata)
+
+    def write(self, sink, format="parquet"):
+        """寫入檔案路徑或檔案物件；format 為 parquet、arrow（IPC 檔案格式，不壓縮，可直接
+        映射讀取）或 csv。"""
+        if format == "csv":
+            with timed("csv.write", rows=len(self)):
+                if isinstance(sink, str):
+                    with open(sink, "w", encoding="utf-8", newline="") as f:
+                        f.writelines(self.iter_csv())
+                else:
+                    sink.writelines(self.iter_csv())
+            return
+        if format not in FORMATS:
+            raise ValueError(f"不支援的格式：{format}")
+        import pyarrow as pa
+
+        table = self.to_arrow()
+        with timed(f"{format}.write", rows=len(self)):
+            if format == "parquet":
+                import pyarrow.parquet as pq
+
+                pq.write_table(table, sink, compression="zstd")
+            else:
+                with pa.ipc.new_file(sink, table.schema) as writer:
+                    writer.write_table(table, max_chunksize=IPC_BATCH_ROWS)
+
+    def to_bytes(self, format="parquet"):
+        """整個檔案的內容（供下載按鈕）；Arrow 格式寫進同一塊緩衝區，最後只複製一次。"""
+        if format == "csv":
+            with timed("csv.write", rows=len(self)):
+                return "".join(self.iter_csv()).encode("utf-8")
+        import pyarrow as pa
+
+        sink = pa.BufferOutputStream()
+        self.write(sink, format)
+        return sink.getvalue().to_pybytes()
+
+
+def simulate_columnar(df, material_columns=None, workers=1):
+    """simulate_blended_frame 的欄式版本：輸入相同，回傳 ColumnarResult。
+
+    數值欄由 simulate_blended_batch（describe=False）計算，外觀、色澤與風味描述只算
+    類別代碼，每種組合的字串只組一次。
+    """
+    from .parallel import run_batch
+
+    with timed("batch.simulate", rows=len(df)):
+        ratios = blend_matrix(df)
+        temp = df["筒溫"].to_numpy(dtype=float)
+        results = run_batch(
+            simulate_blended_batch,
+            len(df),
+            workers=workers,
+            temp=temp,
+            rpm=df["轉速"].to_numpy(dtype=float),
+            moisture=df["水含量"].to_numpy(dtype=float),
+            fat=df["油脂含量"].to_numpy(dtype=float),
+            ratios=ratios,
+            describe=False,
+        )
+        ratios, weights = blend_weights(ratios)
+        flavor, labels = flavor_categories(ratios, weights)
+        codes = {
+            "外觀": (results["膨發指數"] > 2).astype(np.uint8),
+            "色澤": (temp >= 140).astype(np.uint8),
+            "風味描述": flavor.astype(np.int32),
+        }
+        used = ratios > 0
+        if material_columns is None:
+            material_columns = used_materials(df, used)
+        echoed = {mat: np.where(used[:, MATERIALS.index(mat)], ratios[:, MATERIALS.index(mat)], np.nan)
+                  for mat in material_columns}
+        return ColumnarResult(
+            {k: np.ascontiguousarray(results[k], dtype=np.float32) for k in METRIC_COLUMNS},
+            codes,
+            {"外觀": list(APPEARANCE), "色澤": list(COLOR), "風味描述": labels},
+            np.ascontiguousarray(weights.T, dtype=np.float32),
+            echoed,
+        )
@@ -0,0 +1,296 @@
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+import pandas as pd
+
+from .metrics import timed
+
+LEGACY_CSV = "simulation_history.csv"
+
+# 紀錄欄位（中文，與各版本 App 的欄位名稱相同）→ 資料表欄位
+FIELD_COLUMNS = {
+    "筒溫": "temp",
+    "轉速": "rpm",
+    "水": "moisture",
+    "水含量": "moisture",
+    "油": "fat",
+    "油脂": "fat",
+    "油脂含量": "fat",
+    "螺桿直徑": "screw_diameter",
+    "螺桿長度": "screw_length",
+    "喂料速率": "feed_rate",
+    "模口": "die_diameter",
+    "膨發指數": "expansion",
+    "酥脆度": "crisp",
+    "水活性": "water_activity",
+    "黏性": "stickiness",
+    "外觀": "appearance",
+    "色澤": "color",
+    "風味描述": "flavor",
+}
+PARAM_COLUMNS = ("temp", "rpm", "moisture", "fat", "screw_diameter", "screw_length", "feed_rate", "die_diameter")
+OUTPUT_COLUMNS = ("expansion", "crisp", "water_activity", "stickiness")
+TEXT_COLUMNS = ("appearance", "color", "flavor")
+# 查詢結果的顯示名稱（v2 原本 CSV 的欄位名稱）
+COLUMN_LABELS = {
+    "ts": "時間",
+    "model": "模型",
+    "temp": "筒溫",
+    "rpm": "轉速",
+    "moisture": "水",
+    "fat": "油",
+    "screw_diameter": "螺桿直徑",
+    "screw_length": "螺桿長度",
+    "feed_rate": "喂料速率",
+    "die_diameter": "模口",
+    "expansion": "膨發指數",
+    "crisp": "酥脆度",
+    "water_activity": "水活性",
+    "stickiness": "黏性",
+    "appearance": "外觀",
+    "color": "色澤",
+    "flavor": "風味描述",
+}
+
+_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    ts REAL NOT NULL,
+    model TEXT NOT NULL,
+    {", ".join(f"{c} REAL" for c in PARAM_COLUMNS + OUTPUT_COLUMNS)},
+    {", ".join(f"{c} TEXT" for c in TEXT_COLUMNS)},
+    extra TEXT
+);
+CREATE TABLE IF NOT EXISTS migrations (
+    source TEXT PRIMARY KEY,
+    rows INTEGER NOT NULL,
+    ts REAL NOT NULL
+)
+"""
+
+
+def _epoch(bound):
+    # 沒有時區的日期時間視為本機時間
+    if isinstance(bound, (int, float)):
+        return float(bound)
+    stamp = pd.Timestamp(bound)
+    if stamp.tzinfo is None:
+        stamp = stamp.tz_localize(datetime.now().astimezone().tzinfo)
+    return stamp.timestamp()
+
+
+def _to_row(record, model, ts):
+    row = {"ts": ts, "model": model}
+    extra = {}
+    for key, value in record.items():
+        column = FIELD_COLUMNS.get(key)
+        if column is None:
+            extra[key] = value.item() if hasattr(value, "item") else value
+        elif column in TEXT_COLUMNS:
+            row[column] = None if pd.isna(value) else str(value)
+        else:
+            row[column] = None if pd.isna(value) else float(value)
+    row["extra"] = json.dumps(extra, ensure_ascii=False) if extra else None
+    return row
+
+
+class HistoryStore:
+    """模擬紀錄資料庫：SQLite WAL 模式，參數欄位皆建索引。
+
+    append() 每筆立即寫入並提交（WAL 模式下單筆小交易很便宜），其他行程與
+    最近鄰索引馬上讀得到，行程被強制結束也不會遺失；append_many() 整批在
+    同一個交易中寫入。多個行程同時寫入由 SQLite 的檔案鎖處理（busy_timeout
+    期間會等待）。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(_SCHEMA)
+        for column in ("ts", "model") + PARAM_COLUMNS:
+            self._db.execute(f"CREATE INDEX IF NOT EXISTS idx_runs_{column} ON runs ({column})")
+        self._db.commit()
+
+    def append(self, record, model="v2", ts=None):
+        """加入一筆紀錄並立即提交；record 為 App 原本寫入 CSV 的 dict（中文欄位）。"""
+        self._insert([_to_row(record, model, time.time() if ts is None else ts)])
+
+    def append_many(self, records, model="v2", ts=None):
+        """整批加入，在同一個交易中寫入。"""
+        ts = time.time() if ts is None else ts
+        self._insert([_to_row(r, model, ts) for r in records])
+
+    def append_chunks(self, chunks, model="v2", ts=None, source=None):
+        """多塊紀錄（每塊為 record 的 list）在同一個交易中寫入，任何一塊失敗時全部
+        還原；回傳寫入列數。
+
+        指定 source（匯入來源的識別字串）時，交易一開始即取得寫入鎖，並在 migrations
+        表記下 source；已匯入過的 source 不再寫入，回傳 None。多個行程同時匯入同一
+        來源時只有一個會寫入。
+        """
+        ts = time.time() if ts is None else ts
+        rows = 0
+        with self._lock, self._db:
+            if source is not None:
+                self._db.execute("BEGIN IMMEDIATE")
+                if self._db.execute("SELECT 1 FROM migrations WHERE source = ?", (source,)).fetchone():
+                    return None
+            for records in chunks:
+                self._execute([_to_row(r, model, ts) for r in records])
+                rows += len(records)
+            if source is not None:
+                self._db.execute("INSERT INTO migrations VALUES (?, ?, ?)", (source, rows, time.time()))
+        return rows
+
+    def _insert(self, rows):
+        with self._lock, self._db:
+            self._execute(rows)
+
+    def _execute(self, rows):
+        columns = ("ts", "model") + PARAM_COLUMNS + OUTPUT_COLUMNS + TEXT_COLUMNS + ("extra",)
+        sql = f"INSERT INTO runs ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+        with timed("history.flush", rows=len(rows)):
+            self._db.executemany(sql, [tuple(row.get(c) for c in columns) for row in rows])
+
+    def count(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM runs").fetchone()[0]
+
+    def query(self, start=None, end=None, model=None, limit=None, newest_first=True, **ranges):
+        """依時間與參數範圍查詢，回傳 DataFrame（中文欄位名稱）。
+
+        start / end 為 epoch 秒數或 pandas 可解析的時間；ranges 以資料表欄位
+        名稱指定範圍，例如 temp=(120, 160)、expansion=(2.0, None)。
+        """
+        where, args = [], []
+        for column, bound in (("ts >= ?", start), ("ts <= ?", end)):
+            if bound is not None:
+                where.append(column)
+                args.append(_epoch(bound))
+        if model is not None:
+            where.append("model = ?")
+            args.append(model)
+        for column, (lo, hi) in ranges.items():
+            if column not in PARAM_COLUMNS + OUTPUT_COLUMNS:
+                raise ValueError(f"無法依欄位 {column} 查詢")
+            if lo is not None:
+                where.append(f"{column} >= ?")
+                args.append(lo)
+            if hi is not None:
+                where.append(f"{column} <= ?")
+                args.append(hi)
+        sql = "SELECT * FROM runs"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY ts DESC, id DESC" if newest_first else " ORDER BY ts, id"
+        if limit is not None:
+            sql += f" LIMIT {int(limit)}"
+        with self._lock, timed("history.query"):
+            df = pd.read_sql_query(sql, self._db, params=args)
+        return _display(df.drop(columns=["id"]))
+
+    def rows_after(self, after_id, columns, model=None, limit=None):
+        """id 大於 after_id 的紀錄（依 id 排序），回傳 (ids, N × len(columns) 的 float 陣列)；
+        供最近鄰索引逐步讀入新紀錄，缺值為 NaN。"""
+        import numpy as np
+
+        unknown = set(columns) - set(PARAM_COLUMNS + OUTPUT_COLUMNS)
+        if unknown:
+            raise ValueError(f"無法讀取欄位 {', '.join(sorted(unknown))}")
+        sql = f"SELECT id, {', '.join(columns)} FROM runs WHERE id > ?"
+        args = [int(after_id)]
+        if model is not None:
+            sql += " AND model = ?"
+            args.append(model)
+        sql += " ORDER BY id"
+        if limit is not None:
+            sql += f" LIMIT {int(limit)}"
+        with self._lock, timed("history.query"):
+            rows = self._db.execute(sql, args).fetchall()
+        values = np.array(rows, dtype=float).reshape(len(rows), len(columns) + 1)
+        return values[:, 0].astype(np.int64), values[:, 1:]
+
+    def fetch(self, ids):
+        """依 id 取出紀錄，回傳 DataFrame（中文欄位名稱，索引為 id，順序同 ids）。"""
+        ids = [int(i) for i in ids]
+        with self._lock, timed("history.query"):
+            df = pd.read_sql_query(f"SELECT * FROM runs WHERE id IN ({', '.join('?' * len(ids)) or 'NULL'})",
+                                   self._db, params=ids)
+        return _display(df.set_index("id").reindex(ids))
+
+    def close(self):
+        self._db.close()
+
+
+def _display(df):
+    local = datetime.now().astimezone().tzinfo
+    df["ts"] = pd.to_datetime(df["ts"], unit="s", utc=True).dt.tz_convert(local).dt.tz_localize(None)
+    if len(df):
+        # 各版本記錄的參數不同，整欄皆空的就不顯示
+        df = df.dropna(axis=1, how="all")
+    return df.rename(columns=COLUMN_LABELS)
+
+
+def migrate_csv(csv_path, store, model="v2", chunksize=50_000):
+    """一次性匯入舊的 simulation_history.csv，完成後改名為 .migrated 避免重複匯入。
+
+    舊檔沒有時間欄位，所有列的時間記為檔案最後修改時間。整個檔案在同一個交易中
+    匯入，中途失敗時全部還原，下次重新匯入不會重複；匯入過的檔案（路徑、大小與修改
+    時間）記在資料庫中，多個行程同時啟動時只會匯入一次。回傳匯入列數（已由其他行程
+    匯入時為 0）。
+    """
+    try:
+        stat = os.stat(csv_path)
+    except FileNotFoundError:
+        # 其他行程剛匯入完並改名
+        return 0
+    source = f"{os.path.abspath(csv_path)}:{stat.st_size}:{stat.st_mtime_ns}"
+    chunks = (chunk.to_dict("records") for chunk in pd.read_csv(csv_path, chunksize=chunksize))
+    rows = store.append_chunks(chunks, model=model, ts=stat.st_mtime, source=source)
+    try:
+        os.replace(csv_path, csv_path + ".migrated")
+    except FileNotFoundError:
+        pass
+    return rows or 0
+
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def get_history():
+    """整個行程共用的紀錄庫，路徑由 EXTRUSION_HISTORY_DB 指定（預設 simulation_history.db）。
+
+    第一次開啟時若目錄中還有舊的 simulation_history.csv，會自動匯入一次。
+    """
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = HistoryStore(os.environ.get("EXTRUSION_HISTORY_DB", "simulation_history.db"))
+            if os.path.exists(LEGACY_CSV):
+                migrate_csv(LEGACY_CSV, _shared)
+        return _shared
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="匯入舊的 simulation_history.csv 到模擬紀錄資料庫")
+    parser.add_argument("csv", nargs="?", default=LEGACY_CSV)
+    parser.add_argument("--db", default=os.environ.get("EXTRUSION_HISTORY_DB", "simulation_history.db"))
+    parser.add_argument("--model", default="v2")
+    args = parser.parse_args(argv)
+    store = HistoryStore(args.db)
+    rows = migrate_csv(args.csv, store, model=args.model)
+    store.close()
+    print(f"已匯入 {rows} 筆紀錄到 {args.db}")
+
+
+if __name__ == "__main__":
+    main()
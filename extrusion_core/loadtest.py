@@ -0,0 +1,165 @@
+"""模擬服務的壓力測試：多條 keep-alive 連線同時送單筆請求，回報吞吐量、
+p50 / p90 / p99 延遲（僅計成功請求）與各狀態碼次數；--bulk 改測 NDJSON 批次端點。
+只用標準函式庫。
+
+    python -m extrusion_core.server --port 8765 &
+    python -m extrusion_core.loadtest --port 8765 --concurrency 64 --requests 20000
+    python -m extrusion_core.loadtest --port 8765 --bulk 200000 --model v35
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+
+import numpy as np
+
+from .cli import MODEL_ARGUMENTS
+from .materials import MATERIALS
+from .sweep import SWEEP_PARAMETERS
+
+
+def random_records(model, n, seed=0):
+    """n 筆隨機請求內容（製程參數在滑桿範圍內，兩種原料混合）。"""
+    rng = np.random.default_rng(seed)
+    records = []
+    for _ in range(n):
+        record = {p: int(rng.integers(SWEEP_PARAMETERS[p][1], SWEEP_PARAMETERS[p][2] + 1)) for p in MODEL_ARGUMENTS[model]}
+        a, b = rng.choice(len(MATERIALS), 2, replace=False)
+        share = int(rng.integers(0, 11)) * 10
+        record["blend"] = {MATERIALS[a]: share, MATERIALS[b]: 100 - share}
+        records.append(record)
+    return records
+
+
+async def _read_response(reader):
+    status = int((await reader.readline()).split()[1])
+    length, keep_alive = 0, True
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        if name.lower() == "content-length":
+            length = int(value)
+        elif name.lower() == "connection":
+            keep_alive = value.strip().lower() != "close"
+    return status, await reader.readexactly(length), keep_alive
+
+
+async def _client(host, port, path, bodies, latencies, statuses):
+    writer = None
+    try:
+        for body in bodies:
+            start = time.perf_counter()
+            try:
+                if writer is None:
+                    reader, writer = await asyncio.open_connection(host, port)
+                writer.write(f"POST {path} HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json\r\n"
+                             f"Content-Length: {len(body)}\r\n\r\n".encode("latin-1") + body)
+                await writer.drain()
+                status, _, keep_alive = await _read_response(reader)
+            except (ConnectionError, asyncio.IncompleteReadError, IndexError, ValueError):
+                # 連線中斷或回應不完整，記為 "conn" 並在下一筆重新連線
+                status, keep_alive = "conn", False
+            if status == 200:
+                latencies.append(time.perf_counter() - start)
+            statuses[status] = statuses.get(status, 0) + 1
+            if not keep_alive and writer is not None:
+                writer.close()
+                writer = None
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+async def run_single(host, port, model, requests, concurrency):
+    bodies = [json.dumps(r, ensure_ascii=False).encode("utf-8") for r in random_records(model, requests)]
+    latencies, statuses = [], {}
+    start = time.perf_counter()
+    await asyncio.gather(*(
+        _client(host, port, f"/simulate/{model}", bodies[i::concurrency], latencies, statuses)
+        for i in range(concurrency)
+    ))
+    elapsed = time.perf_counter() - start
+    # 延遲分位數只計成功（200）的請求；被拒絕的請求見 statuses
+    ms = np.array(latencies or [0.0]) * 1000
+    return {
+        "mode": "single",
+        "model": model,
+        "requests": requests,
+        "concurrency": concurrency,
+        "seconds": elapsed,
+        "requests_per_s": requests / elapsed,
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p90_ms": float(np.percentile(ms, 90)),
+        "p99_ms": float(np.percentile(ms, 99)),
+        "max_ms": float(ms.max()),
+        "statuses": statuses,
+    }
+
+
+async def run_bulk(host, port, model, rows):
+    payload = b"\n".join(json.dumps(r, ensure_ascii=False).encode("utf-8") for r in random_records(model, rows))
+    start = time.perf_counter()
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write(f"POST /bulk/{model} HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/x-ndjson\r\n"
+                 f"Content-Length: {len(payload)}\r\n\r\n".encode("latin-1"))
+
+    async def send():
+        for i in range(0, len(payload), 1 << 20):
+            writer.write(payload[i:i + (1 << 20)])
+            await writer.drain()
+
+    sender = asyncio.ensure_future(send())
+    status = int((await reader.readline()).split()[1])
+    while (await reader.readline()) not in (b"\r\n", b""):
+        pass
+    results = errors = 0
+    first = None
+    while True:
+        size = int(await reader.readline(), 16)
+        if size == 0:
+            break
+        chunk = await reader.readexactly(size)
+        await reader.readline()
+        first = first or time.perf_counter() - start
+        for line in chunk.splitlines():
+            results += 1
+            errors += b'"error"' in line
+    await sender
+    writer.close()
+    elapsed = time.perf_counter() - start
+    return {"mode": "bulk", "model": model, "rows": rows, "status": status, "results": results, "errors": errors,
+            "seconds": elapsed, "rows_per_s": rows / elapsed, "first_chunk_ms": (first or 0) * 1000}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m extrusion_core.loadtest", description="模擬服務壓力測試")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--model", choices=("v2", "v3", "v35"), default="v2")
+    parser.add_argument("--requests", type=int, default=20_000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--bulk", type=int, metavar="ROWS", help="改測 /bulk 端點，送出 ROWS 行 NDJSON")
+    parser.add_argument("--json", action="store_true", help="以 JSON 輸出結果")
+    args = parser.parse_args(argv)
+    if args.bulk:
+        result = asyncio.run(run_bulk(args.host, args.port, args.model, args.bulk))
+    else:
+        result = asyncio.run(run_single(args.host, args.port, args.model, args.requests, args.concurrency))
+    if args.json:
+        print(json.dumps(result, ensure_ascii=False))
+    elif result["mode"] == "bulk":
+        print(f"bulk {result['model']}：{result['rows']:,} 行，{result['seconds']:.2f} 秒，"
+              f"{result['rows_per_s']:,.0f} 行/秒，第一塊 {result['first_chunk_ms']:.0f} ms，錯誤 {result['errors']}")
+    else:
+        print(f"{result['model']}：{result['requests']:,} 筆 × {result['concurrency']} 連線，{result['seconds']:.2f} 秒，"
+              f"{result['requests_per_s']:,.0f} 筆/秒；p50 {result['p50_ms']:.2f} ms，p90 {result['p90_ms']:.2f} ms，"
+              f"p99 {result['p99_ms']:.2f} ms，最大 {result['max_ms']:.1f} ms；狀態碼 {result['statuses']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,58 @@
+import numpy as np
+
+# --------- 原料表：列為原料編號（MATERIALS 的索引），欄為 PROPERTIES ---------
+MATERIALS = ("玉米粉", "小麥粉", "裸麥粉", "高蛋白粉", "馬鈴薯澱粉", "全麥粉")
+MATERIAL_IDS = {mat: i for i, mat in enumerate(MATERIALS)}
+PROPERTIES = ("expansion", "crisp")
+
+# 各版本 App 原本的原料數值不同（例如高蛋白粉酥脆度 v2 為 4.0、v3.5 為 3.5），
+# 依版本分表保存，各模型在 models.MODELS 中指定使用哪一張
+MATERIAL_TABLES = {
+    # v2 / v3 / v3.5 簡潔版
+    "v2": np.array([
+        [2.0, 6.0],
+        [1.8, 5.5],
+        [1.5, 5.0],
+        [1.2, 4.0],
+        [2.2, 6.5],
+        [1.6, 5.2],
+    ]),
+    # v3.5 解釋版 / 紀錄版
+    "v35": np.array([
+        [2.0, 6.0],
+        [1.8, 5.5],
+        [1.5, 5.0],
+        [1.2, 3.5],
+        [2.2, 4.5],
+        [1.3, 4.2],
+    ]),
+}
+FLAVOR_LABELS = {
+    "v2": ("甜香", "穀香", "堅果風", "豆粉味", "脆口澱粉香", "麩皮香、纖維感"),
+    "v35": ("甜香", "穀香", "堅果風", "麥皮香", "黏稠", "纖維感"),
+}
+for _table in MATERIAL_TABLES.values():
+    _table.flags.writeable = False
+
+# 常用欄位的唯讀檢視
+EXPANSION, CRISP = MATERIAL_TABLES["v2"].T
+FLAVORS = FLAVOR_LABELS["v2"]
+V35_EXPANSION, V35_CRISP = MATERIAL_TABLES["v35"].T
+V35_FLAVORS = FLAVOR_LABELS["v35"]
+
+
+def blend_vector(blend_dict):
+    """{原料: 比例} 轉成依原料編號排列的 1×6 比例矩陣；未知的原料名稱會報 KeyError。"""
+    ratios = np.zeros((1, len(MATERIALS)))
+    for mat, ratio in blend_dict.items():
+        ratios[0, MATERIAL_IDS[mat]] += ratio
+    return ratios
+
+
+def get_flavor_profiles(table="v2"):
+    """舊版 App 的 {原料: {expansion, crisp, flavor}} 格式，僅供顯示或相容用途。"""
+    values, flavors = MATERIAL_TABLES[table], FLAVOR_LABELS[table]
+    return {
+        mat: {"expansion": float(values[i, 0]), "crisp": float(values[i, 1]), "flavor": flavors[i]}
+        for i, mat in enumerate(MATERIALS)
+    }
@@ -0,0 +1,109 @@
+"""長時間執行的記憶體檢查：模擬 App 連續按 🚀 執行模擬 N 次（每次參數都不同，
+快取全部未命中），每次都計算結果並畫長條圖，記錄行程常駐記憶體（RSS）。
+
+    python -m extrusion_core.memcheck --runs 10000
+    python -m extrusion_core.memcheck --runs 2000 --pyplot   # 對照：舊寫法 plt.subplots() 不關閉
+
+暖機（前 --warmup 比例的次數，快取在此期間填滿）之後 RSS 增加超過 --tolerance MB
+即視為記憶體洩漏，結束代碼為 1。快取預設只給 4 MB，讓它在暖機期間就填滿，
+之後的增長才是洩漏。
+"""
+
+import argparse
+import os
+import sys
+import time
+import warnings
+from io import BytesIO
+
+import numpy as np
+
+from .cache import ResultCache, get_cache, make_key, shared_cache
+from .materials import MATERIALS
+
+_KEYS = ["膨發指數", "酥脆度", "水活性", "黏性"]
+
+
+def rss_mb():
+    """目前行程的常駐記憶體（MB）；非 Linux 平台改用峰值。"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except OSError:
+        import resource
+
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _pyplot_png(keys, vals):
+    # 舊版 App 的寫法：figure 留在 pyplot 的全域清單中不會釋放
+    import matplotlib
+
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    fig, ax = plt.subplots()
+    ax.bar(keys, vals)
+    buffer = BytesIO()
+    fig.savefig(buffer, format="png")
+    return buffer.getvalue()
+
+
+def run(runs, pyplot=False, sample_every=100, seed=0, progress=None):
+    """執行 runs 次模擬＋畫圖，回傳 [(次數, RSS MB)]。"""
+    from .charts import bar_chart_png
+    from .models import MODEL_VERSIONS, simulate_v2
+
+    render = _pyplot_png if pyplot else bar_chart_png
+    cache = get_cache()
+    rng = np.random.default_rng(seed)
+    samples = [(0, rss_mb())]
+    for i in range(1, runs + 1):
+        temp, rpm = int(rng.integers(60, 181)), int(rng.integers(100, 601))
+        moisture, fat = int(rng.integers(10, 26)), int(rng.integers(0, 16))
+        a, b = rng.choice(len(MATERIALS), 2, replace=False)
+        share = int(rng.integers(0, 21)) * 5
+        blend = {MATERIALS[a]: share, MATERIALS[b]: 100 - share}
+        results = cache.get_or_compute(
+            make_key(MODEL_VERSIONS["v2"], temp, rpm, moisture, fat, blend=blend),
+            lambda: simulate_v2(temp, rpm, moisture, fat, blend),
+        )
+        render(_KEYS, [results[k] for k in _KEYS])
+        if i % sample_every == 0 or i == runs:
+            samples.append((i, rss_mb()))
+            if progress is not None:
+                progress(i, samples[-1][1])
+    return samples
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m extrusion_core.memcheck", description="連續模擬＋畫圖的記憶體檢查")
+    parser.add_argument("--runs", type=int, default=10_000)
+    parser.add_argument("--warmup", type=float, default=0.2, help="暖機比例，預設 0.2")
+    parser.add_argument("--tolerance", type=float, default=8.0, help="暖機後允許的 RSS 增加（MB），預設 8")
+    parser.add_argument("--cache-mb", type=float, default=4.0, help="結果快取上限（MB），預設 4")
+    parser.add_argument("--pyplot", action="store_true", help="改用舊版 plt.subplots() 寫法對照")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    started = time.perf_counter()
+
+    def report(i, mb):
+        print(f"{i:>8,} 次  RSS {mb:8.1f} MB  {time.perf_counter() - started:7.1f} 秒", file=sys.stderr)
+
+    # 檢查期間改用 --cache-mb 大小的共用快取，警告過濾也只在檢查期間有效
+    with warnings.catch_warnings(), shared_cache(ResultCache(max_mb=args.cache_mb)) as cache:
+        # 沒有中文字型的環境每張圖都會警告缺字，與記憶體無關
+        warnings.filterwarnings("ignore", message="Glyph .* missing from font")
+        samples = run(args.runs, pyplot=args.pyplot, sample_every=max(args.runs // 20, 1), seed=args.seed,
+                      progress=report)
+    warm = [mb for i, mb in samples if i >= args.runs * args.warmup]
+    growth = warm[-1] - warm[0]
+    stats = cache.stats()
+    print(f"暖機後 RSS 增加 {growth:+.1f} MB（容許 {args.tolerance} MB），"
+          f"快取 {stats['entries']:,} 筆 {stats['mb']:.1f} MB，淘汰 {stats['evictions']:,} 筆")
+    return 0 if growth <= args.tolerance else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
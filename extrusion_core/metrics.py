@@ -0,0 +1,206 @@
+"""執行階段計時與計數：各階段耗時的直方圖、處理列數等計數器，可輸出 Prometheus
+文字格式或 JSON Lines 紀錄，另有 cProfile 包裝供下載單次執行的分析結果。
+
+    with timed("batch.simulate", rows=len(df)):
+        ...
+
+計時本身約 1–2 微秒，一律開啟；是否顯示或寫檔由呼叫端決定。環境變數：
+EXTRUSION_METRICS_FILE（Prometheus 文字檔路徑，供 node_exporter textfile collector
+讀取）、EXTRUSION_METRICS_LOG（每個階段一行 JSON 的紀錄檔）。
+"""
+
+import bisect
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# 直方圖的上界（秒）
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Metrics:
+    """執行緒安全的計數器與直方圖；名稱為階段名稱（例如 chart.render）。"""
+
+    def __init__(self, log_path=None):
+        self.log_path = log_path
+        self.started = time.time()
+        self._counters = {}
+        self._hists = {}
+        self._lock = threading.Lock()
+
+    def count(self, name, n=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + n
+
+    def observe(self, stage, seconds, rows=None):
+        """記錄一次階段耗時；rows 指定時一併累計處理列數（用來算每秒列數）。"""
+        with self._lock:
+            hist = self._hists.get(stage)
+            if hist is None:
+                hist = self._hists[stage] = {"buckets": [0] * (len(BUCKETS) + 1), "count": 0, "sum": 0.0,
+                                             "max": 0.0, "rows": 0}
+            hist["buckets"][bisect.bisect_left(BUCKETS, seconds)] += 1
+            hist["count"] += 1
+            hist["sum"] += seconds
+            hist["max"] = max(hist["max"], seconds)
+            if rows is not None:
+                hist["rows"] += rows
+        if self.log_path:
+            event = {"ts": time.time(), "stage": stage, "seconds": round(seconds, 6)}
+            if rows is not None:
+                event["rows"] = rows
+            with open(self.log_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(event) + "\n")
+
+    @contextmanager
+    def timed(self, stage, rows=None):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start, rows)
+
+    def snapshot(self):
+        """各階段的次數、總秒數、平均、最大值、p50 / p95（由直方圖估計）與每秒列數。"""
+        with self._lock:
+            hists = {k: dict(v, buckets=list(v["buckets"])) for k, v in self._hists.items()}
+            counters = dict(self._counters)
+        stages = {}
+        for stage, h in sorted(hists.items()):
+            stages[stage] = {
+                "count": h["count"],
+                "total_s": h["sum"],
+                "mean_s": h["sum"] / h["count"],
+                "p50_s": _quantile(h, 0.5),
+                "p95_s": _quantile(h, 0.95),
+                "max_s": h["max"],
+                "rows": h["rows"],
+                "rows_per_s": h["rows"] / h["sum"] if h["rows"] and h["sum"] else None,
+            }
+        return {"stages": stages, "counters": counters}
+
+    def prometheus_text(self, extra_gauges=None):
+        """Prometheus 文字格式（extrusion_stage_seconds 直方圖、extrusion_rows_total 等）。"""
+        with self._lock:
+            hists = {k: dict(v, buckets=list(v["buckets"])) for k, v in self._hists.items()}
+            counters = dict(self._counters)
+        lines = ["# TYPE extrusion_stage_seconds histogram"]
+        for stage, h in sorted(hists.items()):
+            cumulative = 0
+            for bound, n in zip(BUCKETS + ("+Inf",), h["buckets"]):
+                cumulative += n
+                lines.append(f'extrusion_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+            lines.append(f'extrusion_stage_seconds_sum{{stage="{stage}"}} {h["sum"]:.6f}')
+            lines.append(f'extrusion_stage_seconds_count{{stage="{stage}"}} {h["count"]}')
+        lines.append("# TYPE extrusion_rows_total counter")
+        for stage, h in sorted(hists.items()):
+            if h["rows"]:
+                lines.append(f'extrusion_rows_total{{stage="{stage}"}} {h["rows"]}')
+        lines.append("# TYPE extrusion_events_total counter")
+        for name, n in sorted(counters.items()):
+            lines.append(f'extrusion_events_total{{name="{name}"}} {n}')
+        for name, value in (extra_gauges or {}).items():
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path, extra_gauges=None):
+        # 先寫暫存檔再改名，textfile collector 不會讀到寫一半的檔案
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(self.prometheus_text(extra_gauges))
+        os.replace(tmp, path)
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._hists.clear()
+            self.started = time.time()
+
+
+def _quantile(hist, q):
+    # 直方圖估計的分位數：取累計次數達 q 的那一格上界（最後一格用最大值）
+    target = q * hist["count"]
+    cumulative = 0
+    for bound, n in zip(BUCKETS, hist["buckets"]):
+        cumulative += n
+        if cumulative >= target:
+            return min(bound, hist["max"])
+    return hist["max"]
+
+
+def cache_gauges():
+    """共用結果快取的統計，格式同 prometheus_text 的 extra_gauges。"""
+    from .cache import get_cache
+
+    stats = get_cache().stats()
+    return {
+        "extrusion_cache_hits": stats["hits"],
+        "extrusion_cache_misses": stats["misses"],
+        "extrusion_cache_entries": stats["entries"],
+        "extrusion_cache_bytes": int(stats["mb"] * 1024 * 1024),
+        "extrusion_cache_evictions": stats["evictions"],
+    }
+
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def get_metrics():
+    """整個行程共用的計量器；EXTRUSION_METRICS_LOG 指定時同時寫 JSON Lines 紀錄。"""
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = Metrics(log_path=os.environ.get("EXTRUSION_METRICS_LOG") or None)
+        return _shared
+
+
+def timed(stage, rows=None):
+    """記錄到共用計量器的計時區塊。"""
+    return get_metrics().timed(stage, rows)
+
+
+def export():
+    """EXTRUSION_METRICS_FILE 指定時寫出 Prometheus 文字檔（含快取統計）。"""
+    path = os.environ.get("EXTRUSION_METRICS_FILE")
+    if path:
+        get_metrics().write_prometheus(path, cache_gauges())
+
+
+class Profile:
+    """以 cProfile 分析 with 區塊；結束後 .text() 為前幾名的文字摘要，.dump() 為
+    可用 snakeviz 等工具開啟的 .prof bytes。"""
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self._profile = None
+
+    def __enter__(self):
+        if self.enabled:
+            import cProfile
+
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        return self
+
+    def __exit__(self, *exc):
+        if self._profile is not None:
+            self._profile.disable()
+        return False
+
+    def text(self, sort="cumulative", limit=30):
+        import io
+        import pstats
+
+        out = io.StringIO()
+        pstats.Stats(self._profile, stream=out).sort_stats(sort).print_stats(limit)
+        return out.getvalue()
+
+    def dump(self):
+        import marshal
+
+        self._profile.create_stats()
+        return marshal.dumps(self._profile.stats)
@@ -0,0 +1,288 @@
+import numpy as np
+
+from .batch import (
+    blend_sums,
+    blend_weights,
+    broadcast_outputs,
+    flavor_descriptions,
+    py_round,
+    round_if,
+    simulate_blended_batch,
+    table_columns,
+)
+from .materials import (
+    CRISP,
+    EXPANSION,
+    FLAVORS,
+    MATERIAL_IDS,
+    V35_CRISP,
+    V35_EXPANSION,
+    V35_FLAVORS,
+    blend_vector,
+)
+
+V35_RESULT_COLUMNS = ("膨發指數", "酥脆度", "水活性", "黏性", "體積密度", "桶內壓力 (bar)", "預估能耗 (kWh/kg)")
+V35S_RESULT_COLUMNS = ("膨發指數", "酥脆度", "水活性", "黏性", "體積密度", "桶內壓力（bar）", "預估能耗（kWh/kg）", "風味描述")
+
+
+# --------- v3：能耗預測 ---------
+def estimate_energy_batch(temp, rpm, moisture, fat, screw_diameter_mm, screw_length_mm, rounding=True):
+    """estimate_energy_consumption 的整批版本；rounding=False 時不四捨五入（敏感度分析用）。"""
+    temp, rpm, moisture, fat, screw_diameter_mm, screw_length_mm = (
+        np.asarray(v, dtype=float) for v in (temp, rpm, moisture, fat, screw_diameter_mm, screw_length_mm)
+    )
+    base_energy = 0.12
+    energy = (
+        base_energy
+        + (temp - 100) * 0.0008
+        + (rpm - 300) * 0.0005
+        + screw_length_mm / 1000 * 0.05
+        - moisture * 0.002
+        - fat * 0.003
+        + (screw_diameter_mm / 100) * 0.02
+    )
+    return round_if(np.maximum(energy, 0.05), 3, rounding)
+
+
+def simulate_with_energy_batch(temp, rpm, moisture, fat, ratios, screw_diameter, screw_length, describe=True,
+                               table=None, rounding=True):
+    """simulate_with_energy 的整批版本，回傳欄位陣列；rounding 同 simulate_blended_batch。"""
+    result = simulate_blended_batch(temp, rpm, moisture, fat, ratios, describe=describe, table=table,
+                                    rounding=rounding)
+    shape = result["膨發指數"].shape
+    screw_diameter = np.asarray(screw_diameter, dtype=float)
+    screw_length = np.asarray(screw_length, dtype=float)
+    energy = estimate_energy_batch(temp, rpm, moisture, fat, screw_diameter, screw_length, rounding=rounding)
+    shape = np.broadcast_shapes(shape, energy.shape)
+    result["螺桿直徑（mm）"] = screw_diameter
+    result["螺桿長度（mm）"] = screw_length
+    result["預估能耗（kWh/kg）"] = energy
+    return broadcast_outputs(result, shape)
+
+
+# --------- v3.5：含螺桿幾何、喂料與模口 ---------
+def simulate_v35_batch(temp, rpm, moisture, fat, screw_diameter, screw_length, feed_rate, die_diameter, ratios,
+                       table=None, rounding=True):
+    """v3.5 simulate() 的整批版本。
+
+    製程參數可為純量、長度 N 的陣列，或可互相廣播的多維網格（參數掃描用）；
+    ratios 為 N×6 或 1×6 的原料比例。回傳 V35_RESULT_COLUMNS 各欄（廣播後
+    的形狀），另加「風味比例」：N×6 整數矩陣，對應逐筆版本回傳的
+    flavor_counts（欄位順序同 MATERIALS）。table 見 batch.table_columns；rounding=False
+    時數值欄位不四捨五入（敏感度分析用）。
+    """
+    _, weights = blend_weights(ratios)
+    temp, rpm, moisture, fat, screw_diameter, feed_rate = (
+        np.asarray(v, dtype=float) for v in (temp, rpm, moisture, fat, screw_diameter, feed_rate)
+    )
+    (expansion_t, crisp_t), samples = table_columns(table, V35_EXPANSION, V35_CRISP)
+    shape = np.broadcast_shapes(
+        weights.shape[:1], temp.shape, rpm.shape, moisture.shape, fat.shape, screw_diameter.shape, feed_rate.shape,
+        samples,
+    )
+    expansion, crisp, sticky = blend_sums(weights, expansion_t, crisp_t, 10 - crisp_t)
+    # 逐筆版本對每種原料取 round(w * 100)，未使用的原料不列入
+    flavor_pct = np.where(weights > 0, np.rint(weights * 100), 0).astype(np.int64)
+    outputs = {
+        "膨發指數": round_if(expansion, 2, rounding),
+        "酥脆度": round_if(crisp, 2, rounding),
+        "水活性": round_if(0.65 + 0.01 * (moisture - 15) - 0.005 * fat, 2, rounding),
+        "黏性": round_if(sticky, 2, rounding),
+        "體積密度": round_if(0.2 + 0.005 * (100 - expansion * 50), 2, rounding),
+        "桶內壓力 (bar)": round_if(0.1 * rpm * moisture / screw_diameter, 2, rounding),
+        "預估能耗 (kWh/kg)": round_if((temp * rpm * (1 + fat / 10)) / (100000 + feed_rate * 100), 3, rounding),
+    }
+    result = broadcast_outputs(outputs, shape)
+    result["風味比例"] = flavor_pct
+    return result
+
+
+# --------- v3.5 簡潔版：密度、壓力與能耗公式與解釋版不同，使用 v2 原料表 ---------
+def simulate_v35s_batch(temp, rpm, moisture, fat, feed_rate, ratios, describe=True):
+    """v3.5 簡潔版 simulate() 的整批版本，回傳 V35S_RESULT_COLUMNS 各欄。"""
+    ratios, weights = blend_weights(ratios)
+    temp, rpm, moisture, fat, feed_rate = (np.asarray(v, dtype=float) for v in (temp, rpm, moisture, fat, feed_rate))
+    shape = np.broadcast_shapes(weights.shape[:1], temp.shape, rpm.shape, moisture.shape, fat.shape, feed_rate.shape)
+    expansion, crisp = blend_sums(weights, EXPANSION, CRISP)
+    outputs = {
+        "膨發指數": py_round(expansion, 2),
+        "酥脆度": py_round(crisp, 2),
+        "水活性": py_round(0.6 + moisture * 0.01 - temp * 0.001, 2),
+        "黏性": py_round(1 + fat * 0.1 + moisture * 0.1 - rpm * 0.002, 2),
+        "體積密度": py_round(1.2 / (expansion + 0.1), 2),
+        "桶內壓力（bar）": py_round((temp * rpm * (1 - moisture / 100)) / 10000, 2),
+        "預估能耗（kWh/kg）": py_round((temp * rpm * feed_rate * (1 - moisture / 100)) / 10000000, 3),
+    }
+    if describe:
+        outputs["風味描述"] = flavor_descriptions(ratios, weights, FLAVORS, prefix="")
+    return broadcast_outputs(outputs, shape)
+
+
+# --------- 單筆介面：各 App 原本的 simulate 函數 ---------
+# 互動操作與 HTTP 單筆請求每次只算一筆，建 1 列的 numpy 陣列再拆開比公式本身慢數十倍，
+# 所以單筆走純 Python 的快速路徑：運算順序與整批版本相同，內建 round() 與 py_round
+# 一致，結果逐位元相同（僅接近浮點上限、乘以 10**ndigits 會溢位的值，round() 保留原值而
+# py_round 得到 inf）。除以 0、NaN 等特殊輸入改用 1 列的整批計算（沿用 numpy 的
+# inf / nan 結果與錯誤訊息）。
+_SCALAR_TABLES = {
+    "v2": (EXPANSION.tolist(), CRISP.tolist()),
+    "v35": (V35_EXPANSION.tolist(), V35_CRISP.tolist(), (10 - V35_CRISP).tolist()),
+}
+_SCALAR_FALLBACK = (ZeroDivisionError, ValueError, OverflowError, TypeError)
+
+
+def _first_row(outputs):
+    # tolist() 會把 numpy 數值轉回 Python 內建型別，與原本逐筆函數的回傳值相同
+    return {k: v.tolist()[0] for k, v in outputs.items()}
+
+
+def _scalar_blend(blend_dict, tables):
+    # 同 blend_weights + blend_sums：負值視為 0%，依原料順序逐項累加；未使用的原料
+    # 加的是 0.0，略過不影響結果（沒有任何原料時加權和為 0）。
+    # 回傳 ([(原料編號, 權重), ...], 各表的加權和)
+    used = sorted((MATERIAL_IDS[mat], float(ratio)) for mat, ratio in blend_dict.items())
+    used = [(j, r) for j, r in used if r > 0]
+    total = 0.0
+    for _, r in used:
+        total += r
+    weights = [(j, r / total) for j, r in used]
+    sums = []
+    for table in tables:
+        value = 0.0
+        for j, w in weights:
+            value = value + table[j] * w
+        sums.append(value)
+    return weights, sums
+
+
+def _flavor_text(weights, prefix):
+    return prefix + "、".join(f"{FLAVORS[j]}（{int(w * 100)}%）" for j, w in weights)
+
+
+def _v2_scalar(temp, rpm, moisture, fat, blend_dict):
+    weights, (expansion, crisp) = _scalar_blend(blend_dict, _SCALAR_TABLES["v2"])
+    temp, rpm, moisture, fat = float(temp), float(rpm), float(moisture), float(fat)
+    expansion = round(expansion + (temp - 100) * 0.005 - moisture * 0.01 + fat * 0.01, 2)
+    return {
+        "膨發指數": expansion,
+        "酥脆度": round(crisp + (rpm - 300) * 0.005 - fat * 0.1 + moisture * 0.05, 2),
+        "水活性": round(0.6 + moisture * 0.01 - temp * 0.001, 2),
+        "黏性": round(1 + fat * 0.1 + moisture * 0.1 - rpm * 0.002, 2),
+        "外觀": "膨鬆偏亮" if expansion > 2 else "偏密實",
+        "色澤": "金黃色" if temp >= 140 else "淺黃",
+        "風味描述": _flavor_text(weights, "綜合風味："),
+    }
+
+
+def simulate_v2(temp, rpm, moisture, fat, blend_dict):
+    """v2 的單筆模擬（原 simulate_blended_formula），風味描述依 MATERIALS 順序列出原料。"""
+    try:
+        return _v2_scalar(temp, rpm, moisture, fat, blend_dict)
+    except _SCALAR_FALLBACK:
+        return _first_row(simulate_blended_batch(temp, rpm, moisture, fat, blend_vector(blend_dict)))
+
+
+def estimate_energy(temp, rpm, moisture, fat, screw_diameter_mm, screw_length_mm):
+    """v3 的單筆能耗預測（原 estimate_energy_consumption）。"""
+    try:
+        temp, rpm, moisture, fat = float(temp), float(rpm), float(moisture), float(fat)
+        screw_diameter_mm, screw_length_mm = float(screw_diameter_mm), float(screw_length_mm)
+    except _SCALAR_FALLBACK:
+        return float(estimate_energy_batch(temp, rpm, moisture, fat, screw_diameter_mm, screw_length_mm))
+    energy = (
+        0.12
+        + (temp - 100) * 0.0008
+        + (rpm - 300) * 0.0005
+        + screw_length_mm / 1000 * 0.05
+        - moisture * 0.002
+        - fat * 0.003
+        + (screw_diameter_mm / 100) * 0.02
+    )
+    # max(nan, 0.05) 為 nan，與 np.maximum 相同
+    return round(max(energy, 0.05), 3)
+
+
+def simulate_v3(temp, rpm, moisture, fat, blend_dict, screw_diameter, screw_length):
+    """v3 的單筆模擬（原 simulate_with_energy）。"""
+    result = simulate_v2(temp, rpm, moisture, fat, blend_dict)
+    result["螺桿直徑（mm）"] = screw_diameter
+    result["螺桿長度（mm）"] = screw_length
+    result["預估能耗（kWh/kg）"] = estimate_energy(temp, rpm, moisture, fat, screw_diameter, screw_length)
+    return result
+
+
+def _v35_scalar(temp, rpm, moisture, fat, screw_diameter, feed_rate, blend_dict):
+    weights, (expansion, crisp, sticky) = _scalar_blend(blend_dict, _SCALAR_TABLES["v35"])
+    temp, rpm, moisture, fat = float(temp), float(rpm), float(moisture), float(fat)
+    screw_diameter, feed_rate = float(screw_diameter), float(feed_rate)
+    result = {
+        "膨發指數": round(expansion, 2),
+        "酥脆度": round(crisp, 2),
+        "水活性": round(0.65 + 0.01 * (moisture - 15) - 0.005 * fat, 2),
+        "黏性": round(sticky, 2),
+        "體積密度": round(0.2 + 0.005 * (100 - expansion * 50), 2),
+        "桶內壓力 (bar)": round(0.1 * rpm * moisture / screw_diameter, 2),
+        "預估能耗 (kWh/kg)": round((temp * rpm * (1 + fat / 10)) / (100000 + feed_rate * 100), 3),
+    }
+    # round() 為四捨六入五成雙，與整批版本的 np.rint 相同
+    flavor_counts = {V35_FLAVORS[j]: round(w * 100) for j, w in weights}
+    return result, flavor_counts
+
+
+def simulate_v35(temp, rpm, moisture, fat, screw_diameter, screw_length, feed_rate, die_diameter, blend_dict):
+    """v3.5 解釋版 / 紀錄版的單筆模擬，回傳 (結果 dict, {風味: 百分比})。"""
+    try:
+        return _v35_scalar(temp, rpm, moisture, fat, screw_diameter, feed_rate, blend_dict)
+    except _SCALAR_FALLBACK:
+        pass
+    ratios = blend_vector(blend_dict)
+    result = simulate_v35_batch(
+        temp, rpm, moisture, fat, screw_diameter, screw_length, feed_rate, die_diameter, ratios
+    )
+    pct = result.pop("風味比例")[0]
+    flavor_counts = {V35_FLAVORS[j]: int(pct[j]) for j in np.flatnonzero(ratios[0] > 0)}
+    return _first_row(result), flavor_counts
+
+
+def _v35s_scalar(temp, rpm, moisture, fat, feed_rate, blend_dict):
+    weights, (expansion, crisp) = _scalar_blend(blend_dict, _SCALAR_TABLES["v2"])
+    temp, rpm, moisture, fat, feed_rate = float(temp), float(rpm), float(moisture), float(fat), float(feed_rate)
+    return {
+        "膨發指數": round(expansion, 2),
+        "酥脆度": round(crisp, 2),
+        "水活性": round(0.6 + moisture * 0.01 - temp * 0.001, 2),
+        "黏性": round(1 + fat * 0.1 + moisture * 0.1 - rpm * 0.002, 2),
+        "體積密度": round(1.2 / (expansion + 0.1), 2),
+        "桶內壓力（bar）": round((temp * rpm * (1 - moisture / 100)) / 10000, 2),
+        "預估能耗（kWh/kg）": round((temp * rpm * feed_rate * (1 - moisture / 100)) / 10000000, 3),
+        "風味描述": _flavor_text(weights, ""),
+    }
+
+
+def simulate_v35s(temp, rpm, moisture, fat, feed_rate, blend_dict):
+    """v3.5 簡潔版的單筆模擬（螺桿幾何與模口不影響此版本的結果）。"""
+    try:
+        return _v35s_scalar(temp, rpm, moisture, fat, feed_rate, blend_dict)
+    except _SCALAR_FALLBACK:
+        return _first_row(simulate_v35s_batch(temp, rpm, moisture, fat, feed_rate, blend_vector(blend_dict)))
+
+
+# --------- 原料特徵：兩個配方的特徵完全相同時，任何製程條件下的模擬結果都相同 ---------
+def v3_blend_features(ratios):
+    return np.column_stack(blend_sums(blend_weights(ratios)[1], EXPANSION, CRISP))
+
+
+def v35_blend_features(ratios):
+    return np.column_stack(blend_sums(blend_weights(ratios)[1], V35_EXPANSION, V35_CRISP, 10 - V35_CRISP))
+
+
+# --------- 模型登錄表 ---------
+# version 於模型係數或原料表有變動時遞增，舊的快取結果就不會再被使用；
+# table 為 materials.MATERIAL_TABLES 中使用的原料表
+MODELS = {
+    "v2": {"version": "v2:1", "table": "v2", "simulate": simulate_v2, "batch": simulate_blended_batch},
+    "v3": {"version": "v3:1", "table": "v2", "simulate": simulate_v3, "batch": simulate_with_energy_batch},
+    "v35": {"version": "v35:1", "table": "v35", "simulate": simulate_v35, "batch": simulate_v35_batch},
+    "v35s": {"version": "v35s:1", "table": "v2", "simulate": simulate_v35s, "batch": simulate_v35s_batch},
+}
+MODEL_VERSIONS = {name: spec["version"] for name, spec in MODELS.items()}
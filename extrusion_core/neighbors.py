@@ -0,0 +1,344 @@
+"""過去紀錄的最近鄰索引：找出與目前設定最接近、或輸出最接近目標的歷史紀錄。
+
+參數與輸出各自除以典型範圍（PARAM_SPANS、OUTPUT_SPANS）正規化後建 KD-tree，只用
+numpy。新紀錄先放進緩衝區（暴力比對），滿 BUFFER_SIZE 筆才建成一棵樹；樹的大小像
+二進位計數一樣合併（Bentley–Saxe），新增一筆的攤銷成本為 O(log² n)，不需要整個重建。
+
+    index = get_history_index("v2")          # 模擬紀錄資料庫，查詢前自動讀入新紀錄
+    index.similar({"temp": 150, "rpm": 320, "moisture": 15, "fat": 5}, k=10)
+    index.near_outputs({"膨發指數": 2.1, "酥脆度": 5.8}, radius=0.05)
+
+距離為正規化後的歐氏距離；目標只指定部分欄位時，其餘欄位不計入。
+"""
+
+import threading
+
+import numpy as np
+
+from .metrics import timed
+from .sweep import SWEEP_PARAMETERS
+
+# 正規化用的典型範圍：參數為滑桿範圍，輸出約為各模型隨機輸入的 1–99 百分位寬度
+PARAM_SPANS = {p: float(hi - lo) for p, (_, lo, hi, _) in SWEEP_PARAMETERS.items()}
+OUTPUT_SPANS = {
+    "膨發指數": 1.0,
+    "酥脆度": 4.0,
+    "水活性": 0.25,
+    "黏性": 3.0,
+    "體積密度": 0.12,
+    "桶內壓力 (bar)": 50.0,
+    "預估能耗 (kWh/kg)": 2.0,
+}
+LEAF_SIZE = 64
+BUFFER_SIZE = 256
+
+
+class _KDTree:
+    """靜態 KD-tree：依範圍最寬的維度在中位數遞迴切開，直到每個葉節點最多 leaf_size
+    個點；點依葉節點重新排列成連續區段，並記下各葉節點的外接方塊。
+
+    查詢時不逐層走訪（Python 迴圈太慢），而是一次算出查詢點到所有葉節點方塊的距離
+    下限，只比對下限不超過目前第 k 近距離（或查詢半徑）的葉節點。"""
+
+    def __init__(self, points, ids, leaf_size=LEAF_SIZE):
+        order = np.arange(len(points))
+        starts, los, his = [], [], []
+        stack = [(0, len(points))]
+        while stack:
+            start, end = stack.pop()
+            block = points[order[start:end]]
+            if end - start <= leaf_size:
+                starts.append(start)
+                los.append(block.min(axis=0))
+                his.append(block.max(axis=0))
+                continue
+            dim = int(np.argmax(block.max(axis=0) - block.min(axis=0)))
+            mid = (start + end) // 2
+            order[start:end] = order[start:end][np.argpartition(block[:, dim], mid - start)]
+            stack.append((mid, end))
+            stack.append((start, mid))
+        self.points = points[order]
+        self.ids = ids[order]
+        self.starts = np.array(starts)
+        self.sizes = np.diff(np.append(self.starts, len(points)))
+        self.lo = np.array(los)
+        self.hi = np.array(his)
+
+    def __len__(self):
+        return len(self.points)
+
+    def _bounds(self, q, w):
+        # 查詢點到各葉節點外接方塊的（加權）平方距離下限
+        gap = np.maximum(self.lo - q, 0) + np.maximum(q - self.hi, 0)
+        return (gap * gap * w).sum(axis=1)
+
+    def _gather(self, leaves, q, w):
+        # 取出這些葉節點的所有點，回傳 (平方距離, ids)
+        sizes = self.sizes[leaves]
+        offsets = np.cumsum(sizes) - sizes
+        rows = np.arange(sizes.sum()) + np.repeat(self.starts[leaves] - offsets, sizes)
+        return ((self.points[rows] - q) ** 2 * w).sum(axis=1), self.ids[rows]
+
+    def knn(self, q, w, k, best_d, best_i):
+        """以目前最佳的 k 筆（best_d 為遞增的平方距離）為起點，回傳更新後的 (best_d, best_i)。"""
+        bounds = self._bounds(q, w)
+        order = np.argsort(bounds, kind="stable")
+        # 先比對下限最小、點數合計達 k 的葉節點，得到第 k 近距離的上限，再補上下限不超過它的葉節點
+        first = int(np.searchsorted(np.cumsum(self.sizes[order]), k)) + 1
+        for leaves in (order[:first], order[first:]):
+            if len(best_d) == k:
+                leaves = leaves[bounds[leaves] <= best_d[-1]]
+            if len(leaves):
+                d, ids = self._gather(leaves, q, w)
+                best_d, best_i = _smallest(np.concatenate([best_d, d]), np.concatenate([best_i, ids]), k)
+        return best_d, best_i
+
+    def within(self, q, w, r2):
+        """平方距離不超過 r2 的所有點，回傳 (平方距離, ids)。"""
+        d, ids = self._gather(np.flatnonzero(self._bounds(q, w) <= r2), q, w)
+        return d[d <= r2], ids[d <= r2]
+
+
+def _smallest(d, ids, k):
+    if len(d) > k:
+        keep = np.argpartition(d, k - 1)[:k]
+        d, ids = d[keep], ids[keep]
+    order = np.argsort(d, kind="stable")
+    return d[order], ids[order]
+
+
+class NeighborIndex:
+    """可逐步加入資料的 k 近鄰 / 範圍查詢索引。columns 為欄位名稱，spans 為各欄位的
+    正規化範圍；add() 的資料除以 spans 後存入，含 NaN 的列不列入索引。"""
+
+    def __init__(self, columns, spans, leaf_size=LEAF_SIZE, buffer_size=BUFFER_SIZE):
+        self.columns = tuple(columns)
+        self.spans = np.asarray(spans, dtype=float)
+        self.leaf_size = leaf_size
+        self.buffer_size = buffer_size
+        self._trees = []
+        self._buffer = []
+        self._buffer_ids = []
+        self._buffered = 0
+
+    def __len__(self):
+        return sum(len(t) for t in self._trees) + self._buffered
+
+    def add(self, values, ids):
+        """加入 N × len(columns) 的資料與對應的 N 個編號。"""
+        values = np.atleast_2d(np.asarray(values, dtype=float))
+        ids = np.atleast_1d(np.asarray(ids, dtype=np.int64))
+        keep = ~np.isnan(values).any(axis=1)
+        if not keep.any():
+            return
+        self._buffer.append(values[keep] / self.spans)
+        self._buffer_ids.append(ids[keep])
+        self._buffered += int(keep.sum())
+        if self._buffered >= self.buffer_size:
+            self._flush()
+
+    def _flush(self):
+        points, ids = np.concatenate(self._buffer), np.concatenate(self._buffer_ids)
+        self._buffer, self._buffer_ids, self._buffered = [], [], 0
+        # 比新樹小（或一樣大）的舊樹一起合併重建，樹的數量維持 O(log n)
+        while self._trees and len(self._trees[-1]) <= len(points):
+            tree = self._trees.pop()
+            points, ids = np.concatenate([tree.points, points]), np.concatenate([tree.ids, ids])
+        self._trees.append(_KDTree(points, ids, self.leaf_size))
+
+    def _query_point(self, target):
+        # 目標 dict → (正規化座標, 權重)；沒指定的欄位權重為 0
+        unknown = set(target) - set(self.columns)
+        if unknown:
+            raise ValueError(f"索引沒有這些欄位：{'、'.join(sorted(unknown))}")
+        q = np.zeros(len(self.columns))
+        w = np.zeros(len(self.columns))
+        for j, column in enumerate(self.columns):
+            value = target.get(column)
+            if value is not None:
+                q[j] = float(value) / self.spans[j]
+                w[j] = 1.0
+        if not w.any():
+            raise ValueError("至少需要指定一個欄位")
+        return q, w
+
+    def knn(self, target, k=5):
+        """最接近 target（{欄位: 值}）的 k 筆，回傳 (ids, 距離)，距離由小到大。"""
+        q, w = self._query_point(target)
+        best_d, best_i = np.empty(0), np.empty(0, dtype=np.int64)
+        if k <= 0:
+            return best_i, best_d
+        with timed("neighbors.query"):
+            if self._buffered:
+                points, ids = np.concatenate(self._buffer), np.concatenate(self._buffer_ids)
+                best_d, best_i = _smallest(((points - q) ** 2 * w).sum(axis=1), ids, k)
+            for tree in self._trees:
+                best_d, best_i = tree.knn(q, w, k, best_d, best_i)
+        return best_i, np.sqrt(best_d)
+
+    def within(self, target, radius, limit=None):
+        """與 target 距離不超過 radius 的紀錄（最多 limit 筆），回傳 (ids, 距離)，距離由小到大。"""
+        q, w = self._query_point(target)
+        r2 = float(radius) ** 2
+        found_d, found_i = [np.empty(0)], [np.empty(0, dtype=np.int64)]
+        with timed("neighbors.query"):
+            if self._buffered:
+                points, ids = np.concatenate(self._buffer), np.concatenate(self._buffer_ids)
+                d = ((points - q) ** 2 * w).sum(axis=1)
+                found_d.append(d[d <= r2])
+                found_i.append(ids[d <= r2])
+            for tree in self._trees:
+                d, ids = tree.within(q, w, r2)
+                found_d.append(d)
+                found_i.append(ids)
+            d, ids = np.concatenate(found_d), np.concatenate(found_i)
+            d, ids = _smallest(d, ids, len(d) if limit is None else limit)
+        return ids, np.sqrt(d)
+
+
+class RunIndex:
+    """一組紀錄的兩個最近鄰索引：參數空間（params 為 PARAM_SPANS 的鍵）與輸出空間
+    （outputs 為 OUTPUT_SPANS 的鍵）。紀錄編號需遞增加入；labels 為查詢結果的欄位名稱。
+
+    多個工作階段可共用同一個索引，查詢與加入以鎖保護。
+    """
+
+    def __init__(self, params, outputs, labels=None, keep_values=True):
+        self.params = tuple(params)
+        self.outputs = tuple(outputs)
+        self.labels = {p: SWEEP_PARAMETERS[p][0] for p in self.params}
+        self.labels.update(labels or {})
+        self.param_index = NeighborIndex(self.params, [PARAM_SPANS[p] for p in self.params])
+        self.output_index = NeighborIndex(self.outputs, [OUTPUT_SPANS[k] for k in self.outputs])
+        self.last_id = 0
+        self.keep_values = keep_values
+        # 原始數值（顯示用）：容量加倍成長的陣列，前 _size 列有效
+        self._ids = np.empty(0, dtype=np.int64)
+        self._values = np.empty((0, len(self.params) + len(self.outputs)))
+        self._size = 0
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self.param_index)
+
+    def add(self, ids, params, outputs):
+        """加入紀錄：ids 為遞增的編號，params / outputs 為 N × 欄位數的陣列。"""
+        ids = np.atleast_1d(np.asarray(ids, dtype=np.int64))
+        if len(ids) == 0:
+            return
+        if ids[0] <= self.last_id or (np.diff(ids) <= 0).any():
+            raise ValueError("紀錄編號需遞增加入")
+        params = np.atleast_2d(np.asarray(params, dtype=float))
+        outputs = np.atleast_2d(np.asarray(outputs, dtype=float))
+        with self._lock, timed("neighbors.add", rows=len(ids)):
+            self.param_index.add(params, ids)
+            self.output_index.add(outputs, ids)
+            if self.keep_values:
+                self._keep(ids, np.hstack([params, outputs]))
+            self.last_id = int(ids[-1])
+
+    def _keep(self, ids, values):
+        end = self._size + len(ids)
+        if end > len(self._ids):
+            capacity = max(2 * len(self._ids), end, 64)
+            self._ids = np.resize(self._ids, capacity)
+            self._values = np.resize(self._values, (capacity, self._values.shape[1]))
+        self._ids[self._size:end] = ids
+        self._values[self._size:end] = values
+        self._size = end
+
+    def similar(self, point, k=5, radius=None):
+        """參數最接近 point（{參數: 值}，可只給部分參數）的紀錄。"""
+        return self._search(self.param_index, point, k, radius)
+
+    def near_outputs(self, targets, k=5, radius=None):
+        """輸出最接近 targets（{輸出: 目標值}，可只給部分輸出）的紀錄。"""
+        return self._search(self.output_index, targets, k, radius)
+
+    def _search(self, index, target, k, radius):
+        # radius 為 None 時取最近的 k 筆，否則取距離不超過 radius 的紀錄（最多 k 筆）
+        with self._lock:
+            if radius is None:
+                ids, distances = index.knn(target, k)
+            else:
+                ids, distances = index.within(target, radius, limit=k)
+            return self.frame(ids, distances)
+
+    def frame(self, ids, distances):
+        """查詢結果的 DataFrame：索引為紀錄編號，第一欄為距離。"""
+        import pandas as pd
+
+        columns = [self.labels.get(c, c) for c in self.params + self.outputs]
+        values = self._values[np.searchsorted(self._ids[:self._size], ids)]
+        df = pd.DataFrame(values, columns=columns, index=pd.Index(ids, name="編號"))
+        df.insert(0, "距離", distances)
+        return df
+
+
+class HistoryIndex(RunIndex):
+    """模擬紀錄資料庫（HistoryStore）中某個模型的紀錄索引；每次查詢前只讀入 id 大於
+    last_id 的新紀錄，查詢結果的其他欄位從資料庫取出。"""
+
+    def __init__(self, store, model, params):
+        from .history import COLUMN_LABELS, OUTPUT_COLUMNS
+
+        super().__init__(params, [COLUMN_LABELS[c] for c in OUTPUT_COLUMNS], keep_values=False)
+        self.store = store
+        self.model = model
+        self._columns = self.params + OUTPUT_COLUMNS
+
+    def refresh(self):
+        """讀入新紀錄，回傳新增筆數。"""
+        with self._lock:
+            ids, values = self.store.rows_after(self.last_id, self._columns, model=self.model)
+            self.add(ids, values[:, :len(self.params)], values[:, len(self.params):])
+            return len(ids)
+
+    def _search(self, index, target, k, radius):
+        self.refresh()
+        return super()._search(index, target, k, radius)
+
+    def frame(self, ids, distances):
+        df = self.store.fetch(ids)
+        df.index.name = "編號"
+        df.insert(0, "距離", distances)
+        return df
+
+
+class RunHistoryIndex(RunIndex):
+    """工作階段紀錄（session.RunHistory）的索引，欄位依 history.columns 對應
+    （筒溫 → temp 等；輸出為 OUTPUT_SPANS 中有的欄位）。"""
+
+    def __init__(self, columns):
+        from .history import FIELD_COLUMNS
+
+        self.fields = [c for c in columns if FIELD_COLUMNS.get(c) in PARAM_SPANS]
+        self.output_fields = [c for c in columns if c in OUTPUT_SPANS]
+        params = [FIELD_COLUMNS[c] for c in self.fields]
+        super().__init__(params, self.output_fields, labels=dict(zip(params, self.fields)))
+
+    def sync(self, history):
+        """加入 history 中編號大於 last_id 的紀錄（已寫入暫存檔的舊紀錄不會再讀回），回傳新增筆數。"""
+        ids = history.run_ids()
+        new = ids > self.last_id
+        if new.any():
+            values = history.values()[new]
+            position = {c: j for j, c in enumerate(history.columns)}
+            self.add(ids[new], values[:, [position[c] for c in self.fields]],
+                     values[:, [position[c] for c in self.output_fields]])
+        return int(new.sum())
+
+
+_shared = {}
+_shared_lock = threading.Lock()
+
+
+def get_history_index(model="v2"):
+    """模擬紀錄資料庫（get_history()）中某個模型紀錄的共用索引，參數欄位為該模型的輸入。"""
+    from .cli import MODEL_ARGUMENTS
+    from .history import get_history
+
+    with _shared_lock:
+        if model not in _shared:
+            _shared[model] = HistoryIndex(get_history(), model, MODEL_ARGUMENTS[model])
+        return _shared[model]
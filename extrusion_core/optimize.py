@@ -0,0 +1,203 @@
+import itertools
+
+import numpy as np
+
+from .materials import MATERIALS
+from .models import simulate_v35_batch, simulate_with_energy_batch, v35_blend_features, v3_blend_features
+
+# --------- 可搜尋的製程參數：(顯示名稱, 最小值, 最大值, 預設值, 預設搜尋間距) ---------
+V3_PARAMETERS = {
+    "temp": ("筒溫（℃）", 60, 180, 140, 5),
+    "rpm": ("轉速（rpm）", 100, 600, 300, 25),
+    "moisture": ("水含量（%）", 10, 25, 15, 1),
+    "fat": ("油脂含量（%）", 0, 15, 5, 1),
+    "screw_diameter": ("螺桿直徑（mm）", 20, 60, 30, 5),
+    "screw_length": ("螺桿長度（mm）", 600, 1600, 1000, 100),
+}
+V35_PARAMETERS = {
+    "temp": ("筒溫 (°C)", 60, 180, 140, 5),
+    "rpm": ("轉速 (rpm)", 100, 600, 300, 25),
+    "moisture": ("水含量 (%)", 10, 25, 15, 1),
+    "fat": ("油脂含量 (%)", 0, 15, 5, 1),
+    "screw_diameter": ("螺桿直徑 (mm)", 20, 60, 30, 5),
+    "screw_length": ("螺桿長度 (mm)", 500, 1500, 1000, 100),
+    "feed_rate": ("喂料速率 (kg/h)", 10, 100, 30, 10),
+    "die_diameter": ("模口孔徑 (mm)", 2, 10, 5, 1),
+}
+# 製程格點上限（每點約佔 10 bytes 的遮罩與索引）
+MAX_PROCESS_POINTS = 50_000_000
+
+
+def _simulate_v3(p, ratios, describe=False):
+    return simulate_with_energy_batch(
+        p["temp"], p["rpm"], p["moisture"], p["fat"], ratios, p["screw_diameter"], p["screw_length"],
+        describe=describe,
+    )
+
+
+def _simulate_v35(p, ratios, describe=False):
+    return simulate_v35_batch(ratios=ratios, **p)
+
+
+OPTIMIZER_MODELS = {
+    "v3": {
+        "simulate": _simulate_v3,
+        "blend_features": v3_blend_features,
+        "energy": "預估能耗（kWh/kg）",
+        "parameters": V3_PARAMETERS,
+    },
+    "v35": {
+        "simulate": _simulate_v35,
+        "blend_features": v35_blend_features,
+        "energy": "預估能耗 (kWh/kg)",
+        "parameters": V35_PARAMETERS,
+    },
+}
+
+
+def blend_simplex(step=5, materials=MATERIALS):
+    """列出所有以 step% 為單位、總和 100% 的配方（只用 materials 中的原料），回傳 M×6 矩陣。"""
+    cols = [MATERIALS.index(m) for m in materials]
+    units = 100 // step
+    k = len(cols)
+    # 隔板法：在 units + k - 1 個位置中選 k - 1 個隔板
+    bars = np.array(list(itertools.combinations(range(units + k - 1), k - 1)), dtype=np.int64).reshape(-1, k - 1)
+    edges = np.hstack([np.full((len(bars), 1), -1), bars, np.full((len(bars), 1), units + k - 1)])
+    ratios = np.zeros((len(bars), len(MATERIALS)))
+    ratios[:, cols] = (np.diff(edges, axis=1) - 1) * step
+    return ratios
+
+
+def _within(values, bounds):
+    lo, hi = bounds
+    ok = np.ones(values.shape, dtype=bool)
+    if lo is not None:
+        ok &= values >= lo
+    if hi is not None:
+        ok &= values <= hi
+    return ok
+
+
+def _core(values):
+    # 廣播出來的維度（stride 為 0）只保留一格，避免對重複資料做運算
+    return values[tuple(slice(0, 1) if stride == 0 else slice(None) for stride in values.strides)]
+
+
+def optimize_recipe(
+    targets,
+    model="v3",
+    ranges=None,
+    fixed=None,
+    materials=MATERIALS,
+    blend_step=5,
+    top_k=10,
+    chunk_cells=1_000_000,
+):
+    """找出符合所有目標、預估能耗最低的前 top_k 組配方與製程條件。
+
+    targets 為 {輸出欄位: (下限, 上限)}，None 表示不限，邊界值算符合。
+    ranges 為 {參數: (起點, 終點, 間距)}，列出的參數會在格點上搜尋，其餘取
+    fixed 中的值或滑桿預設值。回傳 (結果 DataFrame, 統計 dict)；模擬結果
+    完全相同的配方只列出第一組。
+
+    搜尋分兩步：
+    1. 原料的影響都是「比例的加權和」，單一輸出在所有配方中的最大、最小值
+       必出現在單一原料（100%）的配方上；先以這幾個頂點在開放網格上算出
+       每個製程點的可達範圍，剔除不可能達標的製程點。
+    2. 剩下的製程點依能耗排序，分段與所有（去除等效後的）配方一起向量化
+       計算，找到 top_k 組且下一段能耗已超過第 k 名時即停止。
+    """
+    import pandas as pd
+
+    spec = OPTIMIZER_MODELS[model]
+    params = spec["parameters"]
+    energy_key = spec["energy"]
+    simulate = spec["simulate"]
+    ranges = ranges or {}
+    fixed = fixed or {}
+
+    searched = [p for p in params if p in ranges]
+    axes = [np.arange(start, stop + step / 2, step, dtype=float) for start, stop, step in (ranges[p] for p in searched)]
+    shape = tuple(len(a) for a in axes)
+    n_process = int(np.prod(shape))
+    if n_process > MAX_PROCESS_POINTS:
+        raise ValueError(f"製程格點共 {n_process:,} 個，超過上限 {MAX_PROCESS_POINTS:,}，請加大搜尋間距或減少搜尋參數")
+    base = {p: float(fixed.get(p, params[p][3])) for p in params}
+
+    # 第一步：開放網格（每個參數一個維度，最後一維為單一原料頂點）
+    vertices = np.eye(len(MATERIALS))[[MATERIALS.index(m) for m in materials]]
+    open_grid = dict(base)
+    for k, (p, axis) in enumerate(zip(searched, axes)):
+        open_grid[p] = axis.reshape([-1 if i == k else 1 for i in range(len(axes))] + [1])
+    corner = simulate(open_grid, vertices)
+    keep = np.ones(shape, dtype=bool)
+    for key, (lo, hi) in targets.items():
+        core = _core(np.asarray(corner[key]))
+        if lo is not None:
+            keep &= np.broadcast_to((core.max(axis=-1) >= lo), shape)
+        if hi is not None:
+            keep &= np.broadcast_to((core.min(axis=-1) <= hi), shape)
+    # 能耗與原料無關，取第一個頂點即可；以索引取值，不展開整個網格
+    energy_grid = np.broadcast_to(_core(np.asarray(corner[energy_key]))[..., 0], shape)
+
+    def energy_of(index):
+        return energy_grid[np.unravel_index(index, shape)]
+
+    def process_at(index, column=False):
+        point = dict(base)
+        for p, axis, i in zip(searched, axes, np.unravel_index(index, shape)):
+            point[p] = axis[i][:, None] if column else axis[i]
+        return point
+
+    candidates = np.flatnonzero(keep)
+    candidate_energy = energy_of(candidates)
+    order = np.argsort(candidate_energy, kind="stable")
+    candidates, candidate_energy = candidates[order], candidate_energy[order]
+
+    # 第二步：特徵相同的配方結果必定相同，只保留一組代表
+    ratios = blend_simplex(blend_step, materials)
+    _, first = np.unique(spec["blend_features"](ratios), axis=0, return_index=True)
+    ratios = ratios[np.sort(first)]
+    chunk = max(chunk_cells // len(ratios), 1)
+    found_p = np.empty(0, dtype=np.int64)
+    found_b = np.empty(0, dtype=np.int64)
+    found_e = np.empty(0)
+    evaluated = 0
+    for lo_i in range(0, len(candidates), chunk):
+        if len(found_p) >= top_k and candidate_energy[lo_i] > found_e[top_k - 1]:
+            break
+        rows = candidates[lo_i:lo_i + chunk]
+        out = simulate(process_at(rows, column=True), ratios)
+        ok = np.ones((len(rows), len(ratios)), dtype=bool)
+        for key, bounds in targets.items():
+            ok &= _within(out[key], bounds)
+        evaluated += ok.size
+        # nonzero 依列順序（能耗由低到高）回傳，前 top_k 個即為本段最佳
+        r, b = np.nonzero(ok)
+        r, b = r[:top_k], b[:top_k]
+        found_p = np.concatenate([found_p, rows[r]])
+        found_b = np.concatenate([found_b, b])
+        found_e = np.concatenate([found_e, candidate_energy[lo_i + r]])
+        order = np.argsort(found_e, kind="stable")[:top_k]
+        found_p, found_b, found_e = found_p[order], found_b[order], found_e[order]
+
+    stats = {
+        "製程點": n_process,
+        "剔除製程點": n_process - len(candidates),
+        "等效配方數": len(ratios),
+        "計算組合數": evaluated,
+    }
+    if len(found_p) == 0:
+        return pd.DataFrame(), stats
+
+    best = {p: np.broadcast_to(v, found_p.shape) for p, v in process_at(found_p).items()}
+    best_ratios = ratios[found_b]
+    results = simulate(best, best_ratios, describe=True)
+    table = pd.DataFrame({params[p][0]: best[p] for p in params})
+    for j, mat in enumerate(MATERIALS):
+        if mat in materials:
+            table[f"{mat}（%）"] = best_ratios[:, j].astype(int)
+    for key, values in results.items():
+        if np.ndim(values) == 1 and key not in ("螺桿直徑（mm）", "螺桿長度（mm）"):
+            table[key] = values
+    return table, stats
@@ -0,0 +1,88 @@
+import atexit
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+
+# 每段至少這麼多列才值得送到子行程，太小的批次直接在本行程計算
+MIN_SHARD_ROWS = 20_000
+
+_pools = {}
+
+
+def default_workers():
+    """預設核心數：環境變數 EXTRUSION_WORKERS，否則為本機可用核心數。"""
+    env = os.environ.get("EXTRUSION_WORKERS")
+    if env:
+        return max(int(env), 1)
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def _get_pool(workers):
+    # 行程池建立成本高，同一核心數沿用同一個池；以 spawn 啟動避免 fork 到 Streamlit 的執行緒
+    pool = _pools.get(workers)
+    if pool is None:
+        pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+        _pools[workers] = pool
+    return pool
+
+
+@atexit.register
+def shutdown_pools():
+    for pool in _pools.values():
+        pool.shutdown(wait=False, cancel_futures=True)
+    _pools.clear()
+
+
+def _call(func, kwargs):
+    return func(**kwargs)
+
+
+def _merge(parts, lengths):
+    # 只有第一維等於該段列數的輸出才是逐列的；只與純量或 1 列輸入有關的輸出
+    # （例如共用 1×6 配方時的風味比例）每段都相同，取第一段即可
+    def merge(arrays):
+        if all(np.ndim(a) and len(a) == n for a, n in zip(arrays, lengths)):
+            return np.concatenate(arrays)
+        return arrays[0]
+
+    if isinstance(parts[0], dict):
+        return {k: merge([p[k] for p in parts]) for k in parts[0]}
+    return merge(parts)
+
+
+def run_batch(func, n_rows, workers=None, min_shard_rows=MIN_SHARD_ROWS, **columns):
+    """以多行程執行整批模擬，結果依原列順序合併，與單行程計算完全相同。
+
+    目前由 v2 的 CSV 批次上傳（含串流模式）與 `python -m extrusion_core batch --workers`
+    使用；參數掃描、蒙地卡羅與最佳化仍在本行程計算。
+
+    func 為模組層級的整批函式（例如 simulate_blended_batch）；columns 中第一維
+    長度為 n_rows 的陣列會被切段，其餘（純量）原樣傳給每一段。workers <= 1、
+    批次太小或行程池無法使用時，改在本行程直接呼叫 func。
+    """
+    workers = default_workers() if workers is None else max(int(workers), 1)
+    n_shards = min(workers, n_rows // max(min_shard_rows, 1))
+    if n_shards <= 1:
+        return func(**columns)
+
+    bounds = np.linspace(0, n_rows, n_shards + 1).astype(int)
+    shards = []
+    for lo, hi in zip(bounds[:-1], bounds[1:]):
+        shard = {}
+        for name, value in columns.items():
+            value = np.asarray(value)
+            shard[name] = value[lo:hi] if value.ndim and len(value) == n_rows else value
+        shards.append(shard)
+    try:
+        pool = _get_pool(workers)
+        parts = list(pool.map(_call, [func] * len(shards), shards))
+    except (BrokenProcessPool, OSError):
+        _pools.pop(workers, None)
+        return func(**columns)
+    return _merge(parts, np.diff(bounds))
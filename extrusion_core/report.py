@@ -0,0 +1,418 @@
+import atexit
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from io import BytesIO
+
+from .metrics import get_metrics, timed
+
+# 可顯示中文的 TrueType 字型；EXTRUSION_PDF_FONT 指定的路徑優先
+FONT_CANDIDATES = (
+    "C:/Windows/Fonts/kaiu.ttf",
+    "/Library/Fonts/Arial Unicode.ttf",
+    "/System/Library/Fonts/Supplemental/Arial Unicode.ttf",
+    "/usr/share/fonts/truetype/droid/DroidSansFallbackFull.ttf",
+    "/usr/share/fonts/truetype/arphic/ukai.ttf",
+)
+REPORT_WORKERS = 2
+# 保留最近幾份報告的工作紀錄與檔案，更早的會刪除
+MAX_JOBS = 50
+MAX_BATCH_REPORT_ROWS = 2000
+# 批次報告中每頁配方長條圖的尺寸（英吋）與解析度
+CHART_SIZE = (6.0, 3.0)
+CHART_DPI = 80
+
+
+def find_font():
+    """回傳第一個存在的中文字型路徑，找不到時回傳 None。"""
+    for path in (os.environ.get("EXTRUSION_PDF_FONT"),) + FONT_CANDIDATES:
+        if path and os.path.isfile(path):
+            return path
+    return None
+
+
+# --------- 逐頁寫入磁碟的 PDF ---------
+class _FileBuffer:
+    # 取代 FPDF.buffer 字串：fpdf 以 += 附加、以 len() 計算物件位移，這裡直接寫入檔案
+    def __init__(self, f):
+        self.f = f
+        self.size = 0
+
+    def __iadd__(self, text):
+        data = text.encode("latin-1")
+        self.f.write(data)
+        self.size += len(data)
+        return self
+
+    def __len__(self):
+        return self.size
+
+
+class _Spool:
+    # 已完成的頁面與圖片資料先存到暫存檔，寫出 PDF 時再逐一讀回
+    def __init__(self):
+        self.f = tempfile.TemporaryFile()
+
+    def put(self, data):
+        offset = self.f.seek(0, os.SEEK_END)
+        self.f.write(data)
+        return offset, len(data)
+
+    def get(self, ref):
+        offset, size = ref
+        self.f.seek(offset)
+        return self.f.read(size)
+
+    def close(self):
+        self.f.close()
+
+
+class _SpooledPages(dict):
+    # FPDF.pages：目前的頁面留在記憶體，完成的頁面只保留暫存檔中的位置
+    def __init__(self, spool):
+        super().__init__()
+        self.spool = spool
+        self.refs = {}
+
+    def spill(self, n):
+        self.refs[n] = self.spool.put(super().__getitem__(n).encode("latin-1"))
+        super().__setitem__(n, "")
+
+    def __getitem__(self, n):
+        if n in self.refs:
+            return self.spool.get(self.refs[n]).decode("latin-1")
+        return super().__getitem__(n)
+
+    def __setitem__(self, n, value):
+        self.refs.pop(n, None)
+        super().__setitem__(n, value)
+
+
+_pdf_class = None
+_font_cache = {}
+_font_lock = threading.Lock()
+
+
+def _streaming_pdf(out, spool):
+    """建立寫入 out 的 FPDF（fpdf 1.x）：每完成一頁就移到暫存檔，close() 時逐頁寫出。"""
+    global _pdf_class
+    if _pdf_class is None:
+        from fpdf import FPDF
+
+        class StreamingPDF(FPDF):
+            def __init__(self, out, spool):
+                super().__init__()
+                self.buffer = _FileBuffer(out)
+                self.pages = _SpooledPages(spool)
+                self.spool = spool
+
+            def _endpage(self):
+                super()._endpage()
+                self.pages.spill(self.page)
+
+            def image(self, name, *args, **kwargs):
+                new = name not in self.images
+                super().image(name, *args, **kwargs)
+                if new:
+                    # 圖片資料在文件結束時才寫出，先移到暫存檔
+                    info = self.images[name]
+                    for key in ("data", "smask"):
+                        if key in info:
+                            data = info.pop(key)
+                            if isinstance(data, str):
+                                data = data.encode("latin-1")
+                            info[key + "_ref"] = self.spool.put(data)
+
+            def _putimage(self, info):
+                for key in ("data", "smask"):
+                    ref = info.pop(key + "_ref", None)
+                    if ref is not None:
+                        # fpdf 寫出時 bytes 與 latin-1 字串皆可
+                        info[key] = self.spool.get(ref)
+                super()._putimage(info)
+
+        _pdf_class = StreamingPDF
+    return _pdf_class(out, spool)
+
+
+def _add_font(pdf, path):
+    # 解析 TrueType 字型（字寬表）很慢，每個行程只做一次，之後的文件直接沿用；
+    # subset 記錄該文件用到的字元，每份文件各自一份
+    with _font_lock:
+        if path not in _font_cache:
+            pdf.add_font("CJK", "", path, uni=True)
+            _font_cache[path] = (dict(pdf.fonts["cjk"]), dict(pdf.font_files["cjk"]))
+            return
+        font, files = _font_cache[path]
+    pdf.fonts["cjk"] = dict(font, i=len(pdf.fonts) + 1, subset=list(range(32)))
+    pdf.font_files["cjk"] = dict(files)
+    pdf.font_files[path] = {"type": "TTF"}
+
+
+class _Writer:
+    # 有中文字型時全部使用該字型（只有一種字重）；沒有時退回 Arial，
+    # 無法以 Latin-1 表示的字元以 ? 取代，避免 fpdf 輸出時出錯
+    def __init__(self, pdf):
+        self.pdf = pdf
+        self.font = find_font()
+        if self.font:
+            _add_font(pdf, self.font)
+
+    def set_font(self, style, size):
+        if self.font:
+            self.pdf.set_font("CJK", "", size)
+        else:
+            self.pdf.set_font("Arial", style, size)
+
+    def text(self, value):
+        value = str(value)
+        return value if self.font else value.encode("latin-1", "replace").decode("latin-1")
+
+    def line(self, text, h=10):
+        self.pdf.cell(0, h, self.text(text), ln=True)
+
+
+def _write_pdf(path_or_file, build):
+    # build(pdf, writer) 畫內容；頁面與圖片先暫存，最後直接寫到輸出檔
+    spool = _Spool()
+    out = open(path_or_file, "wb") if isinstance(path_or_file, str) else path_or_file
+    try:
+        with timed("pdf.render"):
+            pdf = _streaming_pdf(out, spool)
+            build(pdf, _Writer(pdf))
+            pdf.close()
+        get_metrics().count("pdf.pages", len(pdf.pages))
+    finally:
+        spool.close()
+        if out is not path_or_file:
+            out.close()
+
+
+# --------- 單筆報告 ---------
+def write_simulation_report(path, title, blend_dict, lines, results, heading=None, notes=None, progress=None):
+    """單筆模擬報告（版面與各 App 原本的「匯出 PDF 報告」相同），寫入 path。
+
+    lines 為原料組合之後的參數說明（每項一行），heading 為結果區塊的標題，
+    notes 為最後的指標說明。
+    """
+
+    def build(pdf, w):
+        pdf.add_page()
+        w.set_font("B", 16)
+        pdf.cell(200, 10, w.text(title), ln=True, align="C")
+        w.set_font("", 12)
+        pdf.ln(5)
+        pdf.multi_cell(0, 8, w.text(f"原料組合：{', '.join([f'{k} {v}%' for k, v in blend_dict.items()])}"))
+        for line in lines:
+            w.line(line)
+        pdf.ln(5)
+        if heading:
+            w.set_font("B", 13)
+            w.line(heading)
+            w.set_font("", 12)
+        for k, v in results.items():
+            w.line(f"{k}：{v}")
+        if notes:
+            pdf.ln(5)
+            w.set_font("I", 11)
+            pdf.multi_cell(0, 8, w.text(notes))
+
+    _write_pdf(path, build)
+
+
+def simulation_report_pdf(title, blend_dict, lines, results, heading=None, notes=None):
+    """同 write_simulation_report，回傳 PDF bytes。"""
+    buffer = BytesIO()
+    write_simulation_report(buffer, title, blend_dict, lines, results, heading, notes)
+    return buffer.getvalue()
+
+
+# --------- 批次報告 ---------
+def write_batch_report(path, results, inputs=None, title="雙螺桿擠壓批次模擬報告", charts=True, progress=None):
+    """批次模擬報告：摘要統計、所有配方的結果表，以及每個配方一頁（含長條圖）。
+
+    results 為 simulate_blended_frame 的輸出，inputs 為對應的輸入資料（列順序
+    相同，用來列出製程參數）。每完成一頁就寫到暫存檔，記憶體用量不隨列數增加；
+    progress(完成比例) 於每個配方頁完成後呼叫。
+    """
+    from pandas.api.types import is_numeric_dtype
+
+    from .charts import BarChartSeries
+    from .materials import MATERIALS
+
+    if len(results) > MAX_BATCH_REPORT_ROWS:
+        raise ValueError(f"批次報告最多 {MAX_BATCH_REPORT_ROWS:,} 列，目前為 {len(results):,} 列")
+    materials = [c for c in results.columns if c in MATERIALS]
+    numeric = [c for c in results.columns if c not in MATERIALS and is_numeric_dtype(results[c])]
+    text = [c for c in results.columns if c not in MATERIALS and c not in numeric]
+    params = [] if inputs is None else [c for c in inputs.columns if c not in MATERIALS]
+    chart_dir = tempfile.mkdtemp(prefix="extrusion_charts_")
+    # JPEG 由 fpdf 直接嵌入；PNG 含透明通道時 fpdf 要逐像素拆解，慢很多
+    series = BarChartSeries(numeric, fmt="jpeg", size=CHART_SIZE, dpi=CHART_DPI)
+
+    def chart_file(values):
+        data = series.render(values)
+        name = os.path.join(chart_dir, hashlib.sha1(data).hexdigest() + ".jpg")
+        # 相同的圖只寫一次；fpdf 也以檔名判斷，同一張圖在 PDF 中只存一份
+        if not os.path.exists(name):
+            with open(name, "wb") as f:
+                f.write(data)
+        return name
+
+    def build(pdf, w):
+        pdf.set_auto_page_break(True, margin=15)
+        pdf.add_page()
+        w.set_font("B", 16)
+        pdf.cell(0, 10, w.text(title), ln=True, align="C")
+        w.set_font("", 10)
+        w.line(f"產生時間：{datetime.now():%Y-%m-%d %H:%M}　配方數：{len(results):,}", 8)
+        pdf.ln(3)
+
+        # 摘要統計
+        w.set_font("B", 12)
+        w.line("統計摘要", 8)
+        w.set_font("", 10)
+        for label in ("指標", "最小", "平均", "最大"):
+            pdf.cell(40, 7, w.text(label), border=1)
+        pdf.ln()
+        for c in numeric:
+            column = results[c]
+            for value in (c, f"{column.min():.3g}", f"{column.mean():.3g}", f"{column.max():.3g}"):
+                pdf.cell(40, 7, w.text(value), border=1)
+            pdf.ln()
+        pdf.ln(5)
+
+        # 結果總表（超過一頁時自動換頁）
+        w.set_font("B", 12)
+        w.line("各配方結果", 8)
+        w.set_font("", 9)
+        width = min(25, 170 / max(len(numeric) + 1, 1))
+        for label in ["#"] + numeric:
+            pdf.cell(width, 6, w.text(label), border=1)
+        pdf.ln()
+        for i, row in enumerate(results[numeric].itertuples(index=False), start=1):
+            pdf.cell(width, 6, str(i), border=1)
+            for value in row:
+                pdf.cell(width, 6, f"{value:g}", border=1)
+            pdf.ln()
+
+        # 每個配方一頁
+        n = len(results)
+        for i in range(n):
+            row = results.iloc[i]
+            pdf.add_page()
+            w.set_font("B", 14)
+            w.line(f"配方 #{i + 1}")
+            w.set_font("", 11)
+            if params:
+                w.line("，".join(f"{c}：{inputs.iloc[i][c]}" for c in params), 8)
+            blend = [f"{m} {row[m]:g}%" for m in materials if row[m] == row[m]]
+            pdf.multi_cell(0, 7, w.text(f"原料組合：{', '.join(blend)}"))
+            pdf.ln(2)
+            for c in numeric:
+                w.line(f"{c}：{row[c]}", 7)
+            for c in text:
+                pdf.multi_cell(0, 7, w.text(f"{c}：{row[c]}"))
+            if charts and numeric:
+                pdf.ln(3)
+                pdf.image(chart_file([float(row[c]) for c in numeric]), w=170)
+            if progress is not None:
+                progress((i + 1) / n)
+
+    try:
+        _write_pdf(path, build)
+    finally:
+        shutil.rmtree(chart_dir, ignore_errors=True)
+
+
+# --------- 背景產生報告 ---------
+class ReportJob:
+    """一份背景報告的狀態：queued → running → done / error。"""
+
+    def __init__(self, job_id, path):
+        self.id = job_id
+        self.path = path
+        self.state = "queued"
+        self.progress = 0.0
+        self.error = None
+        self.created = time.time()
+        self.finished = None
+
+    def status(self):
+        end = self.finished or time.time()
+        return {
+            "id": self.id,
+            "state": self.state,
+            "progress": self.progress,
+            "error": self.error,
+            "path": self.path if self.state == "done" else None,
+            "seconds": round(end - self.created, 2),
+        }
+
+
+_jobs = OrderedDict()
+_jobs_lock = threading.Lock()
+_executor = None
+_job_dir = None
+
+
+def _get_executor():
+    global _executor, _job_dir
+    if _executor is None:
+        workers = int(os.environ.get("EXTRUSION_REPORT_WORKERS", REPORT_WORKERS))
+        _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="report")
+        _job_dir = tempfile.mkdtemp(prefix="extrusion_reports_")
+        atexit.register(shutil.rmtree, _job_dir, True)
+    return _executor
+
+
+def _run(job, render, args, kwargs):
+    job.state = "running"
+
+    def progress(fraction):
+        job.progress = fraction
+
+    try:
+        render(job.path, *args, progress=progress, **kwargs)
+    except Exception as e:
+        job.state, job.error = "error", f"{type(e).__name__}: {e}"
+    else:
+        job.state, job.progress = "done", 1.0
+    finally:
+        job.finished = time.time()
+
+
+def submit_report(render, *args, **kwargs):
+    """在背景執行緒執行 render(path, *args, progress=..., **kwargs)，立即回傳工作編號。
+
+    render 例如 write_simulation_report 或 write_batch_report；以 report_status()
+    查詢進度，完成後 PDF 在狀態中的 path。
+    """
+    with _jobs_lock:
+        executor = _get_executor()
+        job_id = uuid.uuid4().hex[:12]
+        job = ReportJob(job_id, os.path.join(_job_dir, f"{job_id}.pdf"))
+        _jobs[job_id] = job
+        # 只保留最近 MAX_JOBS 份，已結束的舊報告連同檔案一起刪除
+        for old_id in list(_jobs)[:-MAX_JOBS]:
+            old = _jobs[old_id]
+            if old.finished is not None:
+                del _jobs[old_id]
+                if os.path.exists(old.path):
+                    os.remove(old.path)
+    executor.submit(_run, job, render, args, kwargs)
+    return job_id
+
+
+def report_status(job_id):
+    """回傳工作狀態 dict（state、progress、error、path、seconds），未知的編號回傳 None。"""
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+    return None if job is None else job.status()
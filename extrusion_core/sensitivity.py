@@ -0,0 +1,252 @@
+"""敏感度分析：哪個參數對某個輸出影響最大。
+
+- 局部：在目前操作點對每個製程參數與每種原料做中央差分，並在 ±swing（滑桿範圍的
+  比例）處各算一次，得到導數與龍捲風圖的上下端；全部輸入的擾動排成一批一次計算。
+- 全域：在滑桿範圍內均勻抽樣，以 Saltelli / Jansen 估計式計算 Sobol 一階與總效應
+  指數，A、B 與 d 個 AB_i 矩陣疊成一批向量化計算。
+
+模型為 v3.5 simulate()（"v35"）與 v3 的能耗預測（"v3_energy"）；計算時不做四捨五入，
+差分不會被小數位數吃掉。
+"""
+
+import numpy as np
+
+from .materials import MATERIALS
+from .metrics import timed
+from .optimize import V3_PARAMETERS, V35_PARAMETERS
+
+SENSITIVITY_MODELS = {
+    "v35": {"parameters": V35_PARAMETERS, "blend": True,
+            "outputs": ("膨發指數", "酥脆度", "水活性", "黏性", "體積密度", "桶內壓力 (bar)", "預估能耗 (kWh/kg)")},
+    "v3_energy": {"parameters": V3_PARAMETERS, "blend": False, "outputs": ("預估能耗（kWh/kg）",)},
+}
+# 中央差分的步長（滑桿範圍的比例；原料為替代比例）
+STEP = 1e-3
+SWING = 0.1
+CHUNK_ROWS = 200_000
+
+
+def input_labels(model, blend_inputs=True):
+    """各輸入的顯示名稱：製程參數用滑桿名稱，原料為「原料：名稱」。"""
+    spec = SENSITIVITY_MODELS[model]
+    labels = {p: spec["parameters"][p][0] for p in spec["parameters"]}
+    if spec["blend"] and blend_inputs:
+        labels.update({mat: f"原料：{mat}" for mat in MATERIALS})
+    return labels
+
+
+def _evaluate(model, inputs, ratios):
+    # inputs 為 {參數: 長度 N 的陣列}，ratios 為 N×6（v3_energy 不使用）
+    from .models import estimate_energy_batch, simulate_v35_batch
+
+    if model == "v35":
+        result = simulate_v35_batch(ratios=ratios, rounding=False, **inputs)
+        return {k: np.asarray(result[k], dtype=float) for k in SENSITIVITY_MODELS["v35"]["outputs"]}
+    energy = estimate_energy_batch(inputs["temp"], inputs["rpm"], inputs["moisture"], inputs["fat"],
+                                   inputs["screw_diameter"], inputs["screw_length"], rounding=False)
+    return {"預估能耗（kWh/kg）": energy}
+
+
+def _evaluate_chunked(model, inputs, ratios):
+    n = len(next(iter(inputs.values())))
+    outputs = {k: np.empty(n) for k in SENSITIVITY_MODELS[model]["outputs"]}
+    for lo in range(0, n, CHUNK_ROWS):
+        block = slice(lo, lo + CHUNK_ROWS)
+        part = _evaluate(model, {p: v[block] for p, v in inputs.items()},
+                         ratios[block] if len(ratios) > 1 else ratios)
+        for k in outputs:
+            outputs[k][block] = part[k]
+    return outputs
+
+
+class LocalSensitivity:
+    """局部敏感度。derivative、low、high 為 DataFrame（列為輸入、欄為輸出）：
+    derivative 為每單位輸入（原料為替代 1 個百分點）的變化量，low / high 為輸入
+    往下 / 往上移動 swing 時的輸出值；base 為操作點的輸出。"""
+
+    def __init__(self, model, point, base, derivative, low, high, labels):
+        self.model = model
+        self.point = point
+        self.base = base
+        self.derivative = derivative
+        self.low = low
+        self.high = high
+        self.labels = labels
+
+    def tornado(self, output):
+        """某個輸出的龍捲風圖資料，依擺幅由大到小排序（DataFrame：低、高、擺幅）。"""
+        import pandas as pd
+
+        table = pd.DataFrame({"低": self.low[output], "高": self.high[output]})
+        table["擺幅"] = (table["高"] - table["低"]).abs()
+        table.index = [self.labels[i] for i in table.index]
+        return table.sort_values("擺幅", ascending=False)
+
+
+def local_sensitivity(model, point, blend_dict=None, step=STEP, swing=SWING):
+    """在 point（{參數: 值}）與 blend_dict 的操作點計算局部敏感度，所有擾動一次整批計算。
+
+    製程參數的差分步長與擺幅為滑桿範圍乘上 step / swing，碰到滑桿邊界時截斷（改用
+    單邊差分）；原料 j 的方向為「以原料 j 等比例替代其他原料」，擺幅為 swing × 100
+    個百分點，未使用的原料只能往上加。
+    """
+    import pandas as pd
+
+    spec = SENSITIVITY_MODELS[model]
+    params = list(spec["parameters"])
+    point = {p: float(point[p]) for p in params}
+    weights = None
+    if spec["blend"]:
+        from .batch import blend_weights
+        from .materials import blend_vector
+
+        weights = blend_weights(blend_vector(blend_dict))[1][0]
+
+    # 每個輸入四列：-step、+step、-swing、+swing（實際位移記在 offsets）
+    inputs, offsets = [], []
+    for p in params:
+        _, lo, hi, _, _ = spec["parameters"][p]
+        for fraction in (-step, step, -swing, swing):
+            value = min(max(point[p] + fraction * (hi - lo), lo), hi)
+            inputs.append(p)
+            offsets.append(value - point[p])
+    if weights is not None:
+        for j, mat in enumerate(MATERIALS):
+            # w + t (e_j - w) 仍在單體內的條件：t ≥ -w_j / (1 - w_j)、t ≤ 1
+            t_min = -weights[j] / (1 - weights[j]) if weights[j] < 1 else -1.0
+            for t in (-step, step, -swing, swing):
+                inputs.append(mat)
+                offsets.append(min(max(t, t_min), 1.0))
+
+    rows = len(inputs) + 1
+    columns = {p: np.full(rows, point[p]) for p in params}
+    ratios = np.tile(weights * 100, (rows, 1)) if weights is not None else np.ones((1, len(MATERIALS)))
+    for r, (name, offset) in enumerate(zip(inputs, offsets), start=1):
+        if name in columns:
+            columns[name][r] += offset
+        else:
+            direction = -weights.copy()
+            direction[MATERIALS.index(name)] += 1
+            ratios[r] = (weights + offset * direction) * 100
+    with timed(f"sensitivity.local.{model}", rows=rows):
+        outputs = _evaluate(model, columns, ratios)
+
+    names = list(dict.fromkeys(inputs))
+    base = {k: float(v[0]) for k, v in outputs.items()}
+    derivative, low, high = {}, {}, {}
+    for k, v in outputs.items():
+        values = v[1:].reshape(len(names), 4)
+        delta = np.array(offsets).reshape(len(names), 4)
+        span = delta[:, 1] - delta[:, 0]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            d = np.where(span > 0, (values[:, 1] - values[:, 0]) / span, 0.0)
+        # 原料以百分點為單位
+        scale = np.array([1.0 if n in columns else 0.01 for n in names])
+        derivative[k] = d * scale
+        low[k], high[k] = values[:, 2], values[:, 3]
+    frame = lambda data: pd.DataFrame(data, index=names)
+    labels = input_labels(model, weights is not None)
+    return LocalSensitivity(model, dict(point), base, frame(derivative), frame(low), frame(high), labels)
+
+
+class SobolResult:
+    """Sobol 指數。first、total 與 first_conf、total_conf（95% 信賴區間半寬）為 DataFrame
+    （列為輸入、欄為輸出）；variance 為各輸出的總變異數，為 0 的輸出指數記為 0。"""
+
+    def __init__(self, model, n, first, total, first_conf, total_conf, variance, labels, seconds):
+        self.model = model
+        self.n = n
+        self.first = first
+        self.total = total
+        self.first_conf = first_conf
+        self.total_conf = total_conf
+        self.variance = variance
+        self.labels = labels
+        self.seconds = seconds
+
+    @property
+    def evaluations(self):
+        return self.n * (len(self.first) + 2)
+
+    def ranking(self, output):
+        """某個輸出依總效應由大到小排序（DataFrame：一階、總效應與信賴區間）。"""
+        import pandas as pd
+
+        table = pd.DataFrame({
+            "一階": self.first[output], "一階 ±": self.first_conf[output],
+            "總效應": self.total[output], "總效應 ±": self.total_conf[output],
+        })
+        table.index = [self.labels[i] for i in table.index]
+        return table.sort_values("總效應", ascending=False)
+
+
+def sobol_indices(model, point=None, blend_dict=None, params=None, blend_inputs=True, n=2 ** 14, seed=None):
+    """全域 Sobol 指數：params（預設全部製程參數）在滑桿範圍內均勻抽樣，其餘參數固定為
+    point 的值。v35 且 blend_inputs=True 時，六種原料的比例也各自在 0–100 之間均勻
+    抽樣後正規化；否則固定為 blend_dict。共計算 n × (輸入數 + 2) 列。
+    """
+    import time
+
+    import pandas as pd
+
+    spec = SENSITIVITY_MODELS[model]
+    params = list(params or spec["parameters"])
+    unknown = set(params) - set(spec["parameters"])
+    if unknown:
+        raise ValueError(f"模型 {model} 沒有這些製程參數：{', '.join(sorted(unknown))}")
+    point = point or {}
+    fixed = {p: float(point.get(p, v[3])) for p, v in spec["parameters"].items() if p not in params}
+    use_blend = spec["blend"] and blend_inputs
+    names = params + (list(MATERIALS) if use_blend else [])
+    d = len(names)
+    if d == 0:
+        raise ValueError("至少需要一個輸入")
+    if spec["blend"] and not use_blend and not blend_dict:
+        raise ValueError("固定配方時需指定 blend_dict")
+
+    rng = np.random.default_rng(seed)
+    start = time.perf_counter()
+    a, b = rng.random((n, d)), rng.random((n, d))
+    # 列順序：A、B、AB_1 … AB_d（AB_i 為 A 的第 i 欄換成 B 的）
+    stacked = np.empty(((d + 2) * n, d))
+    stacked[:n], stacked[n:2 * n] = a, b
+    for i in range(d):
+        block = stacked[(i + 2) * n:(i + 3) * n]
+        block[:] = a
+        block[:, i] = b[:, i]
+    columns = {p: np.full(len(stacked), v) for p, v in fixed.items()}
+    for i, p in enumerate(params):
+        _, lo, hi, _, _ = spec["parameters"][p]
+        columns[p] = lo + stacked[:, i] * (hi - lo)
+    if use_blend:
+        ratios = stacked[:, len(params):] * 100
+    elif spec["blend"]:
+        from .materials import blend_vector
+
+        ratios = blend_vector(blend_dict)
+    else:
+        ratios = np.ones((1, len(MATERIALS)))
+
+    with timed(f"sensitivity.sobol.{model}", rows=len(stacked)):
+        outputs = _evaluate_chunked(model, columns, ratios)
+    first, total, first_conf, total_conf, variance = {}, {}, {}, {}, {}
+    for k, v in outputs.items():
+        # 先扣掉平均值：估計式的變異與輸出平均值大小有關，扣除後信賴區間小很多
+        v = v - v[:2 * n].mean()
+        f_a, f_b = v[:n], v[n:2 * n]
+        f_ab = v[2 * n:].reshape(d, n)
+        var = float(np.var(v[:2 * n]))
+        variance[k] = var
+        if var <= 1e-24:
+            zeros = np.zeros(d)
+            first[k] = total[k] = first_conf[k] = total_conf[k] = zeros
+            continue
+        s1_terms = f_b * (f_ab - f_a)  # Saltelli (2010)
+        st_terms = 0.5 * (f_a - f_ab) ** 2  # Jansen (1999)
+        first[k] = s1_terms.mean(axis=1) / var
+        total[k] = st_terms.mean(axis=1) / var
+        first_conf[k] = 1.96 * s1_terms.std(axis=1) / np.sqrt(n) / var
+        total_conf[k] = 1.96 * st_terms.std(axis=1) / np.sqrt(n) / var
+    frame = lambda data: pd.DataFrame(data, index=names)
+    return SobolResult(model, n, frame(first), frame(total), frame(first_conf), frame(total_conf), variance,
+                       input_labels(model, use_blend), time.perf_counter() - start)
@@ -0,0 +1,475 @@
+"""本機 HTTP/JSON 模擬服務（只用標準函式庫的 asyncio），供 MES 看板、配方規劃
+notebook 等其他系統直接呼叫模型，不必爬 Streamlit 畫面或複製公式。
+
+    python -m extrusion_core.server --port 8765
+
+    GET  /health              服務狀態與排隊數
+    GET  /models              各模型的參數與預設值
+    GET  /metrics             Prometheus 文字格式
+    POST /simulate/<模型>     單筆：{"temp": 150, "rpm": 300, "blend": {"玉米粉": 100}}
+    POST /bulk/<模型>         NDJSON 每行一筆，結果以 NDJSON 逐塊串流回傳
+
+模型為 v2、v3（含能耗）、v35；未給的製程參數用 App 滑桿的預設值。同時到達的單筆
+請求會合併成一批走向量化計算（micro-batch），結果與逐筆呼叫 simulate_* 相同。
+保護措施：連線數上限、每個模型的排隊上限（超過回 503 並附 Retry-After）、單筆
+請求大小上限（413），以及同時進行的 bulk 串流數上限；bulk 只在寫出結果後才繼續
+讀取請求，客戶端讀得慢時 TCP 會自然反壓。
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from .cli import MODEL_ARGUMENTS
+from .materials import MATERIAL_IDS, MATERIALS, V35_FLAVORS
+from .metrics import cache_gauges, get_metrics, timed
+from .sweep import SWEEP_PARAMETERS
+
+SERVICE_MODELS = ("v2", "v3", "v35")
+MAX_BODY_BYTES = 64 * 1024
+MAX_LINE_BYTES = 16 * 1024
+BULK_CHUNK_ROWS = 2000
+HEADER_TIMEOUT = 30.0
+JSON_TYPE = "application/json; charset=utf-8"
+# json.loads 對過深的巢狀陣列 / 物件會遞迴過深（RecursionError），視為格式錯誤
+NESTING_ERROR = "JSON 巢狀層數過多"
+
+_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+            413: "Payload Too Large", 500: "Internal Server Error", 503: "Service Unavailable"}
+
+
+class RequestError(Exception):
+    """回給客戶端的錯誤（HTTP 狀態碼 + 訊息）。"""
+
+    def __init__(self, status, message, headers=None):
+        super().__init__(message)
+        self.status = status
+        self.headers = headers or {}
+
+
+# --------- 請求內容 → 模型輸入 ---------
+def parse_record(model, record):
+    """一筆 JSON 物件轉成 (製程參數 tuple, 1×6 原料比例)；格式錯誤報 ValueError。"""
+    if not isinstance(record, dict):
+        raise ValueError("每筆資料需為 JSON 物件")
+    params = MODEL_ARGUMENTS[model]
+    unknown = set(record) - set(params) - {"blend", "id"}
+    if unknown:
+        raise ValueError(f"未知的欄位：{', '.join(sorted(unknown))}")
+    blend = record.get("blend")
+    if not isinstance(blend, dict) or not blend:
+        raise ValueError("需要 blend：{原料: 比例}")
+    ratios = np.zeros(len(MATERIALS))
+    for mat, ratio in blend.items():
+        if mat not in MATERIAL_IDS:
+            raise ValueError(f"未知的原料：{mat}")
+        ratios[MATERIAL_IDS[mat]] += float(ratio)
+    # NaN 與任何值比較都是 False，需先擋掉，否則會在整批計算時才出錯
+    if not np.isfinite(ratios).all() or (ratios < 0).any():
+        raise ValueError("原料比例需為有限的非負數")
+    if ratios.sum() <= 0:
+        raise ValueError("原料比例總和需大於 0")
+    values = tuple(float(record.get(p, SWEEP_PARAMETERS[p][3])) for p in params)
+    bad = [p for p, v in zip(params, values) if not np.isfinite(v)]
+    if bad:
+        raise ValueError(f"參數需為有限數值：{', '.join(bad)}")
+    return values, ratios
+
+
+def simulate_rows(model, rows):
+    """[(製程參數, 原料比例), ...] 整批計算，回傳每筆的結果 dict（v35 另含 flavors）。"""
+    from .models import MODELS
+
+    values = np.array([r[0] for r in rows], dtype=float).reshape(len(rows), -1)
+    ratios = np.array([r[1] for r in rows], dtype=float).reshape(len(rows), len(MATERIALS))
+    columns = {p: values[:, i] for i, p in enumerate(MODEL_ARGUMENTS[model])}
+    with timed(f"service.simulate.{model}", rows=len(rows)):
+        outputs = MODELS[model]["batch"](ratios=ratios, **columns)
+    flavors = outputs.pop("風味比例", None)
+    names = list(outputs)
+    columns = []
+    for k in names:
+        values = outputs[k].tolist()
+        if outputs[k].dtype.kind == "f" and not np.isfinite(outputs[k]).all():
+            # JSON 沒有 NaN / Infinity（例如螺桿直徑為 0 時的壓力），改回傳 null
+            values = [v if math.isfinite(v) else None for v in values]
+        columns.append(values)
+    results = [{"results": dict(zip(names, row))} for row in zip(*columns)]
+    if flavors is not None:
+        for out, pct, used in zip(results, flavors.tolist(), (ratios > 0).tolist()):
+            out["flavors"] = {V35_FLAVORS[j]: pct[j] for j in range(len(MATERIALS)) if used[j]}
+    return results
+
+
+def simulate_isolated(model, rows):
+    """同 simulate_rows，但一筆出錯不影響同批其他筆：整批失敗時改為逐筆重算，
+    出錯的那筆回傳例外物件。"""
+    try:
+        return simulate_rows(model, rows)
+    except Exception as e:
+        if len(rows) == 1:
+            return [e]
+    results = []
+    for row in rows:
+        try:
+            results.append(simulate_rows(model, [row])[0])
+        except Exception as e:
+            results.append(e)
+    return results
+
+
+# --------- 合併同時到達的單筆請求 ---------
+class Overloaded(Exception):
+    pass
+
+
+class MicroBatcher:
+    """把同時到達的單筆請求收成一批（最多 max_batch 筆，最多多等 max_wait 秒）
+    交給執行緒池做向量化計算；排隊超過 max_pending 筆時 submit() 報 Overloaded。"""
+
+    def __init__(self, model, executor, max_batch=512, max_wait=0.002, max_pending=10_000):
+        self.model = model
+        self.executor = executor
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.max_pending = max_pending
+        self._queue = asyncio.Queue()
+        self._task = None
+
+    @property
+    def pending(self):
+        return self._queue.qsize()
+
+    async def submit(self, row):
+        if self._queue.qsize() >= self.max_pending:
+            raise Overloaded(self.model)
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((row, future))
+        return await future
+
+    def _drain(self, batch):
+        while len(batch) < self.max_batch and not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            self._drain(batch)
+            if len(batch) < self.max_batch and self.max_wait > 0:
+                await asyncio.sleep(self.max_wait)
+                self._drain(batch)
+            batch = [(row, f) for row, f in batch if not f.cancelled()]
+            if not batch:
+                continue
+            try:
+                results = await loop.run_in_executor(self.executor, simulate_isolated, self.model,
+                                                     [r for r, _ in batch])
+            except Exception as e:
+                # 例如 executor 已關閉：整批的請求都回報同一個錯誤
+                results = [e] * len(batch)
+            for (_, future), result in zip(batch, results):
+                if future.done():
+                    continue
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+
+# --------- HTTP ---------
+async def _read_head(reader):
+    line = await reader.readline()
+    if not line:
+        return None
+    try:
+        method, target, version = line.decode("latin-1").split()
+    except ValueError:
+        raise RequestError(400, "無法解析請求列")
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        if len(headers) >= 100:
+            raise RequestError(400, "標頭過多")
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    return method, target, version, headers
+
+
+async def _iter_body(reader, headers, limit=None):
+    # 依 Content-Length 或 chunked 逐段讀取請求內容；limit 為總大小上限，
+    # chunk 大小由客戶端指定，先檢查再讀，且每次最多讀 64 KB
+    if headers.get("transfer-encoding", "").lower() == "chunked":
+        total = 0
+        while True:
+            try:
+                size = int((await reader.readline()).split(b";")[0].strip() or b"0", 16)
+            except ValueError:
+                raise RequestError(400, "無法解析 chunk 大小")
+            if size == 0:
+                while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    pass
+                return
+            total += size
+            if limit is not None and total > limit:
+                raise RequestError(413, f"請求內容超過 {limit} bytes")
+            while size > 0:
+                data = await reader.readexactly(min(size, 64 * 1024))
+                size -= len(data)
+                yield data
+            await reader.readline()
+    else:
+        remaining = int(headers.get("content-length", 0))
+        while remaining > 0:
+            data = await reader.read(min(remaining, 64 * 1024))
+            if not data:
+                raise RequestError(400, "請求內容不完整")
+            remaining -= len(data)
+            yield data
+
+
+async def _read_body(reader, headers, limit):
+    if int(headers.get("content-length", 0)) > limit:
+        raise RequestError(413, f"請求內容超過 {limit} bytes")
+    parts, size = [], 0
+    async for part in _iter_body(reader, headers, limit):
+        size += len(part)
+        if size > limit:
+            raise RequestError(413, f"請求內容超過 {limit} bytes")
+        parts.append(part)
+    return b"".join(parts)
+
+
+async def _iter_lines(reader, headers):
+    buffer = b""
+    async for part in _iter_body(reader, headers):
+        buffer += part
+        *lines, buffer = buffer.split(b"\n")
+        if len(buffer) > MAX_LINE_BYTES:
+            raise RequestError(413, f"單行超過 {MAX_LINE_BYTES} bytes")
+        for line in lines:
+            yield line
+    if buffer:
+        yield buffer
+
+
+def _response(status, body, content_type=JSON_TYPE, headers=None, keep_alive=True):
+    head = [f"HTTP/1.1 {status} {_REASONS.get(status, '')}", f"Content-Type: {content_type}",
+            f"Content-Length: {len(body)}", f"Connection: {'keep-alive' if keep_alive else 'close'}"]
+    head += [f"{k}: {v}" for k, v in (headers or {}).items()]
+    return ("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + body
+
+
+def _json(data):
+    return json.dumps(data, ensure_ascii=False).encode("utf-8")
+
+
+class SimulationService:
+    """HTTP 服務本體；start() 後以 serve_forever() 或 close() 控制。"""
+
+    def __init__(self, host="127.0.0.1", port=8765, max_batch=512, max_wait=0.002, max_pending=10_000,
+                 max_connections=1024, max_bulk=2, workers=2):
+        self.host = host
+        self.port = port
+        self.max_connections = max_connections
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="simulate")
+        self.batchers = {m: MicroBatcher(m, self.executor, max_batch, max_wait, max_pending) for m in SERVICE_MODELS}
+        self.bulk_slots = asyncio.Semaphore(max_bulk)
+        self.connections = 0
+        self.server = None
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._handle, self.host, self.port, limit=MAX_LINE_BYTES * 4)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self
+
+    async def serve_forever(self):
+        async with self.server:
+            await self.server.serve_forever()
+
+    async def close(self):
+        self.server.close()
+        await self.server.wait_closed()
+        for batcher in self.batchers.values():
+            await batcher.close()
+        self.executor.shutdown(wait=False)
+
+    async def _handle(self, reader, writer):
+        self.connections += 1
+        try:
+            if self.connections > self.max_connections:
+                writer.write(_response(503, _json({"error": "連線數已達上限"}), headers={"Retry-After": "1"},
+                                       keep_alive=False))
+                return
+            while True:
+                try:
+                    head = await asyncio.wait_for(_read_head(reader), HEADER_TIMEOUT)
+                except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+                    return
+                except RequestError as e:
+                    writer.write(_response(e.status, _json({"error": str(e)}), keep_alive=False))
+                    return
+                if head is None:
+                    return
+                method, target, version, headers = head
+                keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+                started = time.perf_counter()
+                try:
+                    streamed = await self._dispatch(method, target.split("?")[0], headers, reader, writer)
+                except RequestError as e:
+                    # 請求內容可能還沒讀完，錯誤之後不再沿用此連線
+                    keep_alive = False
+                    writer.write(_response(e.status, _json({"error": str(e)}), headers=e.headers, keep_alive=False))
+                    streamed = None
+                except Exception as e:
+                    keep_alive = False
+                    writer.write(_response(500, _json({"error": f"{type(e).__name__}: {e}"}), keep_alive=False))
+                    streamed = None
+                else:
+                    if streamed is None:
+                        # bulk 已自行串流回應並以 Connection: close 結束
+                        keep_alive = False
+                    else:
+                        writer.write(_response(*streamed, keep_alive=keep_alive))
+                get_metrics().observe("service.request", time.perf_counter() - started)
+                await writer.drain()
+                if not keep_alive:
+                    return
+        except ConnectionError:
+            pass
+        finally:
+            self.connections -= 1
+            writer.close()
+
+    async def _dispatch(self, method, path, headers, reader, writer):
+        """一般請求回傳 (狀態碼, 內容[, content_type[, headers]])；bulk 自行串流寫出，回傳 None。"""
+        parts = path.strip("/").split("/")
+        if parts == ["health"]:
+            pending = {m: b.pending for m, b in self.batchers.items()}
+            return 200, _json({"status": "ok", "pending": pending, "connections": self.connections})
+        if parts == ["models"]:
+            return 200, _json({
+                m: {"params": {p: SWEEP_PARAMETERS[p][3] for p in MODEL_ARGUMENTS[m]}, "materials": list(MATERIALS)}
+                for m in SERVICE_MODELS
+            })
+        if parts == ["metrics"]:
+            text = get_metrics().prometheus_text(cache_gauges())
+            return 200, text.encode("utf-8"), "text/plain; version=0.0.4"
+        if len(parts) == 2 and parts[0] in ("simulate", "bulk"):
+            if parts[1] not in SERVICE_MODELS:
+                raise RequestError(404, f"模型需為 {', '.join(SERVICE_MODELS)} 之一")
+            if method != "POST":
+                raise RequestError(405, "請用 POST")
+            if parts[0] == "simulate":
+                return await self._simulate(parts[1], headers, reader)
+            await self._bulk(parts[1], headers, reader, writer)
+            return None
+        raise RequestError(404, f"沒有此路徑：{path}")
+
+    async def _simulate(self, model, headers, reader):
+        body = await _read_body(reader, headers, MAX_BODY_BYTES)
+        # 內容已完整讀取，以下錯誤回應後連線仍可沿用
+        try:
+            row = parse_record(model, json.loads(body))
+        except (ValueError, TypeError) as e:
+            return 400, _json({"error": str(e)})
+        except RecursionError:
+            return 400, _json({"error": NESTING_ERROR})
+        try:
+            result = await self.batchers[model].submit(row)
+        except Overloaded:
+            return 503, _json({"error": "排隊請求過多，請稍後再試"}), JSON_TYPE, {"Retry-After": "1"}
+        return 200, _json(result)
+
+    async def _bulk(self, model, headers, reader, writer):
+        if self.bulk_slots.locked():
+            raise RequestError(503, "同時進行的批次請求已達上限", {"Retry-After": "5"})
+        loop = asyncio.get_running_loop()
+        async with self.bulk_slots:
+            writer.write(("HTTP/1.1 200 OK\r\nContent-Type: application/x-ndjson; charset=utf-8\r\n"
+                          "Transfer-Encoding: chunked\r\nConnection: close\r\n\r\n").encode("latin-1"))
+
+            async def flush(rows, meta):
+                out = []
+                if rows:
+                    results = await loop.run_in_executor(self.executor, simulate_isolated, model, [r for _, r in rows])
+                    for (i, _), result in zip(rows, results):
+                        meta[i].update({"error": str(result)} if isinstance(result, Exception) else result)
+                for item in meta.values():
+                    out.append(_json(item))
+                payload = b"\n".join(out) + b"\n"
+                writer.write(f"{len(payload):x}\r\n".encode("latin-1") + payload + b"\r\n")
+                # 客戶端讀得慢時在此等待，不再讀取更多請求內容
+                await writer.drain()
+
+            rows, meta, n = [], {}, 0
+            try:
+                async for line in _iter_lines(reader, headers):
+                    if not line.strip():
+                        continue
+                    n += 1
+                    try:
+                        record = json.loads(line)
+                        rows.append((n, parse_record(model, record)))
+                        meta[n] = {"line": n} if "id" not in record else {"line": n, "id": record["id"]}
+                    except (ValueError, TypeError) as e:
+                        meta[n] = {"line": n, "error": str(e)}
+                    except RecursionError:
+                        meta[n] = {"line": n, "error": NESTING_ERROR}
+                    if len(meta) >= BULK_CHUNK_ROWS:
+                        await flush(rows, meta)
+                        rows, meta = [], {}
+                if meta:
+                    await flush(rows, meta)
+            except (RequestError, ValueError, asyncio.IncompleteReadError) as e:
+                # 回應標頭已送出，錯誤改以最後一行 NDJSON 告知
+                await flush([], {0: {"error": str(e) or type(e).__name__}})
+            writer.write(b"0\r\n\r\n")
+            get_metrics().count("service.bulk_rows", n)
+
+
+async def serve(host, port, **options):
+    service = await SimulationService(host, port, **options).start()
+    print(f"模擬服務：http://{service.host}:{service.port}", file=sys.stderr)
+    await service.serve_forever()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m extrusion_core.server", description="本機 HTTP/JSON 模擬服務")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--max-batch", type=int, default=512, help="單筆請求合併成一批的上限，1 表示不合併")
+    parser.add_argument("--max-wait-ms", type=float, default=2.0, help="湊批次最多多等幾毫秒")
+    parser.add_argument("--max-pending", type=int, default=10_000, help="每個模型的排隊上限，超過回 503")
+    parser.add_argument("--max-connections", type=int, default=1024)
+    parser.add_argument("--max-bulk", type=int, default=2, help="同時進行的 bulk 串流上限")
+    parser.add_argument("--workers", type=int, default=2, help="計算用執行緒數")
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(serve(args.host, args.port, max_batch=args.max_batch, max_wait=args.max_wait_ms / 1000,
+                          max_pending=args.max_pending, max_connections=args.max_connections,
+                          max_bulk=args.max_bulk, workers=args.workers))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""單一工作階段的模擬紀錄：固定容量的環狀緩衝區，超過容量的舊紀錄寫入暫存檔。"""
+
+import csv
+import os
+import tempfile
+import weakref
+
+import numpy as np
+
+# 兩兩比較的矩陣為 紀錄數² 個 float，限制筆數以免一次點擊就用掉大量記憶體
+MAX_PAIRWISE = 500
+
+
+class RunHistory:
+    """依欄位順序存成 capacity × 欄位數的 float 陣列，新增一筆只寫一列，不會隨紀錄數變慢。
+
+    被擠出的最舊紀錄附加到暫存 CSV（spill_path），匯出時與記憶體中的紀錄接起來，
+    所以下載的仍是完整紀錄。每筆紀錄有從 1 起算的執行編號，擠出後編號不變。
+    """
+
+    def __init__(self, columns, capacity=500, spill_path=None):
+        self.columns = tuple(columns)
+        self.capacity = int(capacity)
+        self.total = 0
+        self.size = 0
+        self.spilled = 0
+        self._values = np.full((self.capacity, len(self.columns)), np.nan)
+        self._frame = None
+        if spill_path is None:
+            fd, spill_path = tempfile.mkstemp(prefix="extrusion_history_", suffix=".csv")
+            os.close(fd)
+            weakref.finalize(self, _remove, spill_path)
+        self.spill_path = spill_path
+
+    def __len__(self):
+        return self.size
+
+    def _spill(self, rows, run_ids):
+        with open(self.spill_path, "a", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            if self.spilled == 0:
+                writer.writerow(("編號",) + self.columns)
+            for run_id, row in zip(run_ids, rows):
+                writer.writerow([int(run_id)] + row.tolist())
+        self.spilled += len(rows)
+
+    def append(self, record):
+        """加入一筆紀錄（欄位名稱 → 數值），缺少的欄位記為 NaN；回傳執行編號。"""
+        pos = self.total % self.capacity
+        if self.size == self.capacity:
+            self._spill(self._values[pos:pos + 1], [self.total - self.size + 1])
+        else:
+            self.size += 1
+        self._values[pos] = [record.get(c, np.nan) for c in self.columns]
+        self.total += 1
+        self._frame = None
+        return self.total
+
+    def set_capacity(self, capacity):
+        """變更容量；縮小時多出的最舊紀錄寫入暫存檔。"""
+        capacity = int(capacity)
+        if capacity == self.capacity:
+            return
+        values, ids = self.values(), self.run_ids()
+        drop = max(len(values) - capacity, 0)
+        if drop:
+            self._spill(values[:drop], ids[:drop])
+        kept = values[drop:]
+        self._values = np.full((capacity, len(self.columns)), np.nan)
+        # 保持「第 total 筆在 (total - 1) % capacity」的對應關係
+        self._values[np.arange(self.total - len(kept), self.total) % capacity] = kept
+        self.capacity = capacity
+        self.size = len(kept)
+        self._frame = None
+
+    def values(self):
+        """記憶體中的紀錄，由舊到新排列（len × 欄位數）；未繞回時為緩衝區的檢視，不複製。"""
+        start = (self.total - self.size) % self.capacity
+        if start + self.size <= self.capacity:
+            return self._values[start:start + self.size]
+        return self._values[np.arange(start, start + self.size) % self.capacity]
+
+    def run_ids(self):
+        return np.arange(self.total - self.size + 1, self.total + 1)
+
+    def _rows(self, runs):
+        # 執行編號 → 記憶體中由舊到新的列位置；已寫入暫存檔的編號報 KeyError
+        ids = self.run_ids()
+        if runs is None:
+            return np.arange(len(ids))
+        runs = np.atleast_1d(np.asarray(runs, dtype=ids.dtype))
+        rows = np.clip(np.searchsorted(ids, runs), 0, max(len(ids) - 1, 0))
+        if len(ids) == 0 or (ids[rows] != runs).any():
+            raise KeyError(f"紀錄不在記憶體中：{sorted(set(runs.tolist()) - set(ids.tolist()))}")
+        return rows
+
+    def frame(self):
+        """記憶體中紀錄的 DataFrame，索引為執行編號；下一次 append 之前重複取用同一個物件。"""
+        if self._frame is None:
+            import pandas as pd
+
+            self._frame = pd.DataFrame(self.values(), columns=self.columns,
+                                       index=pd.Index(self.run_ids(), name="編號"))
+        return self._frame
+
+    def to_csv(self):
+        """完整紀錄（含寫入暫存檔的部分）的 CSV bytes。"""
+        if self.spilled:
+            with open(self.spill_path, "rb") as f:
+                head = f.read()
+            return head + self.frame().to_csv(header=False).encode("utf-8")
+        return self.frame().to_csv().encode("utf-8")
+
+    def compare(self, columns, baseline, runs=None):
+        """以 baseline 這筆為基準，一次算出 runs（預設全部）各欄位的差異。
+
+        回傳 DataFrame，索引為執行編號，欄為 columns；只比較記憶體中的紀錄。
+        """
+        import pandas as pd
+
+        ids = self.run_ids()
+        idx = [self.columns.index(c) for c in columns]
+        values = self.values()[:, idx]
+        base = values[self._rows(baseline)[0]]
+        rows = self._rows(runs)
+        return pd.DataFrame(np.round(values[rows] - base, 3), columns=list(columns),
+                            index=pd.Index(ids[rows], name="編號"))
+
+    def pairwise(self, column, runs=None):
+        """所有紀錄兩兩之間某欄位的差異矩陣：第 i 列第 j 欄 = 第 i 筆 − 第 j 筆。
+
+        超過 MAX_PAIRWISE 筆時報 ValueError。
+        """
+        import pandas as pd
+
+        ids = self.run_ids()
+        rows = self._rows(runs)
+        if len(rows) > MAX_PAIRWISE:
+            raise ValueError(f"兩兩比較最多 {MAX_PAIRWISE} 筆，目前 {len(rows):,} 筆")
+        v = self.values()[rows, self.columns.index(column)]
+        labels = pd.Index(ids[rows], name="編號")
+        return pd.DataFrame(np.round(v[:, None] - v[None, :], 3), index=labels, columns=labels)
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
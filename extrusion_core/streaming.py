@@ -0,0 +1,44 @@
+import tempfile
+
+import pandas as pd
+
+from .batch import simulate_blended_frame
+from .materials import MATERIALS
+from .metrics import timed
+
+DEFAULT_CHUNK_ROWS = 50_000
+# 輸出超過此大小就從記憶體轉存到暫存檔
+SPOOL_MAX_BYTES = 32 * 1024 * 1024
+
+
+def iter_simulated_chunks(source, chunksize=DEFAULT_CHUNK_ROWS, workers=1):
+    """逐塊讀取 CSV 並模擬，每次只保留一塊資料在記憶體中。"""
+    material_columns = None
+    reader = pd.read_csv(source, chunksize=chunksize)
+    while True:
+        with timed("csv.read"):
+            chunk = next(reader, None)
+        if chunk is None:
+            return
+        if material_columns is None:
+            # 以第一塊的表頭決定輸出欄位，之後每塊都沿用
+            material_columns = [mat for mat in MATERIALS if mat in chunk.columns]
+        yield simulate_blended_frame(chunk, material_columns=material_columns, workers=workers)
+
+
+def stream_simulation_csv(source, out=None, chunksize=DEFAULT_CHUNK_ROWS, progress=None, workers=1):
+    """讀取 → 模擬 → 寫出，逐塊完成，回傳 (輸出檔, 總列數)。
+
+    out 預設為 SpooledTemporaryFile；progress(塊數, 累計列數) 於每塊寫出後呼叫。
+    """
+    if out is None:
+        out = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES, mode="w+b")
+    rows = 0
+    for i, frame in enumerate(iter_simulated_chunks(source, chunksize, workers)):
+        with timed("csv.write", rows=len(frame)):
+            out.write(frame.to_csv(index=False, header=(i == 0)).encode("utf-8"))
+        rows += len(frame)
+        if progress is not None:
+            progress(i + 1, rows)
+    out.seek(0)
+    return out, rows
@@ -0,0 +1,443 @@
+"""預先計算的查表替代模型：在製程參數格點上把各輸出算好存成 .npy，查詢時內插。
+
+- 原料：v3.5 與分區模型的輸出對原料權重都是線性的（原料性質的加權和），所以每個
+  輸出對六種純原料各存一份表，查詢時以配方權重加權，配方方向沒有內插誤差
+- 格點：每個參數在滑桿範圍內等距取 points 個點；某個輸出與哪些參數有關先在隨機點
+  上探測，無關的參數不佔維度（例如 v3.5 的水活性只有水含量、油脂兩維）
+- 儲存：有關參數相同的輸出放在同一個 .npy（形狀為 各參數點數 × 原料數 × 輸出數），
+  另有 manifest.json；
+  np.load(mmap_mode="r") 直接映射檔案，啟動時不複製，多個行程共用同一份分頁快取
+
+    python -m extrusion_core.surrogate build --model barrel --zones 100 --points 5 temp=9
+    python -m extrusion_core.surrogate report --model barrel --zones 100 --samples 20000
+
+表的版本為模型版本（MODEL_VERSIONS / BARREL_VERSION），模型改版後舊表不再使用。
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import threading
+import time
+
+import numpy as np
+
+from .materials import MATERIALS
+from .metrics import timed
+from .sweep import SWEEP_PARAMETERS
+
+DEFAULT_POINTS = 5
+PROBES = 64
+CHUNK_ROWS = 100_000
+LOOKUP_ROWS = 8192
+
+
+def _v35(params, ratios, zones):
+    from .models import V35_RESULT_COLUMNS, simulate_v35_batch
+
+    n = len(next(iter(params.values())))
+    result = simulate_v35_batch(ratios=ratios, rounding=False, **params)
+    return {k: np.broadcast_to(np.asarray(result[k], dtype=float), n) for k in V35_RESULT_COLUMNS}
+
+
+def _barrel(params, ratios, zones):
+    from .barrel import simulate_barrel_batch
+
+    return simulate_barrel_batch(ratios=ratios, zones=zones, keep_profiles=False, **params).exit
+
+
+def _version(model):
+    if model == "barrel":
+        from .barrel import BARREL_VERSION
+
+        return BARREL_VERSION
+    from .models import MODEL_VERSIONS
+
+    return MODEL_VERSIONS[model]
+
+
+# 可查表的模型：evaluate(params, ratios, zones) → {輸出: 長度 N 的陣列}，params 為 8 個製程參數
+SURROGATE_MODELS = {
+    "v35": {"evaluate": _v35, "zones": False},
+    "barrel": {"evaluate": _barrel, "zones": True},
+}
+
+
+def table_path(model, zones=None, root=None):
+    """查表目錄：root（預設 EXTRUSION_SURROGATE_DIR 或 surrogate_tables）下的 v35、barrel-<zones>。"""
+    root = root or os.environ.get("EXTRUSION_SURROGATE_DIR", "surrogate_tables")
+    return os.path.join(root, f"barrel-{zones}" if model == "barrel" else model)
+
+
+def _evaluate(model, params, ratios, zones):
+    # 分塊計算，避免分區模型一次配置 設定數 × 區段數 的暫存陣列
+    evaluate = SURROGATE_MODELS[model]["evaluate"]
+    n = len(next(iter(params.values())))
+    parts = []
+    for lo in range(0, n, CHUNK_ROWS):
+        block = slice(lo, lo + CHUNK_ROWS)
+        parts.append(evaluate({p: v[block] for p, v in params.items()},
+                              ratios[block] if len(ratios) > 1 else ratios, zones))
+    return {k: np.concatenate([np.asarray(part[k], dtype=float) for part in parts]) for k in parts[0]}
+
+
+def _probe(model, axes, zones, seed=0):
+    """在隨機點上逐一改變每個參數（與原料），回傳 {輸出: (有關的參數, 是否與原料有關)}。"""
+    rng = np.random.default_rng(seed)
+    names = list(SWEEP_PARAMETERS)
+    base = {p: rng.uniform(axes[p][0], axes[p][-1], PROBES) if p in axes else np.full(PROBES, float(SWEEP_PARAMETERS[p][3]))
+            for p in names}
+    basis = np.eye(len(MATERIALS))[rng.integers(0, len(MATERIALS), PROBES)] * 100
+    ref = _evaluate(model, base, basis, zones)
+    tol = {k: 1e-9 * (1 + np.abs(v)) for k, v in ref.items()}
+    relevant = {k: [] for k in ref}
+    for p in axes:
+        moved = dict(base, **{p: rng.uniform(axes[p][0], axes[p][-1], PROBES)})
+        for k, v in _evaluate(model, moved, basis, zones).items():
+            if (np.abs(v - ref[k]) > tol[k]).any():
+                relevant[k].append(p)
+    other = np.roll(basis, 1, axis=1)
+    blend = {k: bool((np.abs(v - ref[k]) > tol[k]).any()) for k, v in _evaluate(model, base, other, zones).items()}
+    return {k: (tuple(relevant[k]), blend[k]) for k in ref}
+
+
+def build(model, path=None, points=DEFAULT_POINTS, zones=None, ranges=None, fixed=None, progress=None):
+    """在格點上計算 model 的所有輸出並寫入 path（先寫到暫存目錄再改名），回傳 SurrogateTable。
+
+    points 為每個參數的點數（整數或 {參數: 點數}，未列出的用 DEFAULT_POINTS）；ranges 可把
+    某些參數的範圍縮小為 {參數: (下限, 上限)}；fixed 的參數不建維度，固定為該值（預設
+    全部參數都建維度）。zones 只用於分區模型。
+    """
+    from .barrel import DEFAULT_ZONES
+
+    spec = SURROGATE_MODELS[model]
+    zones = (zones or DEFAULT_ZONES) if spec["zones"] else None
+    path = path or table_path(model, zones)
+    fixed = dict(fixed or {})
+    ranges = dict(ranges or {})
+    counts = points if isinstance(points, dict) else {}
+    default = DEFAULT_POINTS if isinstance(points, dict) else int(points)
+    axes = {}
+    for p, (_, lo, hi, _) in SWEEP_PARAMETERS.items():
+        if p in fixed:
+            continue
+        n = int(counts.get(p, default))
+        if n < 2:
+            raise ValueError(f"{p} 至少需要 2 個格點")
+        lo, hi = ranges.get(p, (lo, hi))
+        axes[p] = np.linspace(float(lo), float(hi), n)
+    start = time.perf_counter()
+    probe = _probe(model, axes, zones)
+    order = list(probe)
+    groups = {}
+    for k, dims in probe.items():
+        groups.setdefault(dims, []).append(k)
+
+    tmp = f"{path}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    tables, evaluations = [], 0
+    with timed(f"surrogate.build.{model}"):
+        for g, ((params, blend), names) in enumerate(groups.items()):
+            # 形狀：各參數點數 × 原料數 × 輸出數；同一格點的所有值相鄰，內插時每個角只取一段連續記憶體
+            bases = np.eye(len(MATERIALS)) * 100 if blend else np.eye(len(MATERIALS))[:1] * 100
+            grid = tuple(len(axes[p]) for p in params) + (len(bases),)
+            array = np.lib.format.open_memmap(os.path.join(tmp, f"table_{g}.npy"), mode="w+",
+                                              shape=grid + (len(names),))
+            rows = array.reshape(-1, len(names))
+            total = len(rows)
+            for lo in range(0, total, CHUNK_ROWS):
+                flat = np.arange(lo, min(lo + CHUNK_ROWS, total))
+                index = np.unravel_index(flat, grid)
+                columns = {p: np.full(len(flat), float(fixed.get(p, SWEEP_PARAMETERS[p][3]))) for p in SWEEP_PARAMETERS}
+                for p, i in zip(params, index):
+                    columns[p] = axes[p][i]
+                values = _evaluate(model, columns, bases[index[-1]], zones)
+                rows[flat] = np.column_stack([values[k] for k in names])
+                evaluations += len(flat)
+                if progress:
+                    progress(f"{'、'.join(names)}：{min(lo + CHUNK_ROWS, total):,} / {total:,}")
+            array.flush()
+            del array, rows
+            tables.append({"file": f"table_{g}.npy", "params": list(params), "blend": blend, "outputs": names})
+        manifest = {
+            "model": model,
+            "version": _version(model),
+            "zones": zones,
+            "materials": list(MATERIALS),
+            "axes": {p: v.tolist() for p, v in axes.items()},
+            "fixed": fixed,
+            "outputs": order,
+            "tables": tables,
+            "evaluations": evaluations,
+            "seconds": time.perf_counter() - start,
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        }
+        with open(os.path.join(tmp, "manifest.json"), "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=1)
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp, path)
+    return SurrogateTable(path)
+
+
+class SurrogateTable:
+    """載入的查表。各表以 np.load(mmap_mode="r") 映射，不讀進記憶體。"""
+
+    def __init__(self, path):
+        with open(os.path.join(path, "manifest.json"), encoding="utf-8") as f:
+            self.manifest = json.load(f)
+        if self.manifest["materials"] != list(MATERIALS):
+            raise ValueError("查表的原料順序與目前的原料表不同，請重新建立")
+        self.path = path
+        self.model = self.manifest["model"]
+        self.zones = self.manifest["zones"]
+        self.axes = {p: np.array(v) for p, v in self.manifest["axes"].items()}
+        self.fixed = self.manifest["fixed"]
+        self.outputs = list(self.manifest["outputs"])
+        # np.asarray 只去掉 memmap 子類別（索引較快），仍是同一份映射，不複製
+        self.tables = [dict(spec, values=np.asarray(np.load(os.path.join(path, spec["file"]), mmap_mode="r")))
+                       for spec in self.manifest["tables"]]
+        self._mixed = {}
+
+    def dimensions(self, output):
+        """output 的表有哪些參數維度。"""
+        return next(t["params"] for t in self.tables if output in t["outputs"])
+
+    @property
+    def stale(self):
+        """模型改版後為 True（表中的數值已不是目前模型的結果）。"""
+        return self.manifest["version"] != _version(self.model)
+
+    @property
+    def nbytes(self):
+        return sum(t["values"].nbytes for t in self.tables)
+
+    def lookup(self, ratios, outputs=None, method="simplex", **params):
+        """內插查表。params 為製程參數（純量或長度 N 的陣列，未給的用建表時固定的值或滑桿
+        預設值），ratios 為 N×6 或 1×6 的原料比例。回傳 {輸出: 長度 N 的陣列}。
+
+        參數超出格點範圍，或建表時固定的參數給了不同的值，都會報 ValueError（表中沒有
+        這些點的資訊，不外插也不夾在邊界上）。
+
+        method 見 INTERPOLATIONS：simplex（預設）每點取 d + 1 個格點（d 為該表的參數維度）；
+        multilinear 取 2^d 個，維度高時比直接計算模型還慢，只用於比對內插誤差。
+        """
+        from .batch import blend_weights
+
+        interpolate = INTERPOLATIONS[method]
+
+        _, weights = blend_weights(ratios)
+        values = {p: np.atleast_1d(np.asarray(params.get(p, self.fixed.get(p, SWEEP_PARAMETERS[p][3])), dtype=float))
+                  for p in SWEEP_PARAMETERS}
+        self._check(values)
+        n = max([len(weights)] + [len(v) for v in values.values()])
+        wanted = set(outputs or self.outputs)
+        result = {}
+        with timed("surrogate.lookup", rows=n):
+            for lo in range(0, n, LOOKUP_ROWS):
+                block = slice(lo, min(lo + LOOKUP_ROWS, n))
+                # 每個參數：左側格點編號與到右側格點的比例
+                cells = {}
+                for p, axis in self.axes.items():
+                    x = np.broadcast_to(values[p], n)[block]
+                    i = np.clip(np.searchsorted(axis, x, side="right") - 1, 0, len(axis) - 2)
+                    cells[p] = (i, np.clip((x - axis[i]) / (axis[i + 1] - axis[i]), 0.0, 1.0))
+                w = np.broadcast_to(weights, (n, weights.shape[1]))[block]
+                for g, table in enumerate(self.tables):
+                    names = [k for k in table["outputs"] if k in wanted]
+                    if not names:
+                        continue
+                    data = table["values"]
+                    if table["blend"] and len(weights) == 1:
+                        data = self._premix(g, weights[0])
+                    mixed = interpolate(data, [cells[p] for p in table["params"]], block.stop - lo)
+                    if data.shape[-2] > 1:
+                        # 配方方向是線性的：六種原料的內插值以配方權重加總
+                        mixed = np.einsum("nbk,nb->nk", mixed, w)
+                    else:
+                        mixed = mixed[:, 0]
+                    for k in names:
+                        result.setdefault(k, []).append(mixed[:, table["outputs"].index(k)])
+        return {k: np.concatenate(result[k]) for k in self.outputs if k in result}
+
+    def _check(self, values):
+        for p, v in values.items():
+            if p in self.fixed:
+                if not np.allclose(v, float(self.fixed[p]), rtol=0, atol=1e-9):
+                    raise ValueError(f"查表建立時 {p} 固定為 {self.fixed[p]}，不能查其他值")
+                continue
+            axis = self.axes[p]
+            tol = 1e-9 * (axis[-1] - axis[0])
+            if not ((v >= axis[0] - tol) & (v <= axis[-1] + tol)).all():
+                raise ValueError(f"{p} 超出查表範圍 {axis[0]:g}–{axis[-1]:g}")
+
+    def _premix(self, g, weights):
+        # 整批同一個配方（參數掃描）：先把六種原料的表以權重加成一份，每個角只取一個值；
+        # 保留最近一個配方的結果
+        key = (g, weights.tobytes())
+        if key not in self._mixed:
+            values = self.tables[g]["values"]
+            mixed = np.tensordot(values, weights, axes=([values.ndim - 2], [0]))
+            self._mixed = {k: v for k, v in self._mixed.items() if k[0] != g}
+            self._mixed[key] = mixed[..., None, :]
+        return self._mixed[key]
+
+
+def _multilinear(values, cells, n):
+    # values 形狀為 各參數點數 × 原料數 × 輸出數；回傳 n × 原料數 × 輸出數。
+    # 2^d 個角的位移與權重逐維展開（每多一維，角的數目加倍），再逐角取值累加
+    grid = values.shape[:len(cells)]
+    rows = values.reshape(-1, *values.shape[len(cells):])
+    strides = np.cumprod((1,) + grid[::-1])[:-1][::-1]
+    offsets, factors = [np.zeros(n, dtype=np.int64)], [np.ones(n)]
+    for (i, t), stride in zip(cells, strides):
+        base = i * stride
+        offsets = [o + base for o in offsets] + [o + base + stride for o in offsets]
+        factors = [f * (1 - t) for f in factors] + [f * t for f in factors]
+    out = np.zeros((n,) + rows.shape[1:])
+    for offset, factor in zip(offsets, factors):
+        out += factor[:, None, None] * rows[offset]
+    return out
+
+
+def _simplex(values, cells, n):
+    # Kuhn 單形內插：把格子依比例 t 由大到小排序的方向拆成 d! 個單形，每點只取所在
+    # 單形的 d + 1 個頂點（從左下角出發，依序沿 t 最大、次大…的維度走一格）
+    grid = values.shape[:len(cells)]
+    rows = values.reshape(-1, *values.shape[len(cells):])
+    if not cells:
+        return np.broadcast_to(rows[0], (n,) + rows.shape[1:]).copy()
+    strides = np.cumprod((1,) + grid[::-1])[:-1][::-1]
+    index = np.column_stack([i for i, _ in cells])
+    t = np.column_stack([t for _, t in cells])
+    order = np.argsort(-t, axis=1, kind="stable")
+    t = np.take_along_axis(t, order, axis=1)
+    steps = strides[order]
+    weights = np.concatenate([1 - t[:, :1], t[:, :-1] - t[:, 1:], t[:, -1:]], axis=1)
+    offset = index @ strides
+    out = weights[:, 0, None, None] * rows[offset]
+    for k in range(len(cells)):
+        offset = offset + steps[:, k]
+        out += weights[:, k + 1, None, None] * rows[offset]
+    return out
+
+
+INTERPOLATIONS = {"multilinear": _multilinear, "simplex": _simplex}
+
+
+def error_report(table, samples=10_000, seed=0, method="simplex"):
+    """在格點範圍內均勻抽 samples 個點（配方亦隨機），比較查表（method 內插）與模型的結果。
+
+    回傳 DataFrame（列為輸出）：平均 / 最大絕對誤差、p99 絕對誤差、最大誤差佔輸出範圍的比例，
+    以及兩者的每秒列數。
+    """
+    import pandas as pd
+
+    rng = np.random.default_rng(seed)
+    params = {p: rng.uniform(axis[0], axis[-1], samples) for p, axis in table.axes.items()}
+    params.update({p: np.full(samples, float(v)) for p, v in table.fixed.items()})
+    for p, (_, _, _, default) in SWEEP_PARAMETERS.items():
+        params.setdefault(p, np.full(samples, float(default)))
+    ratios = rng.integers(0, 11, (samples, len(MATERIALS))).astype(float) * 10
+    ratios[ratios.sum(axis=1) == 0, 0] = 100
+
+    start = time.perf_counter()
+    approx = table.lookup(ratios, method=method, **params)
+    lookup_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    exact = _evaluate(table.model, params, ratios, table.zones)
+    exact_seconds = time.perf_counter() - start
+    rows = {}
+    for k in table.outputs:
+        error = np.abs(approx[k] - exact[k])
+        span = float(exact[k].max() - exact[k].min())
+        rows[k] = {
+            "平均絕對誤差": float(error.mean()),
+            "p99 絕對誤差": float(np.percentile(error, 99)),
+            "最大絕對誤差": float(error.max()),
+            "最大誤差 / 範圍": float(error.max() / span) if span > 0 else 0.0,
+            "維度": len(table.dimensions(k)),
+        }
+    report = pd.DataFrame.from_dict(rows, orient="index")
+    report.attrs["lookup_rows_per_s"] = samples / lookup_seconds
+    report.attrs["exact_rows_per_s"] = samples / exact_seconds
+    return report
+
+
+_loaded = {}
+_loaded_lock = threading.Lock()
+
+
+def get_surrogate(model, zones=None, root=None):
+    """整個行程共用的查表；目錄不存在或模型已改版時回傳 None（呼叫端改用模型計算）。"""
+    path = table_path(model, zones, root)
+    with _loaded_lock:
+        table = _loaded.get(path)
+        if table is None and os.path.exists(os.path.join(path, "manifest.json")):
+            table = _loaded[path] = SurrogateTable(path)
+    if table is None or table.stale:
+        return None
+    return table
+
+
+def _counts(items):
+    # 「5」為所有參數的點數，「temp=9」為單一參數
+    counts = {}
+    for item in items:
+        name, sep, value = item.partition("=")
+        if not sep:
+            counts["*"] = int(name)
+        elif name in SWEEP_PARAMETERS:
+            counts[name] = int(value)
+        else:
+            raise argparse.ArgumentTypeError(f"未知的參數：{name}")
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m extrusion_core.surrogate", description="預先計算的查表替代模型")
+    sub = parser.add_subparsers(dest="command", required=True)
+    for name, help in (("build", "在格點上計算並寫入查表"), ("report", "查表與模型的誤差報告")):
+        cmd = sub.add_parser(name, help=help)
+        cmd.add_argument("--model", choices=list(SURROGATE_MODELS), default="barrel")
+        cmd.add_argument("--zones", type=int, help="分區模型的區段數，預設 100")
+        cmd.add_argument("--dir", help="查表根目錄，預設 EXTRUSION_SURROGATE_DIR 或 surrogate_tables")
+        cmd.add_argument("--samples", type=int, default=10_000, help="誤差報告的抽樣點數")
+        cmd.add_argument("--method", choices=list(INTERPOLATIONS), default="simplex", help="誤差報告的內插方式")
+        cmd.add_argument("--json", action="store_true", help="誤差報告以 JSON 輸出")
+    sub.choices["build"].add_argument("--points", nargs="+", default=[], metavar="點數|參數=點數",
+                                      help=f"每個參數的格點數，預設 {DEFAULT_POINTS}")
+    args = parser.parse_args(argv)
+
+    from .barrel import DEFAULT_ZONES
+
+    zones = (args.zones or DEFAULT_ZONES) if SURROGATE_MODELS[args.model]["zones"] else None
+    path = table_path(args.model, zones, args.dir)
+    try:
+        if args.command == "build":
+            counts = _counts(args.points)
+            points = {p: counts.get(p, counts.get("*", DEFAULT_POINTS)) for p in SWEEP_PARAMETERS}
+            table = build(args.model, path, points, zones, progress=lambda m: print(m, file=sys.stderr))
+            manifest = table.manifest
+            print(f"{path}：{manifest['evaluations']:,} 次模型計算，{manifest['seconds']:.1f} 秒，"
+                  f"{table.nbytes / 2 ** 20:.1f} MB", file=sys.stderr)
+        else:
+            table = SurrogateTable(path)
+            if table.stale:
+                print(f"警告：{path} 的模型版本 {table.manifest['version']} 已過期", file=sys.stderr)
+    except (argparse.ArgumentTypeError, ValueError, FileNotFoundError) as e:
+        parser.exit(2, f"錯誤：{e}\n")
+    report = error_report(table, samples=args.samples, method=args.method)
+    if args.json:
+        print(json.dumps({"path": path, "method": args.method, "outputs": report.to_dict(orient="index"), **report.attrs},
+                         ensure_ascii=False))
+    else:
+        print(report.to_string(float_format=lambda v: f"{v:.4g}"))
+        print(f"查表 {report.attrs['lookup_rows_per_s']:,.0f} 列/秒，模型 {report.attrs['exact_rows_per_s']:,.0f} 列/秒")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
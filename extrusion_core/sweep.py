@@ -0,0 +1,153 @@
+import numpy as np
+
+from .materials import MATERIALS
+from .models import V35_RESULT_COLUMNS, simulate_v35_batch
+
+# --------- 可掃描的製程參數（與 v3.5 側邊欄滑桿相同範圍與預設值） ---------
+SWEEP_PARAMETERS = {
+    "temp": ("筒溫 (°C)", 60, 180, 140),
+    "rpm": ("轉速 (rpm)", 100, 600, 300),
+    "moisture": ("水含量 (%)", 10, 25, 15),
+    "fat": ("油脂含量 (%)", 0, 15, 5),
+    "screw_diameter": ("螺桿直徑 (mm)", 20, 60, 30),
+    "screw_length": ("螺桿長度 (mm)", 500, 1500, 1000),
+    "feed_rate": ("喂料速率 (kg/h)", 10, 100, 30),
+    "die_diameter": ("模口孔徑 (mm)", 2, 10, 5),
+}
+# 掃描點數上限：v3.5 公式的輸出依參數廣播，最多展開成完整網格（每點 7 欄 float32）；
+# 分區模型每點都要展開所有參數並逐段計算，上限較低
+MAX_SWEEP_POINTS = 5_000_000
+MAX_BARREL_POINTS = 1_000_000
+
+
+class SweepResult:
+    """參數掃描結果：以陣列保存，不逐點建立 dict。
+
+    全因子設計時 outputs 中每個欄位是形狀為 (len(axes[p]) for p in params) 的
+    多維陣列；拉丁超立方設計時為長度 n 的一維陣列，各點座標放在 points。
+    只與原料有關的欄位以廣播檢視保存，不佔額外記憶體。
+    """
+
+    def __init__(self, design, params, axes, points, outputs, fixed):
+        self.design = design
+        self.params = params
+        self.axes = axes
+        self.points = points
+        self.outputs = outputs
+        self.fixed = fixed
+
+    @property
+    def size(self):
+        return next(iter(self.outputs.values())).size
+
+    def grid(self, output, x, y, bins=40, **at):
+        """取出 output 在 (y, x) 平面上的二維陣列，回傳 (x 座標, y 座標, 值)。
+
+        全因子設計時，其餘掃描參數以 at 指定的值（取最接近的格點，預設為中間格點）
+        切片；拉丁超立方設計時以 bins×bins 的格子取平均。
+        """
+        values = self.outputs[output]
+        if self.design == "factorial":
+            index = []
+            for p in self.params:
+                if p in (x, y):
+                    index.append(slice(None))
+                else:
+                    axis = self.axes[p]
+                    target = at.get(p, axis[len(axis) // 2])
+                    index.append(int(np.abs(axis - target).argmin()))
+            plane = np.asarray(values[tuple(index)], dtype=float)
+            if self.params.index(x) < self.params.index(y):
+                plane = plane.T
+            return self.axes[x], self.axes[y], plane
+
+        xs, ys = self.points[x], self.points[y]
+        x_edges = np.linspace(xs.min(), xs.max(), bins + 1)
+        y_edges = np.linspace(ys.min(), ys.max(), bins + 1)
+        total, _, _ = np.histogram2d(ys, xs, bins=(y_edges, x_edges), weights=np.asarray(values, dtype=float))
+        count, _, _ = np.histogram2d(ys, xs, bins=(y_edges, x_edges))
+        with np.errstate(invalid="ignore", divide="ignore"):
+            plane = total / count
+        return (x_edges[:-1] + x_edges[1:]) / 2, (y_edges[:-1] + y_edges[1:]) / 2, plane
+
+
+def _axis(start, stop, step):
+    # 與滑桿相同：包含終點
+    return np.arange(start, stop + step / 2, step, dtype=float)
+
+
+def _blend_row(blend_dict):
+    return np.array([[blend_dict.get(mat, 0) for mat in MATERIALS]], dtype=float)
+
+
+def _check_points(n_points, barrel_zones):
+    limit = MAX_BARREL_POINTS if barrel_zones else MAX_SWEEP_POINTS
+    if n_points > limit:
+        model = "（含分區模型）" if barrel_zones else ""
+        raise ValueError(f"掃描點共 {n_points:,} 個{model}，超過上限 {limit:,}，請加大間距或減少掃描參數")
+
+
+def _evaluate(coords, fixed, ratios, dtype, barrel_zones=None, surrogate=None):
+    kwargs = {p: coords.get(p, fixed.get(p, SWEEP_PARAMETERS[p][3])) for p in SWEEP_PARAMETERS}
+    result = simulate_v35_batch(ratios=ratios, **kwargs)
+    outputs = {}
+    for k in V35_RESULT_COLUMNS:
+        v = result[k]
+        # 廣播出來的維度（stride 為 0）只保留一格，其餘維度才真的存資料
+        core = v[tuple(slice(0, 1) if stride == 0 else slice(None) for stride in v.strides)]
+        outputs[k] = np.broadcast_to(core.astype(dtype), v.shape)
+    if barrel_zones:
+        # 分區模型逐點計算模口出口結果（欄位名稱加上「分區 」前綴）；有預先計算的查表時改為內插
+        from .barrel import simulate_barrel_batch
+
+        shape = result["膨發指數"].shape
+        flat = {p: np.broadcast_to(np.asarray(v, dtype=float), shape).ravel() for p, v in kwargs.items()}
+        if surrogate is not None:
+            exit = surrogate.lookup(ratios, **flat)
+        else:
+            exit = simulate_barrel_batch(ratios=ratios, zones=barrel_zones, keep_profiles=False, **flat).exit
+        for k, v in exit.items():
+            outputs[f"分區 {k}"] = v.astype(dtype).reshape(shape)
+    return outputs
+
+
+def full_factorial(ranges, blend_dict, fixed=None, dtype=np.float32, barrel_zones=None, surrogate=None):
+    """全因子掃描：ranges 為 {參數: (起點, 終點, 間距)}，一次向量化計算所有格點。
+
+    未掃描的參數取 fixed 中的值，否則用滑桿預設值。barrel_zones 指定時另以該區段數的
+    軸向分區模型計算每個格點的模口出口結果；surrogate 為該區段數的
+    surrogate.SurrogateTable 時，分區結果改由查表內插（simplex）。格點數超過
+    MAX_SWEEP_POINTS（含分區模型時 MAX_BARREL_POINTS）時報 ValueError。
+    """
+    fixed = fixed or {}
+    params = [p for p in SWEEP_PARAMETERS if p in ranges]
+    axes = {p: _axis(*ranges[p]) for p in params}
+    _check_points(int(np.prod([len(a) for a in axes.values()], dtype=float)), barrel_zones)
+    # 開放網格：每個參數只佔一個維度，靠廣播展開成完整的立方體
+    open_grid = dict(zip(params, np.ix_(*(axes[p] for p in params))))
+    outputs = _evaluate(open_grid, fixed, _blend_row(blend_dict), dtype, barrel_zones, surrogate)
+    return SweepResult("factorial", params, axes, None, outputs, fixed)
+
+
+def latin_hypercube(ranges, blend_dict, n_samples, fixed=None, seed=None, dtype=np.float32, barrel_zones=None,
+                    surrogate=None):
+    """拉丁超立方抽樣：每個參數的範圍切成 n_samples 等份，每份恰好抽一點。
+
+    ranges 的間距欄位若大於 0，抽出的值會對齊到該間距（與滑桿刻度一致）。
+    barrel_zones、surrogate 與點數上限同 full_factorial。
+    """
+    fixed = fixed or {}
+    _check_points(int(n_samples), barrel_zones)
+    rng = np.random.default_rng(seed)
+    params = [p for p in SWEEP_PARAMETERS if p in ranges]
+    points = {}
+    for p in params:
+        start, stop, step = ranges[p]
+        u = (rng.permutation(n_samples) + rng.random(n_samples)) / n_samples
+        values = start + u * (stop - start)
+        if step:
+            values = np.clip(start + np.round((values - start) / step) * step, start, stop)
+        points[p] = values
+    axes = {p: np.unique(points[p]) for p in params}
+    outputs = _evaluate(points, fixed, _blend_row(blend_dict), dtype, barrel_zones, surrogate)
+    return SweepResult("lhs", params, axes, points, outputs, fixed)
@@ -0,0 +1,229 @@
+"""各 App 共用的 Streamlit 介面元件；運算核心的其他模組不會匯入這裡。"""
+
+import functools
+import hashlib
+import time
+
+import streamlit as st
+
+from .cache import get_cache
+from .charts import bar_chart_png
+from .metrics import Profile, cache_gauges, export, get_metrics, timed
+from .report import report_status, submit_report
+
+
+def bar_chart(keys, vals, native=False):
+    """數值長條圖。native=True 時改用 Streamlit 原生圖表，由瀏覽器繪製，伺服器端不經 matplotlib。"""
+    if native:
+        import pandas as pd
+
+        st.bar_chart(pd.DataFrame({"數值": list(vals)}, index=list(keys)), sort=False)
+    else:
+        st.image(bar_chart_png(keys, vals))
+
+
+def start_report(key, render, *args, **kwargs):
+    """送出背景報告工作，工作編號記在 st.session_state[key]。"""
+    st.session_state[key] = submit_report(render, *args, **kwargs)
+
+
+def _report_status_view(key, file_name, label):
+    status = report_status(st.session_state[key])
+    if status is None:
+        return
+    if status["state"] == "done":
+        with open(status["path"], "rb") as f:
+            st.download_button(label, data=f.read(), file_name=file_name, key=f"{key}_download")
+        st.caption(f"報告已完成（{status['seconds']:.1f} 秒）")
+    elif status["state"] == "error":
+        st.error(f"⚠️ 報告產生失敗：{status['error']}")
+    else:
+        st.progress(status["progress"], text=f"報告產生中…（{status['seconds']:.0f} 秒）")
+
+
+def report_panel(key, file_name, label="⬇️ 下載報告"):
+    """顯示 st.session_state[key] 這份報告的狀態；產生中每秒只重新執行此區塊輪詢進度。"""
+    job_id = st.session_state.get(key)
+    status = None if job_id is None else report_status(job_id)
+    if status is None:
+        return
+    running = status["state"] in ("queued", "running")
+    st.fragment(_report_status_view, run_every=1.0 if running else None)(key, file_name, label)
+
+
+# --------- 局部重新執行與衍生狀態 ---------
+def fragment(name):
+    """把頁面的一個區塊包成 st.fragment：區塊內的元件變動時只重新執行這個區塊，
+    頁面其他部分不動。每次執行（含整頁重新執行時）的耗時記為 fragment.<name>。"""
+    def decorate(func):
+        @functools.wraps(func)
+        def run(*args, **kwargs):
+            with timed(f"fragment.{name}"):
+                return func(*args, **kwargs)
+
+        return st.fragment(run)
+
+    return decorate
+
+
+def upload_state(key, uploaded, compute):
+    """上傳檔案的衍生結果（解析、模擬等），同一個檔案只計算一次。
+
+    以檔案內容的 SHA-256 判斷是否為同一個檔案，compute(uploaded) 的結果存在
+    st.session_state[key]；換檔才重新計算，移除檔案時清掉。
+    """
+    if uploaded is None:
+        st.session_state.pop(key, None)
+        return None
+    digest = hashlib.sha256(uploaded.getbuffer()).hexdigest()
+    state = st.session_state.get(key)
+    if state is not None and state["digest"] == digest:
+        get_metrics().count("upload.reuse")
+        return state["value"]
+    uploaded.seek(0)
+    value = compute(uploaded)
+    st.session_state[key] = {"digest": digest, "value": value}
+    return value
+
+
+# --------- 效能統計與分析 ---------
+def begin_rerun(key="profile"):
+    """頁面開頭呼叫，回傳本次重新執行的計時狀態，頁面最後交給 metrics_panel()。
+
+    側邊欄按過「分析下一次執行」時，這次重新執行會整段以 cProfile 分析。
+    """
+    # 上一次分析中途出錯（沒有走到 metrics_panel）時先停掉
+    leftover = st.session_state.pop(f"{key}_running", None)
+    if leftover is not None:
+        leftover.__exit__(None, None, None)
+    profile = None
+    if st.session_state.pop(f"{key}_armed", False):
+        profile = st.session_state[f"{key}_running"] = Profile().__enter__()
+    return time.perf_counter(), profile
+
+
+def metrics_panel(rerun, key="profile"):
+    """頁面最後呼叫：記錄本次重新執行的耗時、依 EXTRUSION_METRICS_FILE 寫出 Prometheus 檔，
+    並在側邊欄提供（預設收合的）各階段統計與 cProfile 分析下載。"""
+    import pandas as pd
+
+    started, profile = rerun
+    if profile is not None:
+        profile.__exit__(None, None, None)
+        st.session_state.pop(f"{key}_running", None)
+        st.session_state[key] = {"text": profile.text(), "prof": profile.dump()}
+    metrics = get_metrics()
+    metrics.observe("streamlit.rerun", time.perf_counter() - started)
+    export()
+    with st.sidebar.expander("⏱️ 效能統計"):
+        if st.button("🔬 分析下一次執行（cProfile）", key=f"{key}_arm"):
+            st.session_state[f"{key}_armed"] = True
+        if st.session_state.get(f"{key}_armed"):
+            st.caption("下一次執行（例如按下 🚀 執行模擬）會整段記錄 cProfile。")
+        result = st.session_state.get(key)
+        if result:
+            st.download_button("⬇️ 下載分析檔（.prof）", result["prof"], file_name="extrusion_run.prof",
+                               key=f"{key}_download")
+            st.code(result["text"][:4000], language=None)
+        if not st.checkbox("顯示各階段耗時", key=f"{key}_show_metrics"):
+            return
+        snapshot = metrics.snapshot()
+        table = pd.DataFrame(snapshot["stages"]).T
+        if len(table):
+            for column in ("total_s", "mean_s", "p50_s", "p95_s", "max_s"):
+                table[column] = (table[column].astype(float) * 1000).round(2)
+            table = table.rename(columns={"total_s": "total_ms", "mean_s": "mean_ms", "p50_s": "p50_ms",
+                                          "p95_s": "p95_ms", "max_s": "max_ms"})
+            st.dataframe(table)
+        stats = get_cache().stats()
+        st.caption("；".join([f"結果快取命中率 {stats['hit_rate']:.0%}"]
+                            + [f"{k}：{v:,}" for k, v in snapshot["counters"].items()]))
+        st.download_button("⬇️ Prometheus 文字格式", metrics.prometheus_text(cache_gauges()),
+                           file_name="extrusion_metrics.prom", key=f"{key}_prom")
+
+
+# --------- 敏感度分析 ---------
+def sensitivity_panel(key, model, point, blend_dict=None):
+    """敏感度分析區塊：目前操作點的龍捲風圖與導數（每次重新執行即時計算，約數毫秒），
+    以及按鈕觸發的全域 Sobol 指數（結果存在 st.session_state[f"{key}_sobol"]）。
+    區塊為 fragment，切換輸出指標等操作只重新執行這個區塊。
+
+    model 為 sensitivity.SENSITIVITY_MODELS 的名稱；point 為 {參數: 值}。
+    """
+    fragment(key)(_sensitivity_view)(key, model, point, blend_dict)
+
+
+def _sensitivity_view(key, model, point, blend_dict):
+    from .charts import sobol_png, tornado_png
+    from .sensitivity import SENSITIVITY_MODELS, local_sensitivity, sobol_indices
+
+    spec = SENSITIVITY_MODELS[model]
+    outputs = spec["outputs"]
+    c1, c2 = st.columns(2)
+    output = c1.selectbox("分析的輸出", outputs, key=f"{key}_output") if len(outputs) > 1 else outputs[0]
+    swing = c2.slider("龍捲風圖擺幅（滑桿範圍的 %）", 1, 50, 10, key=f"{key}_swing")
+    local = local_sensitivity(model, point, blend_dict, swing=swing / 100)
+    tornado = local.tornado(output)
+    st.image(tornado_png(list(tornado.index), tornado["低"], tornado["高"], local.base[output], output))
+    derivative = local.derivative[output].rename(index=local.labels)
+    st.dataframe(tornado.assign(導數=derivative.loc[tornado.index]))
+    st.caption(f"操作點 {output} = {local.base[output]:.4g}；導數為每單位輸入的變化量，"
+               "原料為以該原料等比例替代其他原料 1 個百分點。")
+
+    st.markdown("**全域 Sobol 指數**（各輸入在滑桿範圍內均勻抽樣）")
+    c1, c2 = st.columns(2)
+    n = c1.selectbox("每組樣本數 N", [2 ** 12, 2 ** 14, 2 ** 16], index=1, key=f"{key}_n",
+                     format_func=lambda v: f"{v:,}")
+    blend_inputs = spec["blend"] and c2.checkbox("原料比例也一起抽樣", value=True, key=f"{key}_blend")
+    if st.button("🌐 計算 Sobol 指數", key=f"{key}_run"):
+        result = sobol_indices(model, point, blend_dict, blend_inputs=blend_inputs, n=n)
+        st.session_state[f"{key}_sobol"] = {
+            "result": result,
+            "caption": f"{result.evaluations:,} 次模型計算，{result.seconds:.2f} 秒",
+        }
+    last = st.session_state.get(f"{key}_sobol")
+    if last:
+        ranking = last["result"].ranking(output)
+        st.caption(last["caption"])
+        if last["result"].variance[output] <= 1e-24:
+            st.info(f"在抽樣範圍內 {output} 不會變化（例如固定配方時只與原料有關的指標）。")
+        st.image(sobol_png(list(ranking.index), ranking["一階"], ranking["總效應"], output))
+        st.dataframe(ranking)
+
+
+def similar_runs_panel(key, index, point):
+    """相似的歷史紀錄：參數最接近目前設定（point 為 {參數: 值}）或輸出最接近指定目標的
+    過去紀錄。index 為 neighbors.RunIndex（HistoryIndex 查詢前會自動讀入新紀錄）；
+    區塊為 fragment，改目標、筆數只重新執行這個區塊。"""
+    fragment(key)(_similar_runs_view)(key, index, point)
+
+
+def _similar_runs_view(key, index, point):
+    mode = st.radio("搜尋方式", ["參數接近目前設定", "輸出接近目標"], horizontal=True, key=f"{key}_mode")
+    c1, c2 = st.columns(2)
+    k = c1.number_input("筆數", min_value=1, max_value=200, value=10, key=f"{key}_k")
+    radius = c2.number_input("距離上限（留白表示不限）", min_value=0.0, value=None, step=0.05, key=f"{key}_radius")
+    if mode == "參數接近目前設定":
+        target = {p: v for p, v in point.items() if p in index.params}
+        search = index.similar
+    else:
+        target = {}
+        cols = st.columns(min(len(index.outputs), 4))
+        for i, output in enumerate(index.outputs):
+            value = cols[i % len(cols)].number_input(f"{output} 目標", value=None, step=0.1,
+                                                     key=f"{key}_target_{output}", placeholder="不限")
+            if value is not None:
+                target[output] = value
+        search = index.near_outputs
+        if not target:
+            st.info("請至少指定一個輸出的目標值。")
+            return
+    start = time.perf_counter()
+    found = search(target, k=int(k), radius=radius)
+    elapsed = time.perf_counter() - start
+    st.caption(f"索引 {len(index):,} 筆，查詢 {elapsed * 1000:.1f} ms；距離為各欄位除以典型範圍後的歐氏距離，"
+               "只計入指定的欄位。")
+    if found.empty:
+        st.info("沒有符合的紀錄。")
+    else:
+        st.dataframe(found)
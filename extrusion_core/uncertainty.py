@@ -0,0 +1,173 @@
+"""蒙地卡羅不確定性分析：原料批次間的膨發、酥脆數值差異與感測器雜訊（筒溫、轉速、
+水含量）抽樣後整批丟進向量化模型，回報各指標的分位數、直方圖與超出規格的機率。
+
+    result = monte_carlo("v3", params, {"玉米粉": 60, "裸麥粉": 40}, n=1_000_000,
+                         specs={"膨發指數": (1.8, 2.2)})
+    result.summary()
+
+每一塊 CHUNK_SIZE 個樣本一起計算，不逐筆呼叫 simulate_*；10⁶ 個樣本約數秒。
+"""
+
+import numpy as np
+
+from .materials import MATERIAL_IDS, MATERIAL_TABLES
+from .metrics import timed
+
+# 各模型分析的數值指標
+MC_METRICS = {
+    "v2": ("膨發指數", "酥脆度", "水活性", "黏性"),
+    "v3": ("膨發指數", "酥脆度", "水活性", "黏性", "預估能耗（kWh/kg）"),
+    "v35": ("膨發指數", "酥脆度", "水活性", "黏性", "體積密度", "桶內壓力 (bar)", "預估能耗 (kWh/kg)"),
+}
+# 預設的感測器雜訊標準差（筒溫 °C、轉速 rpm、水含量 %）
+SENSOR_NOISE = {"temp": 2.0, "rpm": 5.0, "moisture": 0.5}
+# 原料膨發、酥脆數值的預設變異係數（標準差 / 表列值）
+MATERIAL_CV = 0.05
+DISTRIBUTIONS = ("normal", "uniform", "triangular")
+PERCENTILES = (1, 5, 25, 50, 75, 95, 99)
+CHUNK_SIZE = 200_000
+
+
+def _noise(rng, distribution, sd, size):
+    # 三種分布都以相同的標準差 sd 抽樣，只有形狀不同
+    if distribution == "normal":
+        return rng.normal(0.0, 1.0, size) * sd
+    if distribution == "uniform":
+        return rng.uniform(-1.0, 1.0, size) * (sd * np.sqrt(3))
+    if distribution == "triangular":
+        return rng.triangular(-1.0, 0.0, 1.0, size) * (sd * np.sqrt(6))
+    raise ValueError(f"分布需為 {', '.join(DISTRIBUTIONS)} 之一：{distribution}")
+
+
+def material_spread(model, material_cv=MATERIAL_CV, material_sd=None):
+    """各原料膨發、酥脆數值的標準差（6×2）；material_sd 為 {原料: (膨發標準差, 酥脆標準差)}，
+    未列出的原料以 material_cv 乘上表列值。"""
+    from .models import MODELS
+
+    table = MATERIAL_TABLES[MODELS[model]["table"]]
+    spread = table * material_cv
+    for mat, sd in (material_sd or {}).items():
+        spread[MATERIAL_IDS[mat]] = sd
+    return spread
+
+
+def sample_inputs(rng, model, params, ratios, n, spread, sensor_sd, distribution="normal"):
+    """抽 n 個樣本：回傳（製程參數 dict，6×2×n 原料表）。只抽有用到的原料，其餘維持表列值。"""
+    from .models import MODELS
+
+    base = MATERIAL_TABLES[MODELS[model]["table"]]
+    table = np.empty(base.shape + (n,))
+    table[...] = base[:, :, None]
+    for j in np.flatnonzero(ratios[0] > 0):
+        for k in range(base.shape[1]):
+            if spread[j, k] > 0:
+                table[j, k] += _noise(rng, distribution, spread[j, k], n)
+    np.maximum(table, 0.0, out=table)
+    inputs = dict(params)
+    for p, sd in sensor_sd.items():
+        if sd > 0:
+            inputs[p] = np.maximum(params[p] + _noise(rng, distribution, sd, n), 0.0)
+    return inputs, table
+
+
+class MonteCarloResult:
+    """蒙地卡羅結果：values 為 {指標: 長度 n 的陣列}，specs 為 {指標: (下限, 上限)}（None 表示不限）。"""
+
+    def __init__(self, model, params, blend, values, specs, seconds):
+        self.model = model
+        self.params = params
+        self.blend = blend
+        self.values = values
+        self.specs = specs or {}
+        self.seconds = seconds
+
+    @property
+    def n(self):
+        return len(next(iter(self.values.values())))
+
+    def percentiles(self, qs=PERCENTILES):
+        return {k: dict(zip(qs, np.percentile(v, qs).tolist())) for k, v in self.values.items()}
+
+    def histogram(self, metric, bins=50):
+        """(counts, edges)；模型輸出四捨五入到小數兩三位，bins 過多時會有空格。"""
+        return np.histogram(self.values[metric], bins=bins)
+
+    def out_of_spec_mask(self, metric):
+        lo, hi = self.specs[metric]
+        v = self.values[metric]
+        mask = np.zeros(v.shape, dtype=bool)
+        if lo is not None:
+            mask |= v < lo
+        if hi is not None:
+            mask |= v > hi
+        return mask
+
+    def out_of_spec(self):
+        """各指標超出規格的機率與標準誤（邊界值算符合），另加「任一指標」。"""
+        if not self.specs:
+            return {}
+        masks = {k: self.out_of_spec_mask(k) for k in self.specs}
+        masks["任一指標"] = np.logical_or.reduce(list(masks.values()))
+        out = {}
+        for k, mask in masks.items():
+            p = float(mask.mean())
+            out[k] = {"probability": p, "stderr": float(np.sqrt(p * (1 - p) / self.n))}
+        return out
+
+    def summary(self, qs=PERCENTILES):
+        """每個指標一列：平均、標準差、各分位數與超出規格的機率。"""
+        import pandas as pd
+
+        pct = self.percentiles(qs)
+        oos = self.out_of_spec()
+        rows = {}
+        for k, v in self.values.items():
+            row = {"平均": float(v.mean()), "標準差": float(v.std())}
+            row.update({f"p{q}": pct[k][q] for q in qs})
+            if k in oos:
+                row["超出規格機率"] = oos[k]["probability"]
+            rows[k] = row
+        return pd.DataFrame(rows).T
+
+
+def monte_carlo(model, params, blend_dict, n=100_000, material_cv=MATERIAL_CV, material_sd=None, sensor_sd=None,
+                distribution="normal", specs=None, seed=None, chunk_size=CHUNK_SIZE):
+    """對單一配方抽 n 個樣本跑模型，回傳 MonteCarloResult。
+
+    params 為該模型的製程參數（同 simulate_* 的參數名稱）；sensor_sd 為 {參數: 標準差}，
+    預設 SENSOR_NOISE；distribution 為 normal、uniform 或 triangular（同標準差）。
+    以 chunk_size 分塊計算，記憶體用量不隨 n 增加（結果陣列除外）。
+    """
+    import time
+
+    from .materials import blend_vector
+    from .models import MODELS
+
+    if model not in MC_METRICS:
+        raise ValueError(f"模型需為 {', '.join(MC_METRICS)} 之一：{model}")
+    if distribution not in DISTRIBUTIONS:
+        raise ValueError(f"分布需為 {', '.join(DISTRIBUTIONS)} 之一：{distribution}")
+    unknown = set(specs or {}) - set(MC_METRICS[model])
+    if unknown:
+        raise ValueError(f"模型 {model} 沒有這些指標：{'、'.join(sorted(unknown))}")
+    sensor_sd = SENSOR_NOISE if sensor_sd is None else sensor_sd
+    missing = set(sensor_sd) - set(params)
+    if missing:
+        raise ValueError(f"模型 {model} 沒有這些製程參數：{', '.join(sorted(missing))}")
+    ratios = blend_vector(blend_dict)
+    spread = material_spread(model, material_cv, material_sd)
+    batch = MODELS[model]["batch"]
+    # 不四捨五入：小的標準差在 2～3 位小數下只剩幾個值，分位數與超規機率會失真
+    extra = {"rounding": False} if model == "v35" else {"describe": False, "rounding": False}
+    metrics = MC_METRICS[model]
+    values = {k: np.empty(n) for k in metrics}
+    rng = np.random.default_rng(seed)
+    start = time.perf_counter()
+    with timed(f"montecarlo.{model}", rows=n):
+        for lo in range(0, n, chunk_size):
+            size = min(chunk_size, n - lo)
+            inputs, table = sample_inputs(rng, model, params, ratios, size, spread, sensor_sd, distribution)
+            outputs = batch(ratios=ratios, table=table, **inputs, **extra)
+            for k in metrics:
+                values[k][lo:lo + size] = outputs[k]
+    return MonteCarloResult(model, dict(params), dict(blend_dict), values, specs, time.perf_counter() - start)
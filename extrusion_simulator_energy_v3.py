@@ -1,27 +1,22 @@
 
 import streamlit as st
 import pandas as pd
-import matplotlib.pyplot as plt
-from fpdf import FPDF
-from io import BytesIO
 import os
 
+from extrusion_core import MATERIALS, MODEL_VERSIONS, get_cache, make_key, simulate_v3
+from extrusion_core.charts import histogram_png
+from extrusion_core.metrics import timed
+from extrusion_core.report import write_simulation_report
+from extrusion_core.ui import bar_chart, begin_rerun, fragment, metrics_panel, report_panel, sensitivity_panel, start_report
+from extrusion_core.optimize import V3_PARAMETERS, optimize_recipe
+from extrusion_core.uncertainty import DISTRIBUTIONS, MC_METRICS, SENSOR_NOISE, monte_carlo
+
 st.set_page_config(page_title="雙螺桿擠壓模擬器 v3", layout="centered")
+rerun_started = begin_rerun()
 
 st.title("⚙️ 雙螺桿擠壓模擬器 v3（含能耗預測）")
 
-# --------- 原料資料 ---------
-def get_flavor_profiles():
-    return {
-        "玉米粉":     {"expansion": 2.0, "crisp": 6.0, "flavor": "甜香"},
-        "小麥粉":     {"expansion": 1.8, "crisp": 5.5, "flavor": "穀香"},
-        "裸麥粉":     {"expansion": 1.5, "crisp": 5.0, "flavor": "堅果風"},
-        "高蛋白粉":  {"expansion": 1.2, "crisp": 4.0, "flavor": "豆粉味"},
-        "馬鈴薯澱粉": {"expansion": 2.2, "crisp": 6.5, "flavor": "脆口澱粉香"},
-        "全麥粉":     {"expansion": 1.6, "crisp": 5.2, "flavor": "麩皮香、纖維感"}
-    }
-
-material_options = list(get_flavor_profiles().keys())
+material_options = list(MATERIALS)
 target_options = ["膨發零食", "酥餅", "夾心餅體"]
 
 # --------- 使用者參數輸入 ---------
@@ -33,6 +28,7 @@ fat = st.sidebar.slider("油脂含量（%）", 0, 15, 5)
 screw_diameter = st.sidebar.slider("螺桿直徑（mm）", 20, 60, 30)
 screw_length = st.sidebar.slider("螺桿長度（mm）", 600, 1600, 1000)
 target_product = st.sidebar.selectbox("產品目標", target_options)
+native_chart = st.sidebar.checkbox("原生長條圖（由瀏覽器繪製，較省伺服器資源）")
 
 # --------- 混合原料比例輸入 ---------
 st.subheader("🔢 混合原料設定（總和需為100%）")
@@ -44,88 +40,159 @@ for mat in material_options:
         blend_dict[mat] = ratio
         total_ratio += ratio
 
-# --------- 模擬計算 ---------
-def simulate_blended_formula(temp, rpm, moisture, fat, blend_dict):
-    flavor_profiles = get_flavor_profiles()
-    total_ratio = sum(blend_dict.values())
-    expansion = 0
-    crisp = 0
-    flavors = []
-    for mat, ratio in blend_dict.items():
-        weight = ratio / total_ratio
-        expansion += flavor_profiles[mat]["expansion"] * weight
-        crisp += flavor_profiles[mat]["crisp"] * weight
-        flavors.append((flavor_profiles[mat]["flavor"], weight))
-    expansion = round(expansion + (temp - 100) * 0.005 - moisture * 0.01 + fat * 0.01, 2)
-    crisp = round(crisp + (rpm - 300) * 0.005 - fat * 0.1 + moisture * 0.05, 2)
-    water_aw = round(0.6 + moisture * 0.01 - temp * 0.001, 2)
-    stickiness = round(1 + fat * 0.1 + moisture * 0.1 - rpm * 0.002, 2)
-    appearance = "膨鬆偏亮" if expansion > 2 else "偏密實"
-    color = "金黃色" if temp >= 140 else "淺黃"
-    flavor_desc = "、".join([f"{f[0]}（{int(f[1]*100)}%）" for f in flavors])
-    return {
-        "膨發指數": expansion,
-        "酥脆度": crisp,
-        "水活性": water_aw,
-        "黏性": stickiness,
-        "外觀": appearance,
-        "色澤": color,
-        "風味描述": f"綜合風味：{flavor_desc}"
-    }
-
-def estimate_energy_consumption(temp, rpm, moisture, fat, screw_diameter_mm, screw_length_mm):
-    base_energy = 0.12
-    energy = (
-        base_energy
-        + (temp - 100) * 0.0008
-        + (rpm - 300) * 0.0005
-        + screw_length_mm / 1000 * 0.05
-        - moisture * 0.002
-        - fat * 0.003
-        + (screw_diameter_mm / 100) * 0.02
-    )
-    return round(max(energy, 0.05), 3)
-
-def simulate_with_energy(temp, rpm, moisture, fat, blend_dict, screw_diameter, screw_length):
-    result = simulate_blended_formula(temp, rpm, moisture, fat, blend_dict)
-    result["螺桿直徑（mm）"] = screw_diameter
-    result["螺桿長度（mm）"] = screw_length
-    result["預估能耗（kWh/kg）"] = estimate_energy_consumption(
-        temp, rpm, moisture, fat, screw_diameter, screw_length
-    )
-    return result
-
 # --------- 執行模擬 ---------
 if total_ratio == 100:
     if st.button("🚀 執行模擬"):
-        results = simulate_with_energy(temp, rpm, moisture, fat, blend_dict, screw_diameter, screw_length)
-        st.subheader("📊 模擬結果")
-        for k, v in results.items():
-            st.write(f"**{k}**：{v}")
-
-        st.subheader("📈 數值圖表")
-        fig, ax = plt.subplots()
-        keys = ["膨發指數", "酥脆度", "水活性", "黏性", "預估能耗（kWh/kg）"]
-        vals = [results[k] for k in keys]
-        ax.bar(keys, vals)
-        st.pyplot(fig)
-
-        # PDF 匯出
-        if st.button("📄 匯出 PDF 報告"):
-            pdf = FPDF()
-            pdf.add_page()
-            pdf.set_font("Arial", "B", 16)
-            pdf.cell(200, 10, "雙螺桿擠壓模擬報告（含能耗）", ln=True, align="C")
-            pdf.set_font("Arial", "", 12)
-            pdf.ln(5)
-            pdf.multi_cell(0, 8, f"原料組合：{', '.join([f'{k} {v}%' for k,v in blend_dict.items()])}")
-            pdf.cell(0, 10, f"筒溫：{temp}°C，轉速：{rpm} rpm，水：{moisture}%，油：{fat}%", ln=True)
-            pdf.cell(0, 10, f"螺桿直徑：{screw_diameter} mm，螺桿長度：{screw_length} mm", ln=True)
-            pdf.ln(5)
-            for k, v in results.items():
-                pdf.cell(0, 10, f"{k}：{v}", ln=True)
-            pdf_buffer = BytesIO()
-            pdf.output(pdf_buffer)
-            st.download_button("⬇️ 下載報告", data=pdf_buffer.getvalue(), file_name="extrusion_energy_report.pdf")
+        with timed("simulate.v3"):
+            results = get_cache().get_or_compute(
+                make_key(MODEL_VERSIONS["v3"], temp, rpm, moisture, fat, screw_diameter, screw_length, blend=blend_dict),
+                lambda: simulate_v3(temp, rpm, moisture, fat, blend_dict, screw_diameter, screw_length),
+            )
+        st.session_state["v3_last"] = {
+            "results": results,
+            "blend": dict(blend_dict),
+            "lines": [
+                f"筒溫：{temp}°C，轉速：{rpm} rpm，水：{moisture}%，油：{fat}%",
+                f"螺桿直徑：{screw_diameter} mm，螺桿長度：{screw_length} mm",
+            ],
+        }
 else:
     st.warning("⚠️ 原料總比例需為 100%，目前為 {}%".format(total_ratio))
+
+last = st.session_state.get("v3_last")
+if last:
+    results = last["results"]
+    st.subheader("📊 模擬結果")
+    for k, v in results.items():
+        st.write(f"**{k}**：{v}")
+
+    st.subheader("📈 數值圖表")
+    keys = ["膨發指數", "酥脆度", "水活性", "黏性", "預估能耗（kWh/kg）"]
+    vals = [results[k] for k in keys]
+    bar_chart(keys, vals, native=native_chart)
+
+    # PDF 匯出（背景產生）
+    if st.button("📄 匯出 PDF 報告"):
+        start_report("v3_report", write_simulation_report, "雙螺桿擠壓模擬報告（含能耗）", last["blend"], last["lines"], results)
+    report_panel("v3_report", "extrusion_energy_report.pdf")
+
+# --------- 不確定性分析（蒙地卡羅） ---------
+# 以下各區塊為 fragment：區塊內的元件變動只重新執行該區塊
+@fragment("v3_mc")
+def uncertainty_section(params, blend_dict, total_ratio):
+    st.subheader("🎲 不確定性分析（原料批次差異與感測器雜訊）")
+    st.caption("以側邊欄目前的參數與上方配方，對原料膨發、酥脆數值及筒溫、轉速、水含量讀值加入隨機誤差後整批模擬。")
+    c1, c2, c3 = st.columns(3)
+    mc_samples = c1.selectbox("樣本數", [10_000, 100_000, 1_000_000], index=1, format_func=lambda n: f"{n:,}")
+    mc_cv = c2.number_input("原料數值變異係數（%）", min_value=0.0, max_value=50.0, value=5.0, step=1.0)
+    mc_distribution = c3.selectbox("分布", list(DISTRIBUTIONS), format_func=lambda d: {"normal": "常態", "uniform": "均勻", "triangular": "三角"}[d])
+    c1, c2, c3 = st.columns(3)
+    mc_noise = {
+        "temp": c1.number_input("筒溫雜訊標準差（℃）", min_value=0.0, value=SENSOR_NOISE["temp"], step=0.5),
+        "rpm": c2.number_input("轉速雜訊標準差（rpm）", min_value=0.0, value=SENSOR_NOISE["rpm"], step=1.0),
+        "moisture": c3.number_input("水含量雜訊標準差（%）", min_value=0.0, value=SENSOR_NOISE["moisture"], step=0.1),
+    }
+    mc_specs = {}
+    for key in MC_METRICS["v3"]:
+        c1, c2, c3 = st.columns([2, 1, 1])
+        c1.write(f"**{key}** 規格")
+        lo = c2.number_input(f"{key} 規格下限", value=None, step=0.1, key=f"mc_lo_{key}", label_visibility="collapsed", placeholder="下限")
+        hi = c3.number_input(f"{key} 規格上限", value=None, step=0.1, key=f"mc_hi_{key}", label_visibility="collapsed", placeholder="上限")
+        if lo is not None or hi is not None:
+            mc_specs[key] = (lo, hi)
+
+    if total_ratio == 100 and st.button("🎲 執行蒙地卡羅"):
+        mc = monte_carlo("v3", params, blend_dict, n=mc_samples, material_cv=mc_cv / 100, sensor_sd=mc_noise,
+                         distribution=mc_distribution, specs=mc_specs)
+        # 只保留摘要與直方圖，不把 10⁶ 個樣本存進 session_state
+        st.session_state["v3_mc"] = {
+            "summary": mc.summary(),
+            "out_of_spec": mc.out_of_spec(),
+            "hists": {k: mc.histogram(k) for k in mc.values},
+            "specs": dict(mc_specs),
+            "caption": f"{mc.n:,} 個樣本，{mc.seconds:.2f} 秒",
+        }
+
+    mc_last = st.session_state.get("v3_mc")
+    if mc_last:
+        st.caption(mc_last["caption"])
+        st.dataframe(mc_last["summary"])
+        for k, v in mc_last["out_of_spec"].items():
+            st.write(f"**超出規格（{k}）**：{v['probability']:.2%}（± {v['stderr']:.2%}）")
+        mc_metric = st.selectbox("直方圖指標", list(mc_last["hists"]), key="mc_metric")
+        st.image(histogram_png(*mc_last["hists"][mc_metric], mc_metric, mc_last["specs"].get(mc_metric)))
+
+
+current = {
+    "temp": temp, "rpm": rpm, "moisture": moisture, "fat": fat,
+    "screw_diameter": screw_diameter, "screw_length": screw_length,
+}
+uncertainty_section(current, blend_dict, total_ratio)
+
+# --------- 能耗敏感度分析 ---------
+st.subheader("🌪️ 能耗敏感度分析")
+st.caption("能耗預測只與製程參數有關，不受配方影響。")
+sensitivity_panel("v3_sens", "v3_energy", current)
+
+# --------- 配方最佳化 ---------
+@fragment("v3_optimize")
+def optimize_section(current):
+    st.subheader("🎯 配方最佳化（達成目標口感、能耗最低）")
+    st.caption("留白表示不限；邊界值算符合。未勾選搜尋的參數固定為側邊欄目前的值。")
+    targets = {}
+    for key in ["膨發指數", "酥脆度", "水活性", "黏性", "預估能耗（kWh/kg）"]:
+        c1, c2, c3 = st.columns([2, 1, 1])
+        c1.write(f"**{key}**")
+        lo = c2.number_input(f"{key} 下限", value=None, step=0.1, key=f"opt_lo_{key}", label_visibility="collapsed", placeholder="下限")
+        hi = c3.number_input(f"{key} 上限", value=None, step=0.1, key=f"opt_hi_{key}", label_visibility="collapsed", placeholder="上限")
+        if lo is not None or hi is not None:
+            targets[key] = (lo, hi)
+
+    searched = st.multiselect(
+        "搜尋的製程參數",
+        list(V3_PARAMETERS),
+        default=["temp", "rpm", "moisture", "fat"],
+        format_func=lambda p: V3_PARAMETERS[p][0],
+    )
+    ranges = {}
+    cols = st.columns(max(len(searched), 1))
+    for col, p in zip(cols, searched):
+        label, lo, hi, _, step = V3_PARAMETERS[p]
+        step = col.number_input(f"{label} 間距", min_value=1, max_value=hi - lo, value=step, key=f"opt_step_{p}")
+        ranges[p] = (lo, hi, step)
+    allowed = st.multiselect("可使用的原料", material_options, default=material_options)
+    c1, c2 = st.columns(2)
+    blend_step = c1.selectbox("配方比例間距（%）", [5, 10, 20, 25])
+    top_k = c2.number_input("列出前幾組", min_value=1, max_value=100, value=10)
+
+    if st.button("🎯 開始搜尋"):
+        if not targets:
+            st.warning("⚠️ 請至少設定一個目標。")
+        elif not allowed:
+            st.warning("⚠️ 請至少選擇一種原料。")
+        else:
+            fixed = {p: v for p, v in current.items() if p not in ranges}
+            try:
+                best, stats = optimize_recipe(
+                    targets, "v3", ranges=ranges, fixed=fixed, materials=allowed, blend_step=blend_step, top_k=int(top_k)
+                )
+            except ValueError as e:
+                st.error(f"⚠️ {e}")
+            else:
+                st.caption("、".join(f"{k} {v:,}" for k, v in stats.items()))
+                if best.empty:
+                    st.warning("⚠️ 搜尋範圍內沒有符合所有目標的配方。")
+                else:
+                    st.dataframe(best)
+
+
+optimize_section(current)
+
+# --------- 快取統計 ---------
+cache_stats = get_cache().stats()
+st.sidebar.caption(
+    f"🗄️ 結果快取：命中 {cache_stats['hits']}／未命中 {cache_stats['misses']}"
+    f"（{cache_stats['entries']} 筆，{cache_stats['mb']:.2f} MB）"
+)
+
+metrics_panel(rerun_started)
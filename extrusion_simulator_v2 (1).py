@@ -1,28 +1,40 @@
 
 import streamlit as st
 import pandas as pd
-import matplotlib.pyplot as plt
-from fpdf import FPDF
-from io import BytesIO
-import os
+
+from extrusion_core import (
+    MATERIALS,
+    MODEL_VERSIONS,
+    default_workers,
+    get_cache,
+    make_key,
+    simulate_columnar,
+    simulate_v2,
+    stream_simulation_csv,
+)
+from extrusion_core.columnar import FORMATS
+from extrusion_core.history import get_history
+from extrusion_core.metrics import timed
+from extrusion_core.neighbors import get_history_index
+from extrusion_core.report import MAX_BATCH_REPORT_ROWS, write_batch_report, write_simulation_report
+from extrusion_core.ui import (
+    bar_chart,
+    begin_rerun,
+    fragment,
+    metrics_panel,
+    report_panel,
+    similar_runs_panel,
+    start_report,
+    upload_state,
+)
 
 st.set_page_config(page_title="雙螺桿擠壓模擬器", layout="centered")
+rerun_started = begin_rerun()
 
 st.title("🌽 雙螺桿擠壓機參數模擬器 v2")
 st.markdown("支援：原料混合｜批次模擬｜風味預測｜匯出報告 📄")
 
-# --------- 原料資料 ---------
-def get_flavor_profiles():
-    return {
-        "玉米粉":     {"expansion": 2.0, "crisp": 6.0, "flavor": "甜香"},
-        "小麥粉":     {"expansion": 1.8, "crisp": 5.5, "flavor": "穀香"},
-        "裸麥粉":     {"expansion": 1.5, "crisp": 5.0, "flavor": "堅果風"},
-        "高蛋白粉":  {"expansion": 1.2, "crisp": 4.0, "flavor": "豆粉味"},
-        "馬鈴薯澱粉": {"expansion": 2.2, "crisp": 6.5, "flavor": "脆口澱粉香"},
-        "全麥粉":     {"expansion": 1.6, "crisp": 5.2, "flavor": "麩皮香、纖維感"}
-    }
-
-material_options = list(get_flavor_profiles().keys())
+material_options = list(MATERIALS)
 target_options = ["膨發零食", "酥餅", "夾心餅體"]
 
 # --------- 使用者參數輸入 ---------
@@ -32,6 +44,7 @@ rpm = st.sidebar.slider("轉速（rpm）", 100, 600, 300)
 moisture = st.sidebar.slider("水含量（%）", 10, 25, 15)
 fat = st.sidebar.slider("油脂含量（%）", 0, 15, 5)
 target_product = st.sidebar.selectbox("產品目標", target_options)
+native_chart = st.sidebar.checkbox("原生長條圖（由瀏覽器繪製，較省伺服器資源）")
 
 # --------- 混合原料比例輸入 ---------
 st.subheader("🔢 混合原料設定（總和需為100%）")
@@ -43,94 +56,178 @@ for mat in material_options:
         blend_dict[mat] = ratio
         total_ratio += ratio
 
-# --------- 模擬計算函數 ---------
-def simulate_blended_formula(temp, rpm, moisture, fat, blend_dict):
-    flavor_profiles = get_flavor_profiles()
-    total_ratio = sum(blend_dict.values())
-    expansion = 0
-    crisp = 0
-    flavors = []
-    for mat, ratio in blend_dict.items():
-        weight = ratio / total_ratio
-        if mat in flavor_profiles:
-            expansion += flavor_profiles[mat]["expansion"] * weight
-            crisp += flavor_profiles[mat]["crisp"] * weight
-            flavors.append((flavor_profiles[mat]["flavor"], weight))
-    expansion = round(expansion + (temp - 100) * 0.005 - moisture * 0.01 + fat * 0.01, 2)
-    crisp = round(crisp + (rpm - 300) * 0.005 - fat * 0.1 + moisture * 0.05, 2)
-    water_aw = round(0.6 + moisture * 0.01 - temp * 0.001, 2)
-    stickiness = round(1 + fat * 0.1 + moisture * 0.1 - rpm * 0.002, 2)
-    appearance = "膨鬆偏亮" if expansion > 2 else "偏密實"
-    color = "金黃色" if temp >= 140 else "淺黃"
-    flavor_desc = "、".join([f"{f[0]}（{int(f[1]*100)}%）" for f in flavors])
-    return {
-        "膨發指數": expansion,
-        "酥脆度": crisp,
-        "水活性": water_aw,
-        "黏性": stickiness,
-        "外觀": appearance,
-        "色澤": color,
-        "風味描述": f"綜合風味：{flavor_desc}"
-    }
-
 # --------- 模擬與輸出 ---------
 if total_ratio == 100:
     if st.button("🚀 執行模擬"):
-        results = simulate_blended_formula(temp, rpm, moisture, fat, blend_dict)
-        st.subheader("📊 模擬結果")
-        for k, v in results.items():
-            st.write(f"**{k}**：{v}")
-
+        with timed("simulate.v2"):
+            results = get_cache().get_or_compute(
+                make_key(MODEL_VERSIONS["v2"], temp, rpm, moisture, fat, blend=blend_dict),
+                lambda: simulate_v2(temp, rpm, moisture, fat, blend_dict),
+            )
         # 儲存紀錄
         sim_row = {"筒溫": temp, "轉速": rpm, "水": moisture, "油": fat}
         sim_row.update(results)
-        pd.DataFrame([sim_row]).to_csv("simulation_history.csv", mode="a", header=not os.path.exists("simulation_history.csv"), index=False)
-
-        # 圖表顯示
-        st.subheader("📈 數值圖表")
-        fig, ax = plt.subplots()
-        keys = ["膨發指數", "酥脆度", "水活性", "黏性"]
-        vals = [results[k] for k in keys]
-        ax.bar(keys, vals)
-        st.pyplot(fig)
-
-        # 匯出 PDF
-        if st.button("📄 匯出 PDF 報告"):
-            pdf = FPDF()
-            pdf.add_page()
-            pdf.set_font("Arial", "B", 16)
-            pdf.cell(200, 10, "雙螺桿擠壓模擬報告", ln=True, align="C")
-            pdf.set_font("Arial", "", 12)
-            pdf.ln(5)
-            pdf.multi_cell(0, 8, f"原料組合：{', '.join([f'{k} {v}%' for k,v in blend_dict.items()])}")
-            pdf.cell(0, 10, f"產品目標：{target_product}", ln=True)
-            pdf.cell(0, 10, f"筒溫：{temp}°C，轉速：{rpm} rpm，水：{moisture}%，油：{fat}%", ln=True)
-            pdf.ln(5)
-            pdf.set_font("Arial", "B", 13)
-            pdf.cell(0, 10, "模擬預測：", ln=True)
-            pdf.set_font("Arial", "", 12)
-            for k, v in results.items():
-                pdf.cell(0, 10, f"{k}：{v}", ln=True)
-            pdf.ln(5)
-            pdf.set_font("Arial", "I", 11)
-            pdf.multi_cell(0, 8, "📘 模擬指標說明：\n\n- 膨發指數：1.0~1.5 緊實，1.6~2.0 輕酥，2.1+ 高膨發\n- 酥脆度：<4 軟，4~5.5 中，>5.5 脆\n- 黏性：<2 好操作，>3 較難成型")
-            pdf_buffer = BytesIO()
-            pdf.output(pdf_buffer)
-            st.download_button("⬇️ 下載報告", data=pdf_buffer.getvalue(), file_name="extrusion_report.pdf")
+        get_history().append(sim_row, model="v2")
+        st.session_state["v2_last"] = {
+            "results": results,
+            "blend": dict(blend_dict),
+            "lines": [f"產品目標：{target_product}", f"筒溫：{temp}°C，轉速：{rpm} rpm，水：{moisture}%，油：{fat}%"],
+        }
 else:
     st.warning("⚠️ 原料總比例需為 100%，目前為 {}%".format(total_ratio))
 
+# 上一次的模擬結果保留在 session_state，按下匯出按鈕重新執行時仍會顯示
+last = st.session_state.get("v2_last")
+if last:
+    results = last["results"]
+    st.subheader("📊 模擬結果")
+    for k, v in results.items():
+        st.write(f"**{k}**：{v}")
+
+    # 圖表顯示
+    st.subheader("📈 數值圖表")
+    keys = ["膨發指數", "酥脆度", "水活性", "黏性"]
+    vals = [results[k] for k in keys]
+    bar_chart(keys, vals, native=native_chart)
+
+    # 匯出 PDF（背景產生，不阻塞頁面）
+    if st.button("📄 匯出 PDF 報告"):
+        start_report(
+            "v2_report",
+            write_simulation_report,
+            "雙螺桿擠壓模擬報告",
+            last["blend"],
+            last["lines"],
+            results,
+            heading="模擬預測：",
+            notes="📘 模擬指標說明：\n\n- 膨發指數：1.0~1.5 緊實，1.6~2.0 輕酥，2.1+ 高膨發\n- 酥脆度：<4 軟，4~5.5 中，>5.5 脆\n- 黏性：<2 好操作，>3 較難成型",
+        )
+    report_panel("v2_report", "extrusion_report.pdf")
+
 # --------- 批次模擬上傳 ---------
-st.subheader("📁 批次模擬上傳（CSV）")
-csv_file = st.file_uploader("上傳含欄位：原料、筒溫、轉速、水含量、油脂含量", type="csv")
-if csv_file:
-    df = pd.read_csv(csv_file)
-    batch_results = []
-    for _, row in df.iterrows():
-        blend = {mat: row[mat] for mat in material_options if mat in row and row[mat] > 0}
-        res = simulate_blended_formula(row["筒溫"], row["轉速"], row["水含量"], row["油脂含量"], blend)
-        res.update(blend)
-        batch_results.append(res)
-    df_out = pd.DataFrame(batch_results)
+# 批次與紀錄查詢區塊各自為 fragment：區塊內的元件變動只重新執行該區塊；上傳的檔案
+# 依內容雜湊只解析、模擬一次，調整側邊欄或配方時不會重算整批
+def simulate_upload(csv_file, workers):
+    with timed("csv.parse"):
+        df = pd.read_csv(csv_file)
+    try:
+        # 整批向量化計算，結果與逐列呼叫 simulate_v2 相同；以欄式格式保存（float32、類別代碼）
+        return {"df": df, "result": simulate_columnar(df, workers=workers), "error": None}
+    except ValueError as e:
+        return {"df": df, "result": None, "error": str(e)}
+
+
+def stream_upload(csv_file, chunk_rows, workers):
+    bar = st.progress(0.0)
+    status = st.empty()
+
+    def report_progress(n_chunks, n_rows):
+        bar.progress(min(csv_file.tell() / max(csv_file.size, 1), 1.0))
+        status.text(f"已完成 {n_chunks} 塊，共 {n_rows:,} 列")
+
+    try:
+        out_file, n_rows = stream_simulation_csv(csv_file, chunksize=chunk_rows, progress=report_progress, workers=workers)
+    except ValueError as e:
+        return {"error": str(e)}
+    bar.empty()
+    status.empty()
+    preview = pd.read_csv(out_file, nrows=100)
+    return {"file": out_file, "rows": n_rows, "preview": preview, "error": None}
+
+
+def read_all(f):
+    f.seek(0)
+    return f.read()
+
+
+@fragment("v2_batch")
+def batch_section():
+    st.subheader("📁 批次模擬上傳（CSV）")
+    csv_file = st.file_uploader("上傳含欄位：原料、筒溫、轉速、水含量、油脂含量", type="csv")
+    stream_mode = st.checkbox("串流模式（大型檔案分塊處理，結果直接寫入暫存檔）")
+    # 預設單核心：只有一個核心時多行程只有啟動與傳輸的額外成本
+    max_workers = default_workers()
+    workers = st.number_input("平行運算核心數（1 = 單核心）", min_value=1, max_value=max_workers, value=1, step=1)
+    if csv_file and stream_mode:
+        chunk_rows = st.number_input("每塊列數", min_value=1000, max_value=1000000, value=50000, step=10000)
+        streamed = upload_state("v2_upload_stream", csv_file,
+                                lambda f: stream_upload(f, int(chunk_rows), int(workers)))
+        if streamed["error"]:
+            st.error(f"⚠️ {streamed['error']}")
+            return
+        st.dataframe(streamed["preview"])
+        st.caption(f"預覽前 100 列，共 {streamed['rows']:,} 列")
+        st.download_button("⬇️ 下載模擬結果 CSV", data=lambda: read_all(streamed["file"]),
+                           file_name="batch_simulation_results.csv")
+        return
+    if not csv_file:
+        upload_state("v2_upload", None, None)
+        upload_state("v2_upload_stream", None, None)
+        return
+    batch = upload_state("v2_upload", csv_file, lambda f: simulate_upload(f, int(workers)))
+    if batch["error"]:
+        st.error(f"⚠️ {batch['error']}")
+        return
+    df, result = batch["df"], batch["result"]
+    df_out = result.to_frame()
     st.dataframe(df_out)
-    st.download_button("⬇️ 下載模擬結果 CSV", data=df_out.to_csv(index=False), file_name="batch_simulation_results.csv")
+    # 檔案在按下下載時才產生，不在每次重新執行時序列化；Parquet / Arrow 保留類別欄與風味組成權重
+    c1, c2 = st.columns([1, 2])
+    download_format = c1.selectbox("下載格式", list(FORMATS), format_func=lambda f: {"parquet": "Parquet", "arrow": "Arrow IPC", "csv": "CSV"}[f])
+    suffix, mime = FORMATS[download_format]
+    c2.download_button(f"⬇️ 下載模擬結果（{suffix[1:]}）", data=lambda: result.to_bytes(download_format),
+                       file_name=f"batch_simulation_results{suffix}", mime=mime)
+    st.caption(f"共 {len(result):,} 列，結果佔 {result.nbytes / 1e6:.1f} MB")
+
+    # 批次 PDF 報告：摘要統計、完整結果表與每筆配方的圖表頁
+    n_report = st.number_input(
+        "報告包含的列數",
+        min_value=1,
+        max_value=min(len(df_out), MAX_BATCH_REPORT_ROWS),
+        value=min(len(df_out), 100),
+        step=10,
+    )
+    if st.button("📑 產生批次 PDF 報告"):
+        n_report = int(n_report)
+        start_report("v2_batch_report", write_batch_report, df_out.head(n_report), inputs=df.head(n_report))
+    report_panel("v2_batch_report", "batch_simulation_report.pdf")
+
+
+batch_section()
+
+
+# --------- 模擬紀錄查詢 ---------
+@fragment("v2_history")
+def history_section():
+    with st.expander("🔎 查詢模擬紀錄"):
+        c1, c2 = st.columns(2)
+        since = c1.date_input("起始日期", value=None)
+        until = c2.date_input("結束日期", value=None)
+        q_temp = st.slider("筒溫範圍（℃）", 60, 180, (60, 180))
+        q_rpm = st.slider("轉速範圍（rpm）", 100, 600, (100, 600))
+        q_limit = st.number_input("最多顯示筆數", min_value=10, max_value=100000, value=500, step=100)
+        found = get_history().query(
+            start=since,
+            end=None if until is None else pd.Timestamp(until) + pd.Timedelta(days=1),
+            limit=q_limit,
+            temp=q_temp,
+            rpm=q_rpm,
+        )
+        st.caption(f"共 {get_history().count():,} 筆紀錄，符合條件 {len(found):,} 筆（最多顯示 {q_limit:,} 筆）")
+        st.dataframe(found)
+
+
+history_section()
+
+# --------- 相似的歷史紀錄（最近鄰索引，新紀錄逐步加入） ---------
+with st.expander("🧭 相似的歷史紀錄"):
+    similar_runs_panel("v2_similar", get_history_index("v2"), {"temp": temp, "rpm": rpm, "moisture": moisture, "fat": fat})
+
+# --------- 快取統計 ---------
+cache_stats = get_cache().stats()
+st.sidebar.caption(
+    f"🗄️ 結果快取：命中 {cache_stats['hits']}／未命中 {cache_stats['misses']}"
+    f"（{cache_stats['entries']} 筆，{cache_stats['mb']:.2f} MB）"
+)
+
+metrics_panel(rerun_started)
@@ -1,24 +1,20 @@
 
 import streamlit as st
 import pandas as pd
-import matplotlib.pyplot as plt
-from fpdf import FPDF
-from io import BytesIO
+
+from extrusion_core import MATERIALS, MODEL_VERSIONS, get_cache, make_key, simulate_v35
+from extrusion_core.barrel import BARREL_VERSION, DEFAULT_ZONES, METERING_FRACTION, simulate_barrel
+from extrusion_core.charts import heatmap_png
+from extrusion_core.metrics import timed
+from extrusion_core.surrogate import get_surrogate
+from extrusion_core.sweep import SWEEP_PARAMETERS, full_factorial, latin_hypercube
+from extrusion_core.ui import begin_rerun, fragment, metrics_panel, sensitivity_panel
 
 st.set_page_config(page_title="雙螺桿擠壓模擬器 v3.5（簡化解釋版）", layout="centered")
+rerun_started = begin_rerun()
 st.title("🛠️ 雙螺桿擠壓模擬器 v3.5（簡化解釋版）")
 
-def get_flavor_profiles():
-    return {
-        "玉米粉": {"expansion": 2.0, "crisp": 6.0, "flavor": "甜香"},
-        "小麥粉": {"expansion": 1.8, "crisp": 5.5, "flavor": "穀香"},
-        "裸麥粉": {"expansion": 1.5, "crisp": 5.0, "flavor": "堅果風"},
-        "高蛋白粉": {"expansion": 1.2, "crisp": 3.5, "flavor": "麥皮香"},
-        "馬鈴薯澱粉": {"expansion": 2.2, "crisp": 4.5, "flavor": "黏稠"},
-        "全麥粉": {"expansion": 1.3, "crisp": 4.2, "flavor": "纖維感"}
-    }
-
-material_options = list(get_flavor_profiles().keys())
+material_options = list(MATERIALS)
 
 st.sidebar.header("參數設定")
 temp = st.sidebar.slider("筒溫 (°C)", 60, 180, 140)
@@ -29,6 +25,8 @@ screw_diameter = st.sidebar.slider("螺桿直徑 (mm)", 20, 60, 30)
 screw_length = st.sidebar.slider("螺桿長度 (mm)", 500, 1500, 1000)
 feed_rate = st.sidebar.slider("喂料速率 (kg/h)", 10, 100, 30)
 die_diameter = st.sidebar.slider("模口孔徑 (mm)", 2, 10, 5)
+use_barrel = st.sidebar.checkbox("軸向分區模型（沿筒身的溫度、壓力、水分分布）")
+barrel_zones = st.sidebar.slider("分區數", 10, 400, DEFAULT_ZONES, step=10) if use_barrel else None
 
 st.subheader("🔢 混合原料設定（總和需為100%）")
 blend_dict = {}
@@ -39,35 +37,16 @@ for mat in material_options:
         blend_dict[mat] = ratio
         total_ratio += ratio
 
-def simulate(temp, rpm, moisture, fat, screw_diameter, screw_length, feed_rate, die_diameter, blend_dict):
-    flavor_profiles = get_flavor_profiles()
-    total = sum(blend_dict.values())
-    expansion, crispness, stickiness = 0, 0, 0
-    flavor_counts = {}
-    for mat, ratio in blend_dict.items():
-        weight = ratio / total
-        profile = flavor_profiles[mat]
-        expansion += profile["expansion"] * weight
-        crispness += profile["crisp"] * weight
-        stickiness += (10 - profile["crisp"]) * weight
-        flavor_counts[profile["flavor"]] = flavor_counts.get(profile["flavor"], 0) + round(weight * 100)
-    aw = round(0.65 + 0.01 * (moisture - 15) - 0.005 * fat, 2)
-    density = round(0.2 + 0.005 * (100 - expansion * 50), 2)
-    pressure = round(0.1 * rpm * moisture / screw_diameter, 2)
-    energy = round((temp * rpm * (1 + fat / 10)) / (100000 + feed_rate * 100), 3)
-    return {
-        "膨發指數": round(expansion, 2),
-        "酥脆度": round(crispness, 2),
-        "水活性": aw,
-        "黏性": round(stickiness, 2),
-        "體積密度": density,
-        "桶內壓力 (bar)": pressure,
-        "預估能耗 (kWh/kg)": energy
-    }, flavor_counts
-
 if total_ratio == 100:
     if st.button("🚀 執行模擬"):
-        results, flavors = simulate(temp, rpm, moisture, fat, screw_diameter, screw_length, feed_rate, die_diameter, blend_dict)
+        with timed("simulate.v35"):
+            results, flavors = get_cache().get_or_compute(
+                make_key(
+                    MODEL_VERSIONS["v35"], temp, rpm, moisture, fat,
+                    screw_diameter, screw_length, feed_rate, die_diameter, blend=blend_dict,
+                ),
+                lambda: simulate_v35(temp, rpm, moisture, fat, screw_diameter, screw_length, feed_rate, die_diameter, blend_dict),
+            )
         st.subheader("📊 模擬結果")
         for k, v in results.items():
             st.write(f"{k}：{v}")
@@ -87,3 +66,116 @@ if total_ratio == 100:
         st.write("綜合風味組成：", "、".join([f"{k}（{v}%）" for k, v in flavors.items()]))
 else:
     st.warning(f"⚠️ 原料總比例需為 100%，目前為 {total_ratio}%。")
+
+# --------- 軸向分區模型 ---------
+if use_barrel and total_ratio == 100:
+    st.subheader("🔥 軸向分區模型")
+    with timed("simulate.barrel"):
+        barrel = get_cache().get_or_compute(
+            make_key(
+                BARREL_VERSION, temp, rpm, moisture, fat, screw_diameter, screw_length,
+                feed_rate, die_diameter, barrel_zones, blend=blend_dict,
+            ),
+            lambda: simulate_barrel(
+                temp, rpm, moisture, fat, screw_diameter, screw_length, feed_rate, die_diameter, blend_dict,
+                zones=barrel_zones,
+            ),
+        )
+    st.caption(f"螺桿長度切成 {barrel_zones} 段，熔體狀態從進料口逐段推進到模口；後 {METERING_FRACTION:.0%} 為完全填充的計量 / 捏合段。")
+    st.dataframe(barrel.exit_frame(), hide_index=True)
+    profile = barrel.profile_frame()
+    for column in ("熔體溫度 (°C)", "壓力 (bar)", "水分 (%)"):
+        st.write(f"**{column}**")
+        st.line_chart(profile[column])
+    with st.expander("其他分布（黏度、填充度、滯留時間、比機械能）"):
+        for column in ("黏度 (Pa·s)", "填充度", "滯留時間 (s)", "比機械能 (kJ/kg)"):
+            st.write(f"**{column}**")
+            st.line_chart(profile[column])
+
+# --------- 參數掃描（實驗設計） ---------
+# 掃描設定與結果檢視為 fragment：調整掃描範圍、切換熱圖軸時只重新執行這個區塊
+@fragment("v35_sweep")
+def sweep_section(current, blend_dict, total_ratio, barrel_zones):
+    st.subheader("🧪 參數掃描與熱圖")
+    sweep_params = st.multiselect(
+        "掃描參數（未選的參數固定為側邊欄目前的值）",
+        list(SWEEP_PARAMETERS),
+        default=["temp", "rpm"],
+        format_func=lambda p: SWEEP_PARAMETERS[p][0],
+    )
+    ranges = {}
+    for p in sweep_params:
+        label, lo, hi, _ = SWEEP_PARAMETERS[p]
+        c1, c2 = st.columns([3, 1])
+        start, stop = c1.slider(f"{label} 範圍", lo, hi, (lo, hi))
+        step = c2.number_input(f"{label} 間距", min_value=1, max_value=max(hi - lo, 1), value=max((hi - lo) // 20, 1))
+        ranges[p] = (start, stop, step)
+    design = st.radio("設計方式", ["全因子", "拉丁超立方"], horizontal=True)
+    n_samples = st.number_input("拉丁超立方樣本數", min_value=100, max_value=5000000, value=100000, step=10000) if design == "拉丁超立方" else None
+    sweep_barrel = barrel_zones is not None and st.checkbox(f"同時以分區模型（{barrel_zones} 段）計算每個掃描點的模口出口結果")
+    # 有預先計算的查表（python -m extrusion_core.surrogate build --model barrel --zones N）時可改用內插
+    table = get_surrogate("barrel", barrel_zones) if sweep_barrel else None
+    use_table = table is not None and st.checkbox("分區結果改用預先計算的查表（內插，較快，有內插誤差）")
+
+    if len(sweep_params) < 2:
+        st.info("請至少選擇兩個掃描參數以繪製熱圖。")
+    elif total_ratio != 100:
+        st.warning(f"⚠️ 原料總比例需為 100%，目前為 {total_ratio}%")
+    elif st.button("🧪 執行掃描"):
+        fixed = {p: v for p, v in current.items() if p not in ranges}
+        with timed("sweep"):
+            zones = barrel_zones if sweep_barrel else None
+            surrogate = table if use_table else None
+            try:
+                if design == "全因子":
+                    st.session_state["sweep"] = full_factorial(ranges, blend_dict, fixed=fixed, barrel_zones=zones,
+                                                               surrogate=surrogate)
+                else:
+                    st.session_state["sweep"] = latin_hypercube(ranges, blend_dict, int(n_samples), fixed=fixed,
+                                                                barrel_zones=zones, surrogate=surrogate)
+            except ValueError as e:
+                # 查表範圍外或與建表時固定的參數不符
+                st.error(f"⚠️ {e}")
+
+    sweep = st.session_state.get("sweep")
+    if sweep is not None:
+        st.caption(f"共 {sweep.size:,} 個模擬點")
+        c1, c2, c3 = st.columns(3)
+        output = c1.selectbox("輸出指標", list(sweep.outputs), index=5)
+        x = c2.selectbox("X 軸", sweep.params, index=0, format_func=lambda p: SWEEP_PARAMETERS[p][0])
+        y = c3.selectbox("Y 軸", sweep.params, index=1, format_func=lambda p: SWEEP_PARAMETERS[p][0])
+        at = {}
+        if sweep.design == "factorial":
+            for p in sweep.params:
+                if p not in (x, y):
+                    at[p] = st.select_slider(f"{SWEEP_PARAMETERS[p][0]} 切片", options=sweep.axes[p].tolist())
+        if x == y:
+            st.info("X 軸與 Y 軸請選擇不同參數。")
+        else:
+            xs, ys, plane = sweep.grid(output, x, y, **at)
+            st.image(heatmap_png(xs, ys, plane, SWEEP_PARAMETERS[x][0], SWEEP_PARAMETERS[y][0], output))
+
+
+current = {
+    "temp": temp, "rpm": rpm, "moisture": moisture, "fat": fat,
+    "screw_diameter": screw_diameter, "screw_length": screw_length,
+    "feed_rate": feed_rate, "die_diameter": die_diameter,
+}
+sweep_section(current, blend_dict, total_ratio, barrel_zones)
+
+# --------- 敏感度分析 ---------
+st.subheader("🌪️ 敏感度分析")
+st.caption("哪個參數對輸出影響最大：目前操作點附近的龍捲風圖與導數，以及整個滑桿範圍內的 Sobol 指數。")
+if total_ratio == 100:
+    sensitivity_panel("v35_sens", "v35", current, blend_dict)
+else:
+    st.warning(f"⚠️ 原料總比例需為 100%，目前為 {total_ratio}%")
+
+# --------- 快取統計 ---------
+cache_stats = get_cache().stats()
+st.sidebar.caption(
+    f"🗄️ 結果快取：命中 {cache_stats['hits']}／未命中 {cache_stats['misses']}"
+    f"（{cache_stats['entries']} 筆，{cache_stats['mb']:.2f} MB）"
+)
+
+metrics_panel(rerun_started)
@@ -1,22 +1,17 @@
 
 import streamlit as st
-import pandas as pd
-import matplotlib.pyplot as plt
+
+from extrusion_core import MATERIALS, MODEL_VERSIONS, get_cache, make_key, simulate_v35
+from extrusion_core.metrics import timed
+from extrusion_core.neighbors import RunHistoryIndex
+from extrusion_core.session import MAX_PAIRWISE, RunHistory
+from extrusion_core.ui import begin_rerun, fragment, metrics_panel, similar_runs_panel
 
 st.set_page_config(page_title="雙螺桿擠壓模擬器 v3.5", layout="centered")
+rerun_started = begin_rerun()
 st.title("🛠️ 雙螺桿擠壓模擬器 v3.5（含紀錄與比較功能）")
 
-def get_flavor_profiles():
-    return {
-        "玉米粉": {"expansion": 2.0, "crisp": 6.0, "flavor": "甜香"},
-        "小麥粉": {"expansion": 1.8, "crisp": 5.5, "flavor": "穀香"},
-        "裸麥粉": {"expansion": 1.5, "crisp": 5.0, "flavor": "堅果風"},
-        "高蛋白粉": {"expansion": 1.2, "crisp": 3.5, "flavor": "麥皮香"},
-        "馬鈴薯澱粉": {"expansion": 2.2, "crisp": 4.5, "flavor": "黏稠"},
-        "全麥粉": {"expansion": 1.3, "crisp": 4.2, "flavor": "纖維感"}
-    }
-
-material_options = list(get_flavor_profiles().keys())
+material_options = list(MATERIALS)
 
 st.sidebar.header("參數設定")
 temp = st.sidebar.slider("筒溫 (°C)", 60, 180, 140)
@@ -37,46 +32,33 @@ for mat in material_options:
         blend_dict[mat] = ratio
         total_ratio += ratio
 
-def simulate(temp, rpm, moisture, fat, screw_diameter, screw_length, feed_rate, die_diameter, blend_dict):
-    profiles = get_flavor_profiles()
-    total = sum(blend_dict.values())
-    expansion = crisp = sticky = 0
-    flavor_counts = {}
-    for mat, ratio in blend_dict.items():
-        w = ratio / total
-        p = profiles[mat]
-        expansion += p["expansion"] * w
-        crisp += p["crisp"] * w
-        sticky += (10 - p["crisp"]) * w
-        flavor_counts[p["flavor"]] = flavor_counts.get(p["flavor"], 0) + round(w * 100)
-    aw = round(0.65 + 0.01 * (moisture - 15) - 0.005 * fat, 2)
-    density = round(0.2 + 0.005 * (100 - expansion * 50), 2)
-    pressure = round(0.1 * rpm * moisture / screw_diameter, 2)
-    energy = round((temp * rpm * (1 + fat / 10)) / (100000 + feed_rate * 100), 3)
-    return {
-        "膨發指數": round(expansion, 2),
-        "酥脆度": round(crisp, 2),
-        "水活性": aw,
-        "黏性": round(sticky, 2),
-        "體積密度": density,
-        "桶內壓力 (bar)": pressure,
-        "預估能耗 (kWh/kg)": energy
-    }, flavor_counts
-
+# --------- 本次工作階段的紀錄（環狀緩衝區，超過上限的舊紀錄寫入暫存檔） ---------
+PARAM_FIELDS = ("筒溫", "轉速", "水", "油脂", "螺桿直徑", "螺桿長度", "喂料速率", "模口")
+RESULT_FIELDS = ("膨發指數", "酥脆度", "水活性", "黏性", "體積密度", "桶內壓力 (bar)", "預估能耗 (kWh/kg)")
+history_cap = st.sidebar.number_input("紀錄保留筆數（更早的寫入暫存檔）", min_value=10, max_value=100000, value=500, step=50)
 if "history" not in st.session_state:
-    st.session_state["history"] = []
+    st.session_state["history"] = RunHistory(PARAM_FIELDS + RESULT_FIELDS, capacity=history_cap)
+history = st.session_state["history"]
+history.set_capacity(history_cap)
 
 if total_ratio == 100:
     if st.button("🚀 執行模擬"):
-        results, flavors = simulate(temp, rpm, moisture, fat, screw_diameter, screw_length, feed_rate, die_diameter, blend_dict)
+        with timed("simulate.v35"):
+            results, flavors = get_cache().get_or_compute(
+                make_key(
+                    MODEL_VERSIONS["v35"], temp, rpm, moisture, fat,
+                    screw_diameter, screw_length, feed_rate, die_diameter, blend=blend_dict,
+                ),
+                lambda: simulate_v35(temp, rpm, moisture, fat, screw_diameter, screw_length, feed_rate, die_diameter, blend_dict),
+            )
         record = {
             "筒溫": temp, "轉速": rpm, "水": moisture, "油脂": fat,
             "螺桿直徑": screw_diameter, "螺桿長度": screw_length,
             "喂料速率": feed_rate, "模口": die_diameter, **results
         }
-        st.session_state["history"].append(record)
+        run_id = history.append(record)
 
-        st.subheader("📊 模擬結果")
+        st.subheader(f"📊 模擬結果（第 {run_id} 筆）")
         for k, v in results.items():
             st.write(f"{k}：{v}")
 
@@ -94,18 +76,64 @@ if total_ratio == 100:
         st.subheader("🎨 風味描述")
         st.write("綜合風味組成：", "、".join([f"{k}（{v}%）" for k, v in flavors.items()]))
 
-        if len(st.session_state["history"]) > 1:
+        if len(history) > 1:
             st.subheader("📈 差異比較（與上一筆）")
-            prev, curr = st.session_state["history"][-2], st.session_state["history"][-1]
-            for key in results.keys():
-                diff = round(curr[key] - prev[key], 3)
+            diffs = history.compare(RESULT_FIELDS, baseline=run_id - 1, runs=[run_id]).iloc[0]
+            for key, diff in diffs.items():
                 symbol = "⬆️" if diff > 0 else "⬇️" if diff < 0 else "⏺"
                 st.write(f"{key}：{symbol} 差異 {diff:+}")
-
-        st.subheader("📋 模擬紀錄")
-        df = pd.DataFrame(st.session_state["history"])
-        st.dataframe(df)
-
-        st.download_button("⬇️ 下載所有紀錄（CSV）", df.to_csv(index=False).encode("utf-8"), file_name="extrusion_simulation_log.csv")
 else:
     st.warning(f"⚠️ 原料總比例需為 100%，目前為 {total_ratio}%。")
+
+if len(history):
+    st.subheader("📋 模擬紀錄")
+    st.dataframe(history.frame())
+    if history.spilled:
+        st.caption(f"畫面顯示最近 {len(history):,} 筆，更早的 {history.spilled:,} 筆已寫入暫存檔，下載時一併匯出。")
+    # CSV（含暫存檔中的舊紀錄）在按下下載時才產生
+    st.download_button("⬇️ 下載所有紀錄（CSV）", history.to_csv, file_name="extrusion_simulation_log.csv")
+
+
+# 比較區塊為 fragment：切換基準、比較對象時只重新執行這個區塊
+@fragment("v35_compare")
+def compare_section(history):
+    with st.expander("🔀 多筆比較"):
+        ids = history.run_ids().tolist()
+        mode = st.radio("比較方式", ["與基準比較", "全部兩兩比較"], horizontal=True)
+        if mode == "與基準比較":
+            baseline = st.selectbox("基準（編號）", ids, index=len(ids) - 1)
+            picked = st.multiselect("比較對象（留空表示全部）", ids)
+            st.dataframe(history.compare(RESULT_FIELDS, baseline, runs=picked or None))
+        else:
+            metric = st.selectbox("指標", RESULT_FIELDS)
+            picked = st.multiselect(f"紀錄（留空表示最近 {MAX_PAIRWISE} 筆）", ids, max_selections=MAX_PAIRWISE)
+            if not picked and len(ids) > MAX_PAIRWISE:
+                st.warning(f"紀錄共 {len(ids):,} 筆，兩兩比較只列出最近 {MAX_PAIRWISE} 筆。")
+            st.caption("第 i 列第 j 欄 = 第 i 筆 − 第 j 筆")
+            st.dataframe(history.pairwise(metric, runs=picked or ids[-MAX_PAIRWISE:]))
+
+
+if len(history) > 1:
+    compare_section(history)
+
+# --------- 相似的歷史紀錄（最近鄰索引，每次只加入新的紀錄） ---------
+if "history_index" not in st.session_state:
+    st.session_state["history_index"] = RunHistoryIndex(history.columns)
+history_index = st.session_state["history_index"]
+history_index.sync(history)
+if len(history_index):
+    with st.expander("🧭 相似的歷史紀錄"):
+        current = {
+            "temp": temp, "rpm": rpm, "moisture": moisture, "fat": fat, "screw_diameter": screw_diameter,
+            "screw_length": screw_length, "feed_rate": feed_rate, "die_diameter": die_diameter,
+        }
+        similar_runs_panel("v35_similar", history_index, current)
+
+# --------- 快取統計 ---------
+cache_stats = get_cache().stats()
+st.sidebar.caption(
+    f"🗄️ 結果快取：命中 {cache_stats['hits']}／未命中 {cache_stats['misses']}"
+    f"（{cache_stats['entries']} 筆，{cache_stats['mb']:.2f} MB）"
+)
+
+metrics_panel(rerun_started)
@@ -0,0 +1,148 @@
+"""各 App 原本的逐筆函數（原料表直接寫在這裡，不依賴 extrusion_core），作為對照的基準。
+
+原本的函數依 blend_dict 的順序累加，整批版本依 MATERIALS 順序，所以 make_cases
+產生的配方都依 MATERIALS 順序列出原料。
+"""
+
+import numpy as np
+
+from extrusion_core.materials import MATERIALS, blend_vector
+
+V2_PROFILES = {
+    "玉米粉": (2.0, 6.0, "甜香"),
+    "小麥粉": (1.8, 5.5, "穀香"),
+    "裸麥粉": (1.5, 5.0, "堅果風"),
+    "高蛋白粉": (1.2, 4.0, "豆粉味"),
+    "馬鈴薯澱粉": (2.2, 6.5, "脆口澱粉香"),
+    "全麥粉": (1.6, 5.2, "麩皮香、纖維感"),
+}
+V35_PROFILES = {
+    "玉米粉": (2.0, 6.0, "甜香"),
+    "小麥粉": (1.8, 5.5, "穀香"),
+    "裸麥粉": (1.5, 5.0, "堅果風"),
+    "高蛋白粉": (1.2, 3.5, "麥皮香"),
+    "馬鈴薯澱粉": (2.2, 4.5, "黏稠"),
+    "全麥粉": (1.3, 4.2, "纖維感"),
+}
+
+
+def reference_v2(temp, rpm, moisture, fat, blend_dict):
+    total_ratio = sum(blend_dict.values())
+    expansion = 0
+    crisp = 0
+    flavors = []
+    for mat, ratio in blend_dict.items():
+        weight = ratio / total_ratio
+        expansion += V2_PROFILES[mat][0] * weight
+        crisp += V2_PROFILES[mat][1] * weight
+        flavors.append((V2_PROFILES[mat][2], weight))
+    expansion = round(expansion + (temp - 100) * 0.005 - moisture * 0.01 + fat * 0.01, 2)
+    crisp = round(crisp + (rpm - 300) * 0.005 - fat * 0.1 + moisture * 0.05, 2)
+    flavor_desc = "、".join([f"{f[0]}（{int(f[1]*100)}%）" for f in flavors])
+    return {
+        "膨發指數": expansion,
+        "酥脆度": crisp,
+        "水活性": round(0.6 + moisture * 0.01 - temp * 0.001, 2),
+        "黏性": round(1 + fat * 0.1 + moisture * 0.1 - rpm * 0.002, 2),
+        "外觀": "膨鬆偏亮" if expansion > 2 else "偏密實",
+        "色澤": "金黃色" if temp >= 140 else "淺黃",
+        "風味描述": f"綜合風味：{flavor_desc}",
+    }
+
+
+def reference_energy(temp, rpm, moisture, fat, screw_diameter_mm, screw_length_mm):
+    energy = (
+        0.12
+        + (temp - 100) * 0.0008
+        + (rpm - 300) * 0.0005
+        + screw_length_mm / 1000 * 0.05
+        - moisture * 0.002
+        - fat * 0.003
+        + (screw_diameter_mm / 100) * 0.02
+    )
+    return round(max(energy, 0.05), 3)
+
+
+def reference_v35(temp, rpm, moisture, fat, screw_diameter, feed_rate, blend_dict):
+    total = sum(blend_dict.values())
+    expansion, crispness, stickiness = 0, 0, 0
+    flavor_counts = {}
+    for mat, ratio in blend_dict.items():
+        weight = ratio / total
+        profile = V35_PROFILES[mat]
+        expansion += profile[0] * weight
+        crispness += profile[1] * weight
+        stickiness += (10 - profile[1]) * weight
+        flavor_counts[profile[2]] = flavor_counts.get(profile[2], 0) + round(weight * 100)
+    return {
+        "膨發指數": round(expansion, 2),
+        "酥脆度": round(crispness, 2),
+        "水活性": round(0.65 + 0.01 * (moisture - 15) - 0.005 * fat, 2),
+        "黏性": round(stickiness, 2),
+        "體積密度": round(0.2 + 0.005 * (100 - expansion * 50), 2),
+        "桶內壓力 (bar)": round(0.1 * rpm * moisture / screw_diameter, 2),
+        "預估能耗 (kWh/kg)": round((temp * rpm * (1 + fat / 10)) / (100000 + feed_rate * 100), 3),
+    }, flavor_counts
+
+
+def reference_v35s(temp, rpm, moisture, fat, feed_rate, blend_dict):
+    total = sum(blend_dict.values())
+    expansion = crisp = 0
+    flavors = []
+    for mat, ratio in blend_dict.items():
+        w = ratio / total
+        expansion += V2_PROFILES[mat][0] * w
+        crisp += V2_PROFILES[mat][1] * w
+        flavors.append((V2_PROFILES[mat][2], w))
+    return {
+        "膨發指數": round(expansion, 2),
+        "酥脆度": round(crisp, 2),
+        "水活性": round(0.6 + moisture * 0.01 - temp * 0.001, 2),
+        "黏性": round(1 + fat * 0.1 + moisture * 0.1 - rpm * 0.002, 2),
+        "體積密度": round(1.2 / (expansion + 0.1), 2),
+        "桶內壓力（bar）": round((temp * rpm * (1 - moisture / 100)) / 10000, 2),
+        "預估能耗（kWh/kg）": round((temp * rpm * feed_rate * (1 - moisture / 100)) / 10000000, 3),
+        "風味描述": "、".join([f"{f[0]}（{int(f[1]*100)}%）" for f in flavors]),
+    }
+
+
+# --------- 測試資料 ---------
+def _value(rng, low, high):
+    # 一半是 App 滑桿的整數，一半是任意小數（批次上傳的資料）
+    return int(rng.integers(low, high + 1)) if rng.random() < 0.5 else float(rng.uniform(low, high))
+
+
+def make_cases(n, seed=0):
+    """n 組亂數參數與配方（{參數: 值, "blend": {原料: 比例}}）。"""
+    rng = np.random.default_rng(seed)
+    rows = []
+    for _ in range(n):
+        used = sorted(rng.choice(len(MATERIALS), int(rng.integers(1, 7)), replace=False))
+        if rng.random() < 0.5:
+            blend = {MATERIALS[j]: int(rng.integers(1, 21)) * 5 for j in used}
+        else:
+            blend = {MATERIALS[j]: float(rng.uniform(0.1, 100)) for j in used}
+        rows.append({
+            "temp": _value(rng, 60, 180),
+            "rpm": _value(rng, 100, 600),
+            "moisture": _value(rng, 10, 25),
+            "fat": _value(rng, 0, 15),
+            "screw_diameter": _value(rng, 20, 60),
+            "screw_length": _value(rng, 500, 1500),
+            "feed_rate": _value(rng, 10, 100),
+            "die_diameter": _value(rng, 2, 10),
+            "blend": blend,
+        })
+    return rows
+
+
+def columns(cases, *names):
+    return [np.array([c[name] for c in cases], dtype=float) for name in names]
+
+
+def ratios(cases):
+    return np.vstack([blend_vector(c["blend"]) for c in cases])
+
+
+def row(outputs, i):
+    return {k: v[i].item() if isinstance(v[i], np.generic) else v[i] for k, v in outputs.items()}
@@ -0,0 +1,30 @@
+import numpy as np
+import pandas as pd
+import pytest
+from reference import columns, make_cases, ratios, reference_v2, row
+
+from extrusion_core.batch import py_round, simulate_blended_batch, simulate_blended_frame
+
+
+def test_v2_batch_matches_reference():
+    cases = make_cases(2000)
+    outputs = simulate_blended_batch(*columns(cases, "temp", "rpm", "moisture", "fat"), ratios(cases))
+    for i, c in enumerate(cases):
+        assert row(outputs, i) == reference_v2(c["temp"], c["rpm"], c["moisture"], c["fat"], c["blend"])
+
+
+def test_empty_blend_row_keeps_process_terms():
+    # 原本的逐筆函數對空配方照常回傳（只剩製程參數的項），不影響同一批的其他列
+    df = pd.DataFrame({"筒溫": [140, 150], "轉速": [300, 350], "水含量": [15, 18], "油脂含量": [5, 3],
+                       "玉米粉": [100, 0], "小麥粉": [0, np.nan]})
+    out = simulate_blended_frame(df)
+    assert len(out) == 2
+    expected = reference_v2(150, 350, 18, 3, {})
+    assert {k: out.loc[1, k] for k in expected} == expected
+    assert out.loc[0, "膨發指數"] == reference_v2(140, 300, 15, 5, {"玉米粉": 100})["膨發指數"]
+    assert np.isnan(out.loc[1, "玉米粉"])
+
+
+@pytest.mark.parametrize("value, ndigits", [(2.675, 2), (0.125, 2), (1.0005, 3), (-2.675, 2), (0.5, 0), (1.5, 0)])
+def test_py_round_matches_builtin(value, ndigits):
+    assert py_round(value, ndigits).item() == round(value, ndigits)
@@ -0,0 +1,30 @@
+import sqlite3
+import time
+
+from extrusion_core.cache import ResultCache
+
+
+def _disk(path):
+    with sqlite3.connect(path) as db:
+        return db.execute("SELECT COALESCE(SUM(size), 0), COUNT(*) FROM results").fetchone()
+
+
+def test_disk_tier_is_size_bounded(tmp_path):
+    path = str(tmp_path / "cache.db")
+    cache = ResultCache(max_mb=0.1, disk_mb=0.5, path=path)
+    blob = b"x" * 50_000
+    for i in range(40):
+        cache.put(i, blob)
+    size, count = _disk(path)
+    assert size <= 0.5 * 1024 * 1024 and count >= 8
+    # 最近寫入的項目留在磁碟，重開後仍可命中
+    assert ResultCache(max_mb=0.1, disk_mb=0.5, path=path).get(39) == blob
+
+
+def test_disk_tier_drops_expired_on_write(tmp_path):
+    path = str(tmp_path / "cache.db")
+    cache = ResultCache(ttl=0.05, path=path)
+    cache.put("old", 1)
+    time.sleep(0.1)
+    cache.put("new", 2)
+    assert _disk(path)[1] == 1
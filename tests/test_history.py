@@ -0,0 +1,26 @@
+import os
+
+import pandas as pd
+
+from extrusion_core.history import HistoryStore, migrate_csv
+
+
+def _legacy_csv(path):
+    pd.DataFrame({"筒溫": [140, 150, 160], "轉速": 300, "水": 15, "油": 5, "膨發指數": 2.1}).to_csv(path, index=False)
+    os.utime(path, (1_700_000_000, 1_700_000_000))
+
+
+def test_migrate_csv_imports_once(tmp_path):
+    csv_path, db_path = str(tmp_path / "simulation_history.csv"), str(tmp_path / "history.db")
+    _legacy_csv(csv_path)
+    first, second = HistoryStore(db_path), HistoryStore(db_path)
+    assert migrate_csv(csv_path, first) == 3
+    assert os.path.exists(csv_path + ".migrated")
+    # 另一個行程在改名前就開啟了同一個檔案：同一來源不會再匯入
+    _legacy_csv(csv_path)
+    assert migrate_csv(csv_path, second) == 0
+    # 已被改名（其他行程剛匯入完）
+    assert migrate_csv(str(tmp_path / "missing.csv"), second) == 0
+    assert len(second.query()) == 3
+    first.close()
+    second.close()
@@ -0,0 +1,15 @@
+"""memcheck 的記憶體洩漏判斷（次數縮小，完整檢查用 python -m extrusion_core.memcheck）。"""
+
+import os
+import warnings
+
+from extrusion_core import cache, memcheck
+
+
+def test_no_memory_growth_after_warmup():
+    shared, env, filters = cache.get_cache(), dict(os.environ), list(warnings.filters)
+    assert memcheck.main(["--runs", "300", "--cache-mb", "1"]) == 0
+    # 檢查用的快取、環境變數與警告過濾都不會留到之後
+    assert cache.get_cache() is shared
+    assert dict(os.environ) == env
+    assert warnings.filters == filters
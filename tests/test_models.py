@@ -0,0 +1,151 @@
+import math
+
+import numpy as np
+import pytest
+from reference import (
+    columns,
+    make_cases,
+    ratios,
+    reference_energy,
+    reference_v2,
+    reference_v35,
+    reference_v35s,
+    row,
+)
+
+from extrusion_core.batch import simulate_blended_batch
+from extrusion_core.materials import MATERIALS, blend_vector
+from extrusion_core.models import (
+    V35_FLAVORS,
+    estimate_energy,
+    estimate_energy_batch,
+    simulate_v2,
+    simulate_v3,
+    simulate_v35,
+    simulate_v35_batch,
+    simulate_v35s,
+    simulate_v35s_batch,
+    simulate_with_energy_batch,
+)
+
+N = 2000
+
+
+@pytest.fixture(scope="module")
+def cases():
+    return make_cases(N)
+
+
+# --------- 整批計算 ---------
+def test_v3_batch_matches_reference(cases):
+    outputs = simulate_with_energy_batch(
+        *columns(cases, "temp", "rpm", "moisture", "fat"), ratios(cases),
+        *columns(cases, "screw_diameter", "screw_length"),
+    )
+    for i, c in enumerate(cases):
+        expected = reference_energy(c["temp"], c["rpm"], c["moisture"], c["fat"], c["screw_diameter"],
+                                    c["screw_length"])
+        assert outputs["預估能耗（kWh/kg）"][i] == expected
+
+
+def test_v35_batch_matches_reference(cases):
+    outputs = simulate_v35_batch(
+        *columns(cases, "temp", "rpm", "moisture", "fat", "screw_diameter", "screw_length", "feed_rate",
+                  "die_diameter"),
+        ratios(cases),
+    )
+    pct = outputs.pop("風味比例")
+    for i, c in enumerate(cases):
+        expected, flavor_counts = reference_v35(c["temp"], c["rpm"], c["moisture"], c["fat"], c["screw_diameter"],
+                                                c["feed_rate"], c["blend"])
+        assert row(outputs, i) == expected
+        assert {V35_FLAVORS[j]: int(pct[i, j]) for j in np.flatnonzero(pct[i] > 0)} == {
+            k: v for k, v in flavor_counts.items() if v > 0
+        }
+
+
+def test_v35s_batch_matches_reference(cases):
+    outputs = simulate_v35s_batch(*columns(cases, "temp", "rpm", "moisture", "fat", "feed_rate"), ratios(cases))
+    for i, c in enumerate(cases):
+        assert row(outputs, i) == reference_v35s(c["temp"], c["rpm"], c["moisture"], c["fat"], c["feed_rate"],
+                                                  c["blend"])
+
+
+# --------- 單筆介面 ---------
+def test_single_runs_match_reference(cases):
+    for c in cases[:500]:
+        args = c["temp"], c["rpm"], c["moisture"], c["fat"]
+        assert simulate_v2(*args, c["blend"]) == reference_v2(*args, c["blend"])
+        assert estimate_energy(*args, c["screw_diameter"], c["screw_length"]) == reference_energy(
+            *args, c["screw_diameter"], c["screw_length"]
+        )
+        v3 = simulate_v3(*args, c["blend"], c["screw_diameter"], c["screw_length"])
+        assert v3["預估能耗（kWh/kg）"] == reference_energy(*args, c["screw_diameter"], c["screw_length"])
+        assert simulate_v35(*args, c["screw_diameter"], c["screw_length"], c["feed_rate"], c["die_diameter"],
+                            c["blend"]) == reference_v35(*args, c["screw_diameter"], c["feed_rate"], c["blend"])
+        assert simulate_v35s(*args, c["feed_rate"], c["blend"]) == reference_v35s(*args, c["feed_rate"], c["blend"])
+
+
+def test_single_run_empty_blend():
+    assert simulate_v2(140, 300, 15, 5, {"玉米粉": 0}) == reference_v2(140, 300, 15, 5, {})
+
+
+# --------- 單筆快速路徑與 1 列整批計算 ---------
+# 快速路徑是整批公式的純 Python 版本，兩邊任一邊改了公式都會在這裡不一致
+def _batch_v2(temp, rpm, moisture, fat, blend):
+    return row(simulate_blended_batch(temp, rpm, moisture, fat, blend_vector(blend)), 0)
+
+
+def _batch_energy(*args):
+    return float(estimate_energy_batch(*args))
+
+
+def _batch_v35(temp, rpm, moisture, fat, screw_diameter, screw_length, feed_rate, die_diameter, blend):
+    ratios = blend_vector(blend)
+    outputs = simulate_v35_batch(temp, rpm, moisture, fat, screw_diameter, screw_length, feed_rate, die_diameter,
+                                 ratios)
+    pct = outputs.pop("風味比例")[0]
+    return row(outputs, 0), {V35_FLAVORS[j]: int(pct[j]) for j in np.flatnonzero(ratios[0] > 0)}
+
+
+def _batch_v35s(temp, rpm, moisture, fat, feed_rate, blend):
+    return row(simulate_v35s_batch(temp, rpm, moisture, fat, feed_rate, blend_vector(blend)), 0)
+
+
+def _same(a, b):
+    if isinstance(a, (dict, tuple)):
+        if isinstance(a, dict) and list(a) != list(b):
+            return False
+        items = zip(a.values(), b.values()) if isinstance(a, dict) else zip(a, b)
+        return len(a) == len(b) and all(_same(x, y) for x, y in items)
+    if isinstance(a, float) and math.isnan(a):
+        return isinstance(b, float) and math.isnan(b)
+    return type(a) is type(b) and a == b
+
+
+def _random_param(rng):
+    # 含 0、負值與少數 NaN / inf，讓快速路徑也走到退回整批計算的分支
+    choice = rng.integers(6)
+    if choice == 0:
+        return 0
+    if choice == 1 and rng.random() < 0.1:
+        return float(rng.choice([math.nan, math.inf, -math.inf]))
+    value = float(rng.uniform(-600, 600))
+    return int(value) if choice == 2 else value
+
+
+def test_scalar_path_matches_batch():
+    rng = np.random.default_rng(1)
+    for _ in range(2000):
+        used = rng.choice(len(MATERIALS), int(rng.integers(1, 7)), replace=False)
+        blend = {MATERIALS[j]: float(rng.choice([rng.uniform(0, 100), 0, -10, rng.integers(0, 21) * 5]))
+                 for j in used}
+        p = [_random_param(rng) for _ in range(8)]
+        for single, batch, args in (
+            (simulate_v2, _batch_v2, p[:4] + [blend]),
+            (estimate_energy, _batch_energy, p[:6]),
+            (simulate_v35, _batch_v35, p + [blend]),
+            (simulate_v35s, _batch_v35s, p[:5] + [blend]),
+        ):
+            with np.errstate(all="ignore"):
+                assert _same(single(*args), batch(*args)), (single.__name__, args)
@@ -0,0 +1,37 @@
+import numpy as np
+
+from extrusion_core.batch import simulate_blended_batch
+from extrusion_core.models import simulate_v35_batch
+from extrusion_core.parallel import run_batch
+
+N = 3000
+
+
+def _assert_same(sharded, serial):
+    assert sharded.keys() == serial.keys()
+    for k in serial:
+        assert sharded[k].shape == serial[k].shape, k
+        assert (sharded[k] == serial[k]).all(), k
+
+
+def test_sharded_rows_match_serial():
+    rng = np.random.default_rng(0)
+    columns = dict(
+        temp=rng.uniform(60, 180, N), rpm=rng.uniform(100, 600, N), moisture=rng.uniform(10, 25, N),
+        fat=rng.uniform(0, 15, N), ratios=rng.integers(1, 11, (N, 6)).astype(float),
+    )
+    serial = simulate_blended_batch(**columns)
+    _assert_same(run_batch(simulate_blended_batch, N, workers=2, min_shard_rows=1000, **columns), serial)
+
+
+def test_unsharded_outputs_keep_serial_shape():
+    # 共用 1×6 配方時風味比例為 1×6，不隨分段數重複
+    rng = np.random.default_rng(1)
+    columns = dict(
+        temp=rng.uniform(60, 180, N), rpm=rng.uniform(100, 600, N), moisture=15.0, fat=5.0,
+        screw_diameter=30.0, screw_length=1000.0, feed_rate=30.0, die_diameter=5.0,
+        ratios=np.array([[50.0, 30, 0, 20, 0, 0]]),
+    )
+    serial = simulate_v35_batch(**columns)
+    assert serial["風味比例"].shape == (1, 6)
+    _assert_same(run_batch(simulate_v35_batch, N, workers=3, min_shard_rows=1000, **columns), serial)
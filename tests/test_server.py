@@ -0,0 +1,53 @@
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from extrusion_core.server import MicroBatcher, SimulationService, parse_record
+
+RECORD = {"temp": 140, "blend": {"玉米粉": 100}}
+
+
+async def _post(port, path, body):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(b"POST %s HTTP/1.1\r\nContent-Length: %d\r\nConnection: close\r\n\r\n" % (path, len(body)) + body)
+    await writer.drain()
+    data = await asyncio.wait_for(reader.read(), 10)
+    writer.close()
+    head, _, payload = data.partition(b"\r\n\r\n")
+    return int(head.split()[1]), payload
+
+
+def test_executor_failure_resolves_every_request():
+    async def main():
+        executor = ThreadPoolExecutor(1)
+        executor.shutdown()
+        batcher = MicroBatcher("v35", executor, max_wait=0.05)
+        row = parse_record("v35", RECORD)
+        results = await asyncio.wait_for(
+            asyncio.gather(*(batcher.submit(row) for _ in range(3)), return_exceptions=True), 5
+        )
+        await batcher.close()
+        return results
+
+    results = asyncio.run(main())
+    assert len(results) == 3 and all(isinstance(r, RuntimeError) for r in results)
+
+
+@pytest.mark.parametrize("path", [b"/simulate/v35", b"/bulk/v35"])
+def test_deeply_nested_json_is_bad_request(path):
+    async def main():
+        service = await SimulationService(port=0).start()
+        try:
+            return await _post(service.port, path, b"[" * 5000 + b"]" * 5000)
+        finally:
+            await service.close()
+
+    status, payload = asyncio.run(main())
+    if path.startswith(b"/bulk"):
+        # 批次請求逐行回報，標頭一律為 200
+        assert status == 200
+    else:
+        assert status == 400
+    assert "巢狀" in payload.decode("utf-8")
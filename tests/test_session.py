@@ -0,0 +1,16 @@
+import numpy as np
+import pytest
+
+from extrusion_core.session import MAX_PAIRWISE, RunHistory
+
+
+def test_pairwise_limits_runs():
+    history = RunHistory(("膨發指數",), capacity=MAX_PAIRWISE + 10)
+    for i in range(MAX_PAIRWISE + 1):
+        history.append({"膨發指數": i / 10})
+    with pytest.raises(ValueError, match="最多"):
+        history.pairwise("膨發指數")
+    ids = history.run_ids()[-3:]
+    matrix = history.pairwise("膨發指數", runs=ids)
+    assert matrix.shape == (3, 3)
+    assert np.allclose(matrix.to_numpy(), [[0, -0.1, -0.2], [0.1, 0, -0.1], [0.2, 0.1, 0]])
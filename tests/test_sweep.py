@@ -0,0 +1,22 @@
+import pytest
+
+from extrusion_core.sweep import full_factorial, latin_hypercube
+
+BLEND = {"玉米粉": 100}
+
+
+def test_factorial_grid():
+    result = full_factorial({"temp": (60, 180, 10), "rpm": (100, 600, 50)}, BLEND)
+    assert result.outputs["膨發指數"].shape == (13, 11)
+
+
+def test_point_limits():
+    ranges = {p: (0, 100, 1) for p in ("temp", "rpm", "moisture", "fat")}
+    with pytest.raises(ValueError, match="上限"):
+        full_factorial(ranges, BLEND)
+    # 約 1.2 × 10⁶ 點：未超過公式的上限，但超過分區模型的上限
+    ranges = {"temp": (60, 180, 0.1), "rpm": (100, 600, 1), "moisture": (10, 11, 1)}
+    with pytest.raises(ValueError, match="分區模型"):
+        full_factorial(ranges, BLEND, barrel_zones=20)
+    with pytest.raises(ValueError, match="分區模型"):
+        latin_hypercube({"temp": (60, 180, 0), "rpm": (100, 600, 0)}, BLEND, 2_000_000, barrel_zones=20)
@@ -0,0 +1,31 @@
+import numpy as np
+import pytest
+
+from extrusion_core.batch import py_round
+from extrusion_core.models import MODELS
+from extrusion_core.uncertainty import monte_carlo
+
+PARAMS = {
+    "v2": dict(temp=140, rpm=300, moisture=15, fat=5),
+    "v3": dict(temp=140, rpm=300, moisture=15, fat=5, screw_diameter=30, screw_length=1000),
+    "v35": dict(temp=140, rpm=300, moisture=15, fat=5, screw_diameter=30, screw_length=1000, feed_rate=30,
+                die_diameter=5),
+}
+
+
+@pytest.mark.parametrize("model", PARAMS)
+def test_samples_are_not_rounded(model):
+    result = monte_carlo(model, PARAMS[model], {"玉米粉": 60, "裸麥粉": 40}, n=2000, seed=0)
+    # 水活性的標準差約 0.005，四捨五入到 2 位小數時只剩少數幾個值
+    assert len(np.unique(result.values["水活性"])) > 1000
+
+
+@pytest.mark.parametrize("model", PARAMS)
+def test_unrounded_batch_rounds_to_default(model):
+    ratios = np.array([[60.0, 0, 40, 0, 0, 0]])
+    temp = np.linspace(60, 180, 50)
+    params = dict(PARAMS[model], temp=temp)
+    rounded = MODELS[model]["batch"](ratios=ratios, **params)
+    raw = MODELS[model]["batch"](ratios=ratios, rounding=False, **params)
+    for k in ("膨發指數", "酥脆度", "水活性", "黏性"):
+        assert (py_round(raw[k]) == rounded[k]).all(), k